@@ -0,0 +1,81 @@
+"""
+compare binning of pd.cut + pivot_table with the integer index histogram
+
+    $ python benchmarks/bench_heatmap.py --rows 1000000 10000000 50000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from iosnoop.histogram import Histogram2D, LinearAxis  # noqa: E402
+
+X_INTERVAL = 1.0
+Y_INTERVAL = 50.0
+
+
+def make_columns(rows, seed=0):
+    rand = np.random.RandomState(seed)
+    diff = np.cumsum(rand.exponential(0.001, rows))
+    latency = rand.lognormal(2.0, 0.8, rows)
+    return diff, latency
+
+
+def bin_pivot_table(diff, latency):
+    df = pd.DataFrame({'diff': diff, 'latency': latency})
+    y_bins = pd.interval_range(
+        start=0.0, end=latency.max() + 2 * Y_INTERVAL, freq=Y_INTERVAL,
+        closed='left')
+    x_bins = pd.interval_range(
+        start=0.0, end=diff.max() + X_INTERVAL, freq=X_INTERVAL,
+        closed='left')
+    df['y'] = pd.cut(df['latency'], bins=y_bins, right=False)
+    df['x'] = pd.cut(df['diff'], bins=x_bins, right=False)
+    return df.pivot_table(
+        index='y', columns='x', values='latency', aggfunc='count',
+        observed=False,
+    ).reindex(index=y_bins, columns=x_bins)
+
+
+def bin_histogram(diff, latency):
+    histogram = Histogram2D(
+        LinearAxis(X_INTERVAL, diff.max(), extra=1),
+        LinearAxis(Y_INTERVAL, latency.max(), extra=2),
+    )
+    histogram.add(diff, latency)
+    return histogram.to_frame()
+
+
+def measure(name, func, diff, latency):
+    start = time.perf_counter()
+    func(diff, latency)
+    elapsed = time.perf_counter() - start
+    print('%-12s %10d rows %8.3f sec %12.0f rows/sec' % (
+        name, len(diff), elapsed, len(diff) / elapsed))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--rows', type=int, nargs='+', default=[1000000, 10000000, 50000000])
+    parser.add_argument(
+        '--skip-pivot', action='store_true',
+        help='measure only the histogram, pivot_table needs a lot of memory')
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        diff, latency = make_columns(rows)
+        elapsed = measure('histogram', bin_histogram, diff, latency)
+        if not args.skip_pivot:
+            base = measure('pivot_table', bin_pivot_table, diff, latency)
+            print('%-12s %10d rows %8.1fx' % ('speedup', rows, base / elapsed))
+
+
+if __name__ == '__main__':
+    main()
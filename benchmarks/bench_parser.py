@@ -0,0 +1,89 @@
+"""
+compare the dict based parser with the columnar parser, and iterating dicts
+of parse() with records of parse_batches() in a python loop
+
+    $ python benchmarks/bench_parser.py --rows 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from generate_trace import write_trace  # noqa: E402
+from iosnoop.consts import IO_LATENCY  # noqa: E402
+from iosnoop.parser import Parser  # noqa: E402
+
+
+def make_args(data):
+    return argparse.Namespace(
+        basedate=None, cache=False, data=data, jobs=1, columns=[],
+        io_commands=[],
+        io_device=None, io_pids=[], io_types=[], reorder=None, since=None,
+        until=None,
+    )
+
+
+def iterate_dict(args):
+    total, row = 0.0, None
+    for row in Parser(args).parse():
+        total += row[IO_LATENCY]
+    return row
+
+
+def iterate_records(args):
+    total, row = 0.0, None
+    for batch in Parser(args).parse_batches():
+        for row in batch:
+            total += row.LATms
+    return row
+
+
+def parse_dict(args):
+    parser = Parser(args)
+    rows = [row for row in parser.parse()]
+    return pd.DataFrame(rows, columns=parser.columns)
+
+
+def parse_frame(args):
+    return Parser(args).parse_frame()
+
+
+def measure(name, func, args, rows):
+    start = time.perf_counter()
+    df = func(args)
+    elapsed = time.perf_counter() - start
+    print('%-8s %8.3f sec %12.0f rows/sec %10.1f MiB' % (
+        name, elapsed, rows / elapsed,
+        df.memory_usage(deep=True).sum() / (1 << 20),
+    ))
+
+
+def measure_loop(name, func, args, rows):
+    start = time.perf_counter()
+    row = func(args)
+    elapsed = time.perf_counter() - start
+    print('%-8s %8.3f sec %12.0f rows/sec %10d bytes/row' % (
+        name, elapsed, rows / elapsed, sys.getsizeof(row)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'iosnoop.log')
+        write_trace(path, args.rows)
+        measure('dict', parse_dict, make_args(path), args.rows)
+        measure('columnar', parse_frame, make_args(path), args.rows)
+        measure_loop('dict', iterate_dict, make_args(path), args.rows)
+        measure_loop('record', iterate_records, make_args(path), args.rows)
+
+
+if __name__ == '__main__':
+    main()
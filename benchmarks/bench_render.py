@@ -0,0 +1,80 @@
+"""
+compare rendering a heatmap as one image with seaborn which draws a cell
+and a tick label per bin
+
+    $ python benchmarks/bench_render.py --columns 10000 --rows 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import matplotlib
+import numpy as np
+import pandas as pd
+
+matplotlib.use('Agg')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from iosnoop import main as cli  # noqa: E402
+from iosnoop.consts import IO_LATENCY, START_TIME_STAMP_DIFF  # noqa: E402
+from iosnoop.consts import RENDERERS, RENDERER_IMAGE  # noqa: E402
+from iosnoop.heatmap import HeatMap  # noqa: E402
+
+
+def make_frame(columns, rows, ios, seed=0):
+    """makes rows which fill a grid of columns seconds x rows millisecond"""
+    rand = np.random.RandomState(seed)
+    diff = np.sort(rand.uniform(0, columns, ios))
+    latency = np.minimum(rand.lognormal(np.log(rows / 8), 0.8, ios), rows)
+    return pd.DataFrame({START_TIME_STAMP_DIFF: diff, IO_LATENCY: latency})
+
+
+def make_args(renderer, output):
+    sys.argv = [
+        'iosnoop-cli', '--data', '-', 'plot', '--renderer', renderer,
+        '--x-interval', '1', '--y-interval', '1', '--fig-output', output,
+    ]
+    return cli.parse_argument()
+
+
+def measure(renderer, df):
+    with tempfile.TemporaryDirectory() as tmp:
+        args = make_args(renderer, os.path.join(tmp, 'heatmap.png'))
+        start = time.perf_counter()
+        heatmap = HeatMap(args, df)
+        heatmap.render()
+        elapsed = time.perf_counter() - start
+    rows, columns = heatmap.histogram.shape
+    print('%-8s %6d x %-4d bins %8.3f sec' % (
+        renderer, columns, rows, elapsed))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--columns', type=int, default=10000,
+        help='set number of x bins (seconds)')
+    parser.add_argument(
+        '--rows', type=int, default=200,
+        help='set number of y bins (millisecond)')
+    parser.add_argument('--ios', type=int, default=1000000)
+    parser.add_argument(
+        '--renderers', nargs='+', choices=RENDERERS, default=RENDERERS)
+    args = parser.parse_args()
+
+    df = make_frame(args.columns, args.rows, args.ios)
+    results = {}
+    for renderer in args.renderers:
+        results[renderer] = measure(renderer, df)
+    if RENDERER_IMAGE in results and len(results) > 1:
+        for renderer, elapsed in results.items():
+            if renderer != RENDERER_IMAGE:
+                print('%-8s %8.1fx' % (
+                    'speedup', elapsed / results[RENDERER_IMAGE]))
+
+
+if __name__ == '__main__':
+    main()
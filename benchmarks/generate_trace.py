@@ -0,0 +1,168 @@
+"""
+generate a synthetic iosnoop -ts output deterministically
+
+    $ python benchmarks/generate_trace.py --rows 1000000 --output iosnoop.log
+
+rows are printed in order of completion like iosnoop, so that STARTs of
+concurrent i/o are out of order
+"""
+import argparse
+import sys
+
+import numpy as np
+
+HEADER = ('STARTs          ENDs            COMM         PID    TYPE DEV'
+          '      BLOCK        BYTES     LATms\n')
+DESCRIPTION = 'Tracing block I/O. Ctrl-C to end.\n'
+
+COMMANDS = ['main:8674', '<...>:8625', '<idle>:0', 'jbd2/sdk1-28:2811']
+DEVICES = ['8,160']
+TYPES = ['WS']
+
+LATENCY_LOGNORMAL = 'lognormal'
+LATENCY_EXPONENTIAL = 'exponential'
+LATENCY_PARETO = 'pareto'
+LATENCIES = [LATENCY_LOGNORMAL, LATENCY_EXPONENTIAL, LATENCY_PARETO]
+
+ORDER_COMPLETION = 'completion'
+ORDER_START = 'start'
+ORDERS = [ORDER_COMPLETION, ORDER_START]
+
+_BLOCK_ROWS = 64 * 1024
+_FIRST_START = 14284781.192419
+
+
+def _parse_command(s):
+    name, pid = s.rsplit(':', 1)
+    return name, int(pid)
+
+
+def make_latency(rand, distribution, median, sigma, size):
+    """returns latency in millisecond"""
+    if distribution == LATENCY_EXPONENTIAL:
+        return rand.exponential(median / np.log(2), size)
+    if distribution == LATENCY_PARETO:
+        # heavy tail with the minimum at a half of median
+        return median / 2 * (1 + rand.pareto(sigma, size)) * 2 ** (1 / sigma)
+    return rand.lognormal(np.log(median), sigma, size)
+
+
+class TraceGenerator:
+
+    def __init__(self, rows, seed=0, commands=COMMANDS, devices=DEVICES,
+                 types=TYPES, iops=1000.0, latency=LATENCY_LOGNORMAL,
+                 latency_ms=7.0, latency_sigma=0.8, order=ORDER_COMPLETION):
+        self.rows = rows
+        self.rand = np.random.RandomState(seed)
+        self.commands = [_parse_command(i) for i in commands]
+        self.devices = devices
+        self.types = types
+        self.iops = iops
+        self.latency = latency
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.order = order
+
+    def _block(self, start, size):
+        rand = self.rand
+        starts = start + np.cumsum(rand.exponential(1 / self.iops, size))
+        latency = np.round(make_latency(
+            rand, self.latency, self.latency_ms, self.latency_sigma, size), 2)
+        latency = np.maximum(latency, 0.01)
+        ends = starts + latency / 1000
+        commands = rand.randint(len(self.commands), size=size)
+        devices = rand.randint(len(self.devices), size=size)
+        types = rand.randint(len(self.types), size=size)
+        blocks = rand.randint(0, 1 << 32, size=size, dtype=np.int64)
+        sizes = 4096 * rand.geometric(0.5, size)
+        return starts, ends, commands, devices, types, blocks, sizes, latency
+
+    def _format(self, columns, index):
+        starts, ends, commands, devices, types, blocks, sizes, latency = \
+            columns
+        lines = []
+        for i in index.tolist():
+            command, pid = self.commands[commands[i]]
+            lines.append(
+                '%.6f %.6f %-12s %-6d %-4s %-8s %-12d %-10d %.2f\n' % (
+                    starts[i], ends[i], command, pid,
+                    self.types[types[i]], self.devices[devices[i]],
+                    blocks[i], sizes[i], latency[i],
+                ))
+        return lines
+
+    def lines(self):
+        yield DESCRIPTION
+        yield HEADER
+        start = _FIRST_START
+        pending = None
+        remaining = self.rows
+        while remaining > 0 or pending is not None:
+            size = min(_BLOCK_ROWS, remaining)
+            remaining -= size
+            block = self._block(start, size) if size > 0 else None
+            if block is not None:
+                start = block[0][-1]
+            if pending is not None:
+                block = pending if block is None else tuple(
+                    np.concatenate([p, b]) for p, b in zip(pending, block))
+            pending = None
+
+            if self.order == ORDER_START:
+                index = np.arange(len(block[0]))
+            else:
+                index = np.argsort(block[1], kind='stable')
+                if remaining > 0:
+                    # rows completed after the last start may be printed
+                    # after rows of the next block
+                    done = block[1][index] <= start
+                    rest = index[~done]
+                    index = index[done]
+                    pending = tuple(column[rest] for column in block)
+            yield from self._format(block, index)
+
+
+def write_trace(path, rows, seed=0, **kwargs):
+    generator = TraceGenerator(rows, seed, **kwargs)
+    with open(path, 'w') as f:
+        for line in generator.lines():
+            f.write(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--commands', nargs='+', default=COMMANDS,
+        help='set commands as name:pid')
+    parser.add_argument('--devices', nargs='+', default=DEVICES)
+    parser.add_argument('--types', nargs='+', default=TYPES)
+    parser.add_argument(
+        '--iops', type=float, default=1000.0,
+        help='set average number of i/o per second')
+    parser.add_argument('--latency', choices=LATENCIES,
+                        default=LATENCY_LOGNORMAL)
+    parser.add_argument(
+        '--latency-ms', dest='latency_ms', type=float, default=7.0,
+        help='set median latency in millisecond')
+    parser.add_argument(
+        '--latency-sigma', dest='latency_sigma', type=float, default=0.8,
+        help='set sigma of lognormal or shape of pareto distribution')
+    parser.add_argument('--order', choices=ORDERS, default=ORDER_COMPLETION)
+    parser.add_argument('--output', default='-')
+    args = parser.parse_args()
+
+    generator = TraceGenerator(
+        args.rows, args.seed, commands=args.commands, devices=args.devices,
+        types=args.types, iops=args.iops, latency=args.latency,
+        latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+        order=args.order,
+    )
+    f = sys.stdout if args.output == '-' else open(args.output, 'w')
+    with f:
+        f.writelines(generator.lines())
+
+
+if __name__ == '__main__':
+    main()
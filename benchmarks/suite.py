@@ -0,0 +1,201 @@
+"""
+measure rows/sec and peak RSS of each stage on a synthetic iosnoop output,
+and fail when a stage regresses from a stored baseline
+
+    $ python benchmarks/suite.py --rows 1000000 --save-baseline baseline.json
+    $ python benchmarks/suite.py --rows 1000000 --baseline baseline.json
+
+each stage runs in its own process, so that peak RSS is not shared
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from generate_trace import write_trace  # noqa: E402
+
+STAGE_PARSE = 'parse'
+STAGE_FILTER = 'filter'
+STAGE_CSV = 'csv'
+STAGE_BIN = 'bin'
+STAGE_RENDER = 'render'
+STAGES = [STAGE_PARSE, STAGE_FILTER, STAGE_CSV, STAGE_BIN, STAGE_RENDER]
+
+ROWS_PER_SEC = 'rows_per_sec'
+MAX_RSS = 'max_rss_mib'
+
+
+def parse_cli_args(argv):
+    import matplotlib
+    matplotlib.use('Agg')
+    from iosnoop import main
+    sys.argv = ['iosnoop-cli'] + argv
+    return main.parse_argument()
+
+
+def run_parse(data, tmp):
+    from iosnoop.sources import make_parser
+    args = parse_cli_args(['--no-cache', '--data', data, 'plot'])
+    start = time.perf_counter()
+    make_parser(args).parse_frame()
+    return time.perf_counter() - start
+
+
+def run_filter(data, tmp):
+    from iosnoop.sources import make_parser
+    args = parse_cli_args([
+        '--no-cache', '--io-commands', 'main', '--data', data, 'plot'])
+    start = time.perf_counter()
+    make_parser(args).parse_frame()
+    return time.perf_counter() - start
+
+
+def run_csv(data, tmp):
+    from iosnoop.csv import write_csv
+    output = os.path.join(tmp, 'iosnoop.csv')
+    args = parse_cli_args([
+        '--no-cache', '--data', data, 'csv', '--output', output])
+    start = time.perf_counter()
+    write_csv(args)
+    return time.perf_counter() - start
+
+
+def _make_heatmap(data, tmp):
+    from iosnoop.heatmap import HeatMap
+    from iosnoop.sources import make_parser
+    output = os.path.join(tmp, 'iosnoop.png')
+    args = parse_cli_args([
+        '--no-cache', '--data', data, 'plot', '--fig-output', output])
+    df = make_parser(args).parse_frame()
+    start = time.perf_counter()
+    heatmap = HeatMap(args, df)
+    return heatmap, time.perf_counter() - start
+
+
+def run_bin(data, tmp):
+    _, elapsed = _make_heatmap(data, tmp)
+    return elapsed
+
+
+def run_render(data, tmp):
+    heatmap, _ = _make_heatmap(data, tmp)
+    start = time.perf_counter()
+    heatmap.render()
+    return time.perf_counter() - start
+
+
+_RUNNERS = {
+    STAGE_PARSE: run_parse,
+    STAGE_FILTER: run_filter,
+    STAGE_CSV: run_csv,
+    STAGE_BIN: run_bin,
+    STAGE_RENDER: run_render,
+}
+
+
+def run_stage(stage, data, rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        elapsed = _RUNNERS[stage](data, tmp)
+    # ru_maxrss is in KiB on linux
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {
+        'elapsed': elapsed,
+        ROWS_PER_SEC: rows / elapsed,
+        MAX_RSS: max_rss,
+    }
+
+
+def measure(stage, data, rows):
+    output = subprocess.check_output([
+        sys.executable, __file__, '--run-stage', stage, '--data', data,
+        '--rows', str(rows),
+    ])
+    return json.loads(output.decode().splitlines()[-1])
+
+
+def find_regressions(results, baseline, tolerance):
+    """
+    >>> baseline = {'parse': {'rows_per_sec': 100.0, 'max_rss_mib': 50.0}}
+    >>> find_regressions(
+    ...     {'parse': {'rows_per_sec': 70.0, 'max_rss_mib': 55.0}},
+    ...     baseline, 0.2)
+    ['parse: rows_per_sec 70 < 100 by more than 20%']
+    """
+    regressions = []
+    for stage, result in sorted(results.items()):
+        base = baseline.get(stage)
+        if base is None:
+            continue
+        if result[ROWS_PER_SEC] < base[ROWS_PER_SEC] * (1 - tolerance):
+            regressions.append('%s: %s %.0f < %.0f by more than %d%%' % (
+                stage, ROWS_PER_SEC, result[ROWS_PER_SEC],
+                base[ROWS_PER_SEC], tolerance * 100))
+        if result[MAX_RSS] > base[MAX_RSS] * (1 + tolerance):
+            regressions.append('%s: %s %.0f > %.0f by more than %d%%' % (
+                stage, MAX_RSS, result[MAX_RSS], base[MAX_RSS],
+                tolerance * 100))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument(
+        '--data', help='use the file instead of generating a trace')
+    parser.add_argument(
+        '--baseline', help='fail when a stage regresses from the baseline')
+    parser.add_argument(
+        '--save-baseline', dest='save_baseline',
+        help='save results as a baseline')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.2,
+        help='set allowed ratio of regression, default is 0.2')
+    parser.add_argument('--run-stage', dest='run_stage', choices=STAGES)
+    args = parser.parse_args()
+
+    if args.run_stage is not None:
+        result = run_stage(args.run_stage, args.data, args.rows)
+        print(json.dumps(result))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data = args.data
+        if data is None:
+            data = os.path.join(tmp, 'iosnoop.log')
+            write_trace(data, args.rows, args.seed)
+
+        results = {}
+        for stage in args.stages:
+            result = measure(stage, data, args.rows)
+            results[stage] = result
+            print('%-8s %8.3f sec %12.0f rows/sec %10.1f MiB' % (
+                stage, result['elapsed'], result[ROWS_PER_SEC],
+                result[MAX_RSS]))
+
+    if args.save_baseline is not None:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'rows': args.rows, 'stages': results}, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['rows'] != args.rows:
+            print('baseline is measured with %d rows' % baseline['rows'])
+        regressions = find_regressions(
+            results, baseline['stages'], args.tolerance)
+        for regression in regressions:
+            print('regression: %s' % regression)
+        if len(regressions) > 0:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .consts import PARSER_VERSION, START_LOCAL_TIME
+from .reader import STDIN
+from .utils import get_logger
+
+log = get_logger()
+
+# rows of a frame yielded at once from the cache
+CACHE_CHUNK_ROWS = 1024 * 1024
+
+_META_FILE = 'meta.json'
+# files stored beside entries, e.g. the time index, are evicted with them
+_FILE_SUFFIX = '.npz'
+_CODES_DTYPE = np.int32
+
+
+def get_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME')
+    if base is None:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'iosnoop-tool')
+
+
+def make_key(path):
+    st = os.stat(path)
+    identity = '%s:%d:%d:%d' % (
+        os.path.abspath(path), st.st_size, st.st_mtime_ns, PARSER_VERSION)
+    return hashlib.sha1(identity.encode()).hexdigest()
+
+
+def _column_file(entry, name):
+    return os.path.join(entry, '%s.bin' % name)
+
+
+def _to_json(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class CacheWriter:
+
+    def __init__(self, cache_dir, key):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.entry = os.path.join(cache_dir, key)
+        self.tmp = tempfile.mkdtemp(prefix='.%s.' % key, dir=cache_dir)
+        self.files = {}
+        self.dtypes = {}
+        self.categories = {}
+        self.columns = None
+        self.rows = 0
+
+    def _file(self, name):
+        f = self.files.get(name)
+        if f is None:
+            f = open(_column_file(self.tmp, name), 'wb')
+            self.files[name] = f
+        return f
+
+    @property
+    def valid(self):
+        return self.columns is not False
+
+    def append(self, df):
+        if self.columns is None:
+            self.columns = list(df.columns)
+        elif self.columns != list(df.columns):
+            self.columns = False  # header is changed in the middle
+        if not self.valid:
+            return
+
+        for name in df.columns:
+            if name == START_LOCAL_TIME:
+                continue  # depends on --basedate
+
+            column = df[name]
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                # encodes values with codes across chunks
+                categories = self.categories.setdefault(name, {})
+                values = [
+                    categories.setdefault(value, len(categories))
+                    for value in column.cat.categories
+                ]
+                mapping = np.array(values, dtype=_CODES_DTYPE)
+                data = mapping[column.cat.codes.values]
+                self.dtypes[name] = 'category'
+            else:
+                data = column.values
+                self.dtypes[name] = data.dtype.str
+            self._file(name).write(np.ascontiguousarray(data).tobytes())
+        self.rows += len(df)
+
+    def commit(self, parser):
+        for f in self.files.values():
+            f.close()
+        meta = {
+            'version': PARSER_VERSION,
+            'path': os.path.abspath(parser.args.data),
+            'columns': parser._columns,
+            'first_row': {
+                k: _to_json(v) for k, v in parser.first_row.items()
+            },
+            'rows': self.rows,
+            'dtypes': self.dtypes,
+            'categories': {
+                name: list(values) for name, values in self.categories.items()
+            },
+        }
+        with open(os.path.join(self.tmp, _META_FILE), 'w') as f:
+            json.dump(meta, f)
+        try:
+            os.rename(self.tmp, self.entry)
+        except OSError:
+            # another process has stored the same trace
+            self.abort()
+
+    def abort(self):
+        for f in self.files.values():
+            f.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+def load_chunks(parser, entry, chunk_rows=CACHE_CHUNK_ROWS):
+    meta_file = os.path.join(entry, _META_FILE)
+    with open(meta_file) as f:
+        meta = json.load(f)
+    os.utime(meta_file)  # for eviction by least recently used
+    parser._columns = meta['columns']
+    parser.first_row = meta['first_row']
+    parser.pushdown = False
+
+    rows = meta['rows']
+    if rows == 0:
+        return
+    columns = {}
+    for name, dtype in meta['dtypes'].items():
+        if dtype == 'category':
+            codes = np.memmap(
+                _column_file(entry, name), dtype=_CODES_DTYPE, mode='r')
+            columns[name] = (codes, meta['categories'][name])
+        else:
+            columns[name] = np.memmap(
+                _column_file(entry, name), dtype=dtype, mode='r')
+
+    for start in range(0, rows, chunk_rows):
+        end = start + chunk_rows
+        chunk = {}
+        for name, values in columns.items():
+            if isinstance(values, tuple):
+                codes, categories = values
+                chunk[name] = pd.Categorical.from_codes(
+                    codes[start:end], categories=categories)
+            else:
+                chunk[name] = values[start:end]
+        yield parser.make_frame(chunk)
+
+
+def get_entries(cache_dir):
+    entries = []
+    for name in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir, name)
+        if name.startswith('.'):
+            continue
+        if name.endswith(_FILE_SUFFIX) and os.path.isfile(entry):
+            entries.append(
+                (os.path.getmtime(entry), os.path.getsize(entry), entry))
+            continue
+        meta_file = os.path.join(entry, _META_FILE)
+        if not os.path.exists(meta_file):
+            continue
+        size = sum(
+            os.path.getsize(os.path.join(entry, i)) for i in os.listdir(entry)
+        )
+        entries.append((os.path.getmtime(meta_file), size, entry))
+    return entries
+
+
+def evict(cache_dir, max_size):
+    entries = sorted(get_entries(cache_dir), reverse=True)
+    total = 0
+    for _, size, entry in entries:
+        total += size
+        if total > max_size:
+            log.debug('evict cache: %s', entry)
+            if os.path.isdir(entry):
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                try:
+                    os.remove(entry)
+                except OSError:
+                    pass
+
+
+def evict_cache(args):
+    """removes least recently used entries beyond --cache-size"""
+    cache_dir = args.cache_dir or get_cache_dir()
+    evict(cache_dir, args.cache_size * 1024 * 1024)
+
+
+def is_cacheable(args):
+    if not args.cache or args.data == STDIN:
+        return False
+    return os.path.isfile(args.data)
+
+
+def cached_chunks(parser, read_chunks, store=True):
+    args = parser.args
+    if not is_cacheable(args):
+        yield from read_chunks()
+        return
+
+    cache_dir = args.cache_dir or get_cache_dir()
+    key = make_key(args.data)
+    entry = os.path.join(cache_dir, key)
+    if os.path.exists(os.path.join(entry, _META_FILE)):
+        log.debug('load parsed data from cache: %s', entry)
+        yield from load_chunks(parser, entry)
+        return
+    if not store:
+        yield from read_chunks()
+        return
+
+    writer = CacheWriter(cache_dir, key)
+    completed = False
+    try:
+        for df in read_chunks():
+            writer.append(df)
+            yield df
+        completed = True
+    finally:
+        if not completed:
+            writer.abort()
+
+    if parser.first_row is None or not writer.valid:
+        writer.abort()
+        return
+    writer.commit(parser)
+    log.debug('store parsed data to cache: %s', entry)
+    evict_cache(args)
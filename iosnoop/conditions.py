@@ -0,0 +1,226 @@
+import ast
+import operator
+import re
+from functools import partial
+
+import numpy as np
+
+from .consts import COMMAND, PROCESS_ID, IO_TYPE, DEVICE_ID, DISK_BLOCK
+from .consts import IO_SIZE, IO_LATENCY, START_TIME_STAMP, END_TIME_STAMP
+from .consts import SOURCE, START_TIME_STAMP_DIFF
+from .filters import _mask_values
+
+CONDITION_COLUMNS = frozenset([
+    COMMAND, PROCESS_ID, IO_TYPE, DEVICE_ID, DISK_BLOCK, IO_SIZE, IO_LATENCY,
+    START_TIME_STAMP, END_TIME_STAMP, START_TIME_STAMP_DIFF, SOURCE,
+])
+# columns of strings, the others are numbers
+_STRING_COLUMNS = frozenset([COMMAND, IO_TYPE, DEVICE_ID, SOURCE])
+
+_COMPARE_OPERATORS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+
+_STRING_METHODS = {
+    'contains': lambda pattern: re.compile(pattern).search,
+    'startswith': lambda prefix: lambda value: value.startswith(prefix),
+    'endswith': lambda suffix: lambda value: value.endswith(suffix),
+}
+
+
+class ConditionError(ValueError):
+    pass
+
+
+def _values(column):
+    values = column.values
+    if hasattr(values, 'categories'):
+        return values
+    return np.asarray(values)
+
+
+def _compare(op, name, value, df):
+    column = _values(df[name])
+    if hasattr(column, 'categories'):
+        return _mask_values(
+            lambda values: [op(v, value) for v in values], column)
+    return np.asarray(op(column, value), dtype=bool)
+
+
+def _isin(name, values, df):
+    column = _values(df[name])
+    if hasattr(column, 'categories'):
+        return _mask_values(
+            lambda uniques: [v in values for v in uniques], column)
+    return np.isin(column, list(values))
+
+
+def _between(name, left, right, df):
+    column = np.asarray(df[name].values)
+    return (left <= column) & (column <= right)
+
+
+def _string_method(name, predicate, df):
+    return _mask_values(
+        lambda values: [bool(predicate(str(v))) for v in values], df[name])
+
+
+def _and(funcs, df):
+    mask = funcs[0](df)
+    for func in funcs[1:]:
+        mask = mask & func(df)
+    return mask
+
+
+def _or(funcs, df):
+    mask = funcs[0](df)
+    for func in funcs[1:]:
+        mask = mask | func(df)
+    return mask
+
+
+def _not(func, df):
+    return ~func(df)
+
+
+class _Compiler:
+
+    def __init__(self, expr):
+        self.expr = expr
+
+    def error(self, node, message):
+        return ConditionError(
+            '%s in condition: %s' % (message, self.expr))
+
+    def constant(self, node):
+        if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            return [self.constant(i) for i in node.elts]
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            return -self.constant(node.operand)
+        if isinstance(node, ast.Constant) and \
+                isinstance(node.value, (int, float, str)):
+            return node.value
+        raise self.error(node, 'expects a number or a string')
+
+    def column(self, node):
+        if not isinstance(node, ast.Name):
+            raise self.error(node, 'expects a column name')
+        if node.id not in CONDITION_COLUMNS:
+            raise self.error(node, 'unknown column "%s"' % node.id)
+        return node.id
+
+    def operand(self, node, name):
+        """returns a constant of the same type as values of the column"""
+        value = self.constant(node)
+        expected = 'a string' if name in _STRING_COLUMNS else 'a number'
+        if isinstance(value, str) != (name in _STRING_COLUMNS):
+            raise self.error(node, '%s expects %s' % (name, expected))
+        return value
+
+    def compare(self, node):
+        funcs = []
+        left = node.left
+        for op, right in zip(node.ops, node.comparators):
+            op_func = _COMPARE_OPERATORS.get(type(op))
+            if op_func is None:
+                raise self.error(node, 'unsupported operator')
+            if isinstance(left, ast.Name):
+                name = self.column(left)
+                func = partial(
+                    _compare, op_func, name, self.operand(right, name))
+            else:
+                # e.g. 100 < LATms, swap operands
+                name = self.column(right)
+                func = partial(
+                    _compare, lambda a, b, f=op_func: f(b, a),
+                    name, self.operand(left, name))
+            funcs.append(func)
+            left = right
+        if len(funcs) == 1:
+            return funcs[0]
+        return partial(_and, funcs)
+
+    def call(self, node):
+        func = node.func
+        if not isinstance(func, ast.Attribute) or node.keywords:
+            raise self.error(node, 'unsupported function call')
+        args = [self.constant(i) for i in node.args]
+
+        target = func.value
+        if isinstance(target, ast.Attribute) and target.attr == 'str':
+            name = self.column(target.value)
+            method = _STRING_METHODS.get(func.attr)
+            if method is None or len(args) != 1:
+                raise self.error(node, 'unsupported str.%s' % func.attr)
+            return partial(_string_method, name, method(args[0]))
+
+        name = self.column(target)
+        if func.attr == 'between' and len(node.args) == 2:
+            left, right = [self.operand(i, name) for i in node.args]
+            if name in _STRING_COLUMNS:
+                raise self.error(node, 'between expects a number column')
+            return partial(_between, name, left, right)
+        if func.attr == 'isin' and len(args) == 1:
+            return partial(_isin, name, frozenset(args[0]))
+        raise self.error(node, 'unsupported method %s' % func.attr)
+
+    def compile(self, node):
+        if isinstance(node, ast.Expression):
+            return self.compile(node.body)
+        if isinstance(node, ast.Compare):
+            return self.compare(node)
+        if isinstance(node, ast.Call):
+            return self.call(node)
+        if isinstance(node, ast.BoolOp):
+            funcs = [self.compile(i) for i in node.values]
+            if isinstance(node.op, ast.And):
+                return partial(_and, funcs)
+            return partial(_or, funcs)
+        if isinstance(node, ast.BinOp) and \
+                isinstance(node.op, (ast.BitAnd, ast.BitOr)):
+            funcs = [self.compile(node.left), self.compile(node.right)]
+            if isinstance(node.op, ast.BitAnd):
+                return partial(_and, funcs)
+            return partial(_or, funcs)
+        if isinstance(node, ast.UnaryOp) and \
+                isinstance(node.op, (ast.Not, ast.Invert)):
+            return partial(_not, self.compile(node.operand))
+        raise self.error(node, 'unsupported expression')
+
+
+def compile_condition(expr):
+    """
+    compiles a subplot condition into a function returning a boolean mask,
+    only comparisons and a few methods on iosnoop columns are allowed
+
+    >>> import pandas as pd
+    >>> df = pd.DataFrame({
+    ...     'COMM': pd.Categorical(['main', '<idle>', 'jbd2/sdk1-28']),
+    ...     'BYTES': [4096, 131072, 524288],
+    ... })
+    >>> compile_condition("COMM == 'main'")(df).tolist()
+    [True, False, False]
+    >>> compile_condition("COMM.str.contains('jbd2|idle')")(df).tolist()
+    [False, True, True]
+    >>> cond = "BYTES.between(0, 131072) and not COMM == '<idle>'"
+    >>> compile_condition(cond)(df).tolist()
+    [True, False, False]
+    >>> compile_condition("__import__('os').system('ls')")
+    Traceback (most recent call last):
+    ...
+    iosnoop.conditions.ConditionError: expects a column name in ...
+    >>> compile_condition('COMM > 3')
+    Traceback (most recent call last):
+    ...
+    iosnoop.conditions.ConditionError: COMM expects a string in ...
+    """
+    try:
+        tree = ast.parse(expr.strip(), mode='eval')
+    except SyntaxError as e:
+        raise ConditionError('%s in condition: %s' % (e.msg, expr))
+    return _Compiler(expr).compile(tree)
@@ -1,14 +1,39 @@
 PACKAGE_NAME = 'iosnoop-tool'
 
+# increment when parsed data is changed to invalidate cache
+PARSER_VERSION = 1
+
 # parser options
 SUB_COMMAND_CSV = 'csv'
+SUB_COMMAND_EXPORT = 'export'
 SUB_COMMAND_PLOT = 'plot'
+SUB_COMMAND_RECORD = 'record'
+SUB_COMMAND_SLOWEST = 'slowest'
+SUB_COMMAND_STATS = 'stats'
 
 # plot options
 PLOT_TYPE_HEATMAP = 'heatmap'
+PLOT_TYPE_OFFSET = 'offset'
+PLOT_TYPE_SIZE = 'size'
 PLOT_TYPES = [
     PLOT_TYPE_HEATMAP,
+    PLOT_TYPE_OFFSET,
+    PLOT_TYPE_SIZE,
+]
+RENDERER_IMAGE = 'image'
+RENDERER_SEABORN = 'seaborn'
+RENDERERS = [
+    RENDERER_IMAGE,
+    RENDERER_SEABORN,
+]
+Y_SCALE_LINEAR = 'linear'
+Y_SCALE_LOG = 'log'
+Y_SCALES = [
+    Y_SCALE_LINEAR,
+    Y_SCALE_LOG,
 ]
+# seconds of the sliding window in follow mode unless --x-max is set
+FOLLOW_X_MAX = 600
 
 # iosnoop columns
 START_TIME_STAMP = 'STARTs'
@@ -23,12 +48,11 @@ IO_LATENCY = 'LATms'
 # extra columns
 START_TIME_STAMP_DIFF = 'STARTs_DIFF'
 START_LOCAL_TIME = 'STARTs_LOCAL_TIME'
+SOURCE = 'SOURCE'
 EXTRA_COLUMNS = [
     START_TIME_STAMP_DIFF,
     START_LOCAL_TIME,
 ]
 
-# dataframe bin columns
-LATENCY_BINS = 'latency_bins'
-TS_DIFF_BINS = 'ts_diff_bins'
-LOCAL_TIME_BINS = 'local_time_bins'
+# description line of iosnoop output
+LOG_DESCRIPTION = r'tracing'
@@ -1,15 +1,21 @@
 import csv
 from contextlib import ContextDecorator
 
-from .parser import Parser
+from .profiling import get_data_size, get_output_size, get_profiler
+from .sources import make_parser
 from .utils import make_output_file
 
+# rows passed to writerows at once
+CSV_BATCH_ROWS = 64 * 1024
+_WRITE_BUFFER_SIZE = 4 * 1024 * 1024
+
 
 class Writer(ContextDecorator):
 
     def __init__(self, args):
         self.args = args
-        self.f = open(self.output, 'w')
+        self.f = open(self.output, 'w', buffering=_WRITE_BUFFER_SIZE)
+        self.rows = []
         self.writer = csv.writer(
             self.f, dialect=args.dialect, delimiter=args.separator,
             quoting=csv.QUOTE_MINIMAL
@@ -26,29 +32,63 @@ class Writer(ContextDecorator):
         return self
 
     def __exit__(self, *exc):
+        self.flush()
         self.f.close()
+        get_profiler().add('write', size=get_output_size(self.output))
 
     def write_header(self, columns):
-        headers = columns
-        if self.args.columns:
-            headers = self.args.columns
-        self.writer.writerow(headers)
+        self.writer.writerow(columns)
+
+    def flush(self):
+        if len(self.rows) > 0:
+            with get_profiler().stage('write') as stage:
+                self.writer.writerows(self.rows)
+                stage.add(rows=len(self.rows))
+            self.rows = []
 
     def write(self, row):
-        row = list(row)  # for py34 compatibility
-        self.writer.writerow(row)
+        self.rows.append(list(row))  # for py34 compatibility
+        if len(self.rows) >= CSV_BATCH_ROWS:
+            self.flush()
+
+    def write_frame(self, df):
+        self.flush()
+        with get_profiler().stage('write') as stage:
+            self.writer.writerows(df.itertuples(index=False, name=None))
+            stage.add(rows=len(df))
+
+
+def write_csv_frames(args):
+    profiler = get_profiler()
+    parser = make_parser(args)
+    with Writer(args) as f:
+        header = False
+        chunks = profiler.iterate('parse', parser.parse_chunks(), rows=len)
+        for df in chunks:
+            if len(df) == 0:
+                continue
+            if not header:
+                f.write_header(df.columns)
+                header = True
+            f.write_frame(df)
+    profiler.add('parse', size=get_data_size(args.data_files))
 
 
 def write_csv(args):
-    parser = Parser(args)
+    if args.jobs > 1:
+        return write_csv_frames(args)
+
+    profiler = get_profiler()
+    parser = make_parser(args)
+    profiler.add('parse', size=get_data_size(args.data_files))
     with Writer(args) as f:
-        g = parser.parse()
+        g = profiler.iterate('parse', parser.parse(), rows=lambda row: 1)
         try:
             first_row = next(g)
         except StopIteration:
             return
         else:
-            f.write_header(parser.columns)
+            f.write_header(parser.output_columns)
             f.write(first_row.values())
             for row in g:
                 f.write(row.values())
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+from .consts import COMMAND, PROCESS_ID, IO_TYPE, DEVICE_ID, IO_SIZE
+
+UNIQUE_COLUMNS = [COMMAND, PROCESS_ID, IO_TYPE, DEVICE_ID, IO_SIZE]
+
+
+class Dictionary:
+    """
+    interns string tokens of a column into integer codes, codes are kept
+    across chunks so that a value is hashed into the dictionary only once
+
+    >>> dictionary = Dictionary()
+    >>> dictionary.encode(['R', 'W', 'R']).codes.tolist()
+    [0, 1, 0]
+    >>> values = dictionary.encode(['WS', 'R'])
+    >>> values.codes.tolist(), list(values.categories)
+    ([2, 0], ['R', 'W', 'WS'])
+    >>> dictionary.intern('W') is dictionary.values[1]
+    True
+    """
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def _add(self, tokens):
+        codes = self.codes
+        for token in dict.fromkeys(tokens):
+            if token not in codes:
+                codes[token] = len(self.values)
+                self.values.append(token)
+
+    def encode(self, tokens):
+        """returns tokens as a categorical of the values seen so far"""
+        try:
+            codes = np.fromiter(
+                map(self.codes.__getitem__, tokens), dtype=np.int32,
+                count=len(tokens))
+        except KeyError:
+            self._add(tokens)
+            codes = np.fromiter(
+                map(self.codes.__getitem__, tokens), dtype=np.int32,
+                count=len(tokens))
+        return pd.Categorical.from_codes(codes, categories=self.values)
+
+    def encode_distinct(self, tokens, inverse):
+        """returns tokens[inverse] as a categorical for distinct tokens"""
+        codes = np.array([self.get_code(token) for token in tokens],
+                         dtype=np.int32)
+        return pd.Categorical.from_codes(
+            codes[inverse], categories=self.values)
+
+    def get_code(self, token):
+        code = self.codes.get(token)
+        if code is None:
+            code = self.codes[token] = len(self.values)
+            self.values.append(token)
+        return code
+
+    def intern(self, token):
+        """returns the value equal to token which rows share"""
+        return self.values[self.get_code(token)]
+
+
+def _unique(values):
+    if isinstance(values, pd.Categorical):
+        # distinct values of a chunk are found over integer codes
+        codes = pd.unique(values.codes)
+        return values.categories.take(codes[codes >= 0])
+    return pd.unique(values)
+
+
+class UniqueValues:
+    """
+    collects distinct values of columns in order of appearance chunk by
+    chunk, so that they are known without a pass over the whole data
+
+    >>> unique_values = UniqueValues(['TYPE', 'PID'])
+    >>> unique_values.add(pd.DataFrame({
+    ...     'TYPE': pd.Categorical(['W', 'R', 'W']), 'PID': [1, 2, 2]}))
+    >>> unique_values.add(pd.DataFrame({
+    ...     'TYPE': pd.Categorical(['WS']), 'PID': [2]}))
+    >>> [(column, [str(v) for v in values])
+    ...  for column, values in unique_values.items()]
+    [('TYPE', ['W', 'R', 'WS']), ('PID', ['1', '2'])]
+    """
+
+    def __init__(self, columns=UNIQUE_COLUMNS):
+        self.columns = columns
+        self.values = {}
+
+    def add(self, df):
+        for column in self.columns:
+            if column not in df:
+                continue  # dropped by --columns
+            values = self.values.setdefault(column, {})
+            for value in _unique(df[column].values):
+                values.setdefault(value)
+
+    def items(self):
+        for column in self.columns:
+            if column in self.values:
+                yield column, list(self.values[column])
@@ -0,0 +1,217 @@
+import json
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+from .profiling import get_data_size, get_output_size, get_profiler
+from .sources import make_parser
+from .utils import CommandError, get_logger, make_output_file
+
+log = get_logger()
+
+EXPORT_FORMAT_NPY = 'npy'
+EXPORT_FORMAT_PARQUET = 'parquet'
+EXPORT_FORMAT_FEATHER = 'feather'
+EXPORT_FORMATS = [
+    EXPORT_FORMAT_NPY,
+    EXPORT_FORMAT_PARQUET,
+    EXPORT_FORMAT_FEATHER,
+]
+
+_NPY_DIRECTORY_EXT = 'columns'
+_NPY_HEADER_SIZE = 128
+_CATEGORIES_SUFFIX = '.categories'
+_CODES_DTYPE = np.int32
+_META_FILE = 'columns.json'
+
+
+def _npy_header(dtype, rows):
+    """
+    returns a .npy header of fixed size, so that the number of rows can be
+    written after all rows are appended
+
+    >>> header = _npy_header(np.dtype('<f8'), 3)
+    >>> len(header)
+    128
+    >>> header[:6]
+    b'\\x93NUMPY'
+    """
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (
+        np.lib.format.dtype_to_descr(dtype), rows)
+    # magic (6) + version (2) + header length (2) + header + '\n'
+    size = _NPY_HEADER_SIZE - 10
+    header = header.ljust(size - 1) + '\n'
+    return (np.lib.format.magic(1, 0) + struct.pack('<H', size) +
+            header.encode('latin1'))
+
+
+class NpyColumn:
+
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = dtype
+        self.rows = 0
+        self.f = open(path, 'wb')
+        self.f.write(_npy_header(dtype, 0))
+
+    def append(self, values):
+        self.f.write(np.ascontiguousarray(values, dtype=self.dtype).tobytes())
+        self.rows += len(values)
+
+    def close(self):
+        self.f.seek(0)
+        self.f.write(_npy_header(self.dtype, self.rows))
+        self.f.close()
+
+
+class NpyWriter:
+    """
+    writes a directory of .npy files per column which np.load can map with
+    mmap_mode='r', categorical columns are written as codes with categories
+    """
+
+    def __init__(self, output):
+        os.makedirs(output, exist_ok=True)
+        self.output = output
+        self.files = {}
+        self.categories = {}
+        self.columns = None
+
+    def _file(self, name, dtype):
+        f = self.files.get(name)
+        if f is None:
+            path = os.path.join(self.output, '%s.npy' % name)
+            f = NpyColumn(path, dtype)
+            self.files[name] = f
+        return f
+
+    def write(self, df):
+        if self.columns is None:
+            self.columns = list(df.columns)
+        for name in self.columns:
+            column = df[name]
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                # encodes values with codes across chunks
+                categories = self.categories.setdefault(name, {})
+                values = [
+                    categories.setdefault(value, len(categories))
+                    for value in column.cat.categories
+                ]
+                mapping = np.array(values, dtype=_CODES_DTYPE)
+                data = mapping[column.cat.codes.values]
+            else:
+                data = column.values
+            self._file(name, data.dtype).append(data)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        for name, categories in self.categories.items():
+            path = os.path.join(
+                self.output, '%s%s.npy' % (name, _CATEGORIES_SUFFIX))
+            np.save(path, np.array(list(categories), dtype=str))
+        with open(os.path.join(self.output, _META_FILE), 'w') as f:
+            json.dump({
+                'columns': self.columns,
+                'categories': sorted(self.categories),
+            }, f)
+
+
+def load_npy(output, mmap_mode='r'):
+    """loads a directory written by NpyWriter as a DataFrame"""
+    with open(os.path.join(output, _META_FILE)) as f:
+        meta = json.load(f)
+    columns = {}
+    for name in meta['columns'] or []:
+        values = np.load(
+            os.path.join(output, '%s.npy' % name), mmap_mode=mmap_mode)
+        if name in meta['categories']:
+            categories = np.load(os.path.join(
+                output, '%s%s.npy' % (name, _CATEGORIES_SUFFIX)))
+            values = pd.Categorical.from_codes(values, categories=categories)
+        columns[name] = values
+    return pd.DataFrame(columns, columns=meta['columns'] or [], copy=False)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        msg = 'install pyarrow package to export parquet/feather file'
+        raise CommandError(msg)
+    return pyarrow
+
+
+class ArrowWriter:
+
+    def __init__(self, output, export_format):
+        self.pa = _import_pyarrow()
+        self.output = output
+        self.format = export_format
+        self.schema = None
+        self.writer = None
+
+    def _open(self, table):
+        self.schema = table.schema
+        if self.format == EXPORT_FORMAT_PARQUET:
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(self.output, self.schema)
+        else:
+            # feather version 2 is the arrow ipc file format
+            self.writer = self.pa.ipc.new_file(self.output, self.schema)
+
+    def write(self, df):
+        # dictionaries of categorical columns differ between chunks
+        columns = {}
+        for name in df.columns:
+            column = df[name]
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                column = column.astype(str)
+            columns[name] = column
+        table = self.pa.Table.from_pandas(
+            pd.DataFrame(columns, copy=False), preserve_index=False)
+        if self.writer is None:
+            self._open(table)
+        else:
+            table = table.cast(self.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def make_writer(args):
+    output = args.output
+    if args.format == EXPORT_FORMAT_NPY:
+        if output is None:
+            output = make_output_file(args.data, _NPY_DIRECTORY_EXT)
+        return NpyWriter(output)
+
+    if output is None:
+        output = make_output_file(args.data, args.format)
+    return ArrowWriter(output, args.format)
+
+
+def write_export(args):
+    profiler = get_profiler()
+    parser = make_parser(args)
+    writer = make_writer(args)
+    rows = 0
+    try:
+        chunks = profiler.iterate('parse', parser.parse_chunks(), rows=len)
+        for df in chunks:
+            if len(df) == 0:
+                continue
+            with profiler.stage('write') as stage:
+                writer.write(df)
+                stage.add(rows=len(df))
+            rows += len(df)
+    finally:
+        with profiler.stage('write') as stage:
+            writer.close()
+            stage.add(size=get_output_size(writer.output))
+    profiler.add('parse', size=get_data_size(args.data_files))
+    log.info('exported %d rows to %s', rows, writer.output)
@@ -1,5 +1,8 @@
 from functools import partial
 
+import numpy as np
+import pandas as pd
+
 from .consts import COMMAND, PROCESS_ID, IO_TYPE, DEVICE_ID
 from .consts import START_TIME_STAMP, START_TIME_STAMP_DIFF
 
@@ -12,16 +15,6 @@ def filter_until(until, row):
     return row[START_TIME_STAMP_DIFF] <= until
 
 
-def filter_columns(columns_names, row):
-    if START_TIME_STAMP not in columns_names:
-        columns_names.insert(0, START_TIME_STAMP)
-
-    excludes = [name for name in row if name not in columns_names]
-    for name in excludes:
-        del row[name]
-    return True
-
-
 def filter_io_commands(commands, row):
     for command in commands:
         if command in row[COMMAND]:
@@ -47,8 +40,6 @@ def get_filters(args):
         filters.append(partial(filter_since, args.since))
     if args.until is not None:
         filters.append(partial(filter_until, args.until))
-    if args.columns:
-        filters.append(partial(filter_columns, args.columns))
     if args.io_commands:
         filters.append(partial(filter_io_commands, args.io_commands))
     if args.io_device:
@@ -59,3 +50,146 @@ def get_filters(args):
         filters.append(partial(filter_io_types, args.io_types))
 
     return filters
+
+
+def get_projection(args):
+    if not args.columns:
+        return None
+    return frozenset(args.columns) | {START_TIME_STAMP}
+
+
+def _match_commands(commands, values):
+    return [any(c in value for c in commands) for value in values]
+
+
+def _mask_values(predicate, values):
+    """evaluates predicate once per distinct value"""
+    if isinstance(values, pd.Series):
+        values = values.values
+    if isinstance(values, pd.Categorical):
+        hits = np.array(predicate(values.categories), dtype=bool)
+        codes = values.codes
+        return np.where(codes < 0, False, hits[codes])
+    uniques, inverse = np.unique(np.asarray(values), return_inverse=True)
+    return np.array(predicate(uniques), dtype=bool)[inverse]
+
+
+class FilterPlan:
+    """
+    compiles filter options into masks over column batches
+
+    string filters can run on encoded columns before other columns are
+    converted, a predicate is evaluated per distinct value and rows are
+    selected by integer codes
+
+    >>> from argparse import Namespace
+    >>> args = Namespace(since=None, until=None, columns=[],
+    ...                  io_commands=['main', 'idle'], io_device=None,
+    ...                  io_pids=[0, 8674], io_types=[])
+    >>> plan = FilterPlan(args)
+    >>> plan.mask({
+    ...     'COMM': pd.Categorical(['jbd2/sdk1-28', 'main', '<idle>']),
+    ...     'PID': np.array([2811, 8674, 0]),
+    ... }).tolist()
+    [False, True, True]
+    """
+
+    def __init__(self, args):
+        self.since = args.since
+        self.until = args.until
+        self.commands = list(args.io_commands or [])
+        self.device = args.io_device
+        self.pids = [int(i) for i in args.io_pids or []]
+        self.types = list(args.io_types or [])
+        self.projection = get_projection(args)
+
+    @property
+    def needed_columns(self):
+        """returns columns read to filter and output rows or None for all"""
+        if self.projection is None:
+            return None
+        columns = set(self.projection)
+        if self.commands:
+            columns.add(COMMAND)
+        if self.device:
+            columns.add(DEVICE_ID)
+        if self.pids:
+            columns.add(PROCESS_ID)
+        if self.types:
+            columns.add(IO_TYPE)
+        return frozenset(columns)
+
+    @property
+    def has_raw_filters(self):
+        return any([self.commands, self.device, self.pids, self.types])
+
+    def _string_masks(self, columns):
+        if self.device:
+            yield _mask_values(
+                lambda values: [v == self.device for v in values],
+                columns[DEVICE_ID])
+        if self.types:
+            yield _mask_values(
+                lambda values: [v in self.types for v in values],
+                columns[IO_TYPE])
+        if self.pids:
+            yield np.isin(np.asarray(columns[PROCESS_ID]), self.pids)
+        if self.commands:
+            yield _mask_values(
+                partial(_match_commands, self.commands), columns[COMMAND])
+
+    def mask(self, columns):
+        """returns mask for encoded string columns and PIDs or None"""
+        mask = None
+        for m in self._string_masks(columns):
+            mask = m if mask is None else mask & m
+        return mask
+
+    def raw_row_filter(self, columns):
+        """returns function to check split fields of a line or None"""
+        checks = []
+        if self.device and DEVICE_ID in columns:
+            i = columns.index(DEVICE_ID)
+            checks.append(lambda data: data[i] == self.device)
+        if self.types and IO_TYPE in columns:
+            j = columns.index(IO_TYPE)
+            types = frozenset(self.types)
+            checks.append(lambda data: data[j] in types)
+        if self.pids and PROCESS_ID in columns:
+            k = columns.index(PROCESS_ID)
+            pids = frozenset(str(i) for i in self.pids)
+            checks.append(lambda data: data[k] in pids)
+        if self.commands and COMMAND in columns:
+            n = columns.index(COMMAND)
+            checks.append(
+                lambda data: any(c in data[n] for c in self.commands))
+        if len(checks) == 0:
+            return None
+        return lambda data: all(check(data) for check in checks)
+
+    def frame_mask(self, df, pushed=False):
+        mask = None
+        if not pushed:
+            for m in self._string_masks(df):
+                mask = m if mask is None else mask & m
+        diff = df[START_TIME_STAMP_DIFF].values
+        if self.since is not None:
+            m = self.since <= diff
+            mask = m if mask is None else mask & m
+        if self.until is not None:
+            m = diff <= self.until
+            mask = m if mask is None else mask & m
+        return mask
+
+    def project(self, columns):
+        if self.projection is None:
+            return list(columns)
+        return [name for name in columns if name in self.projection]
+
+    def apply(self, df, pushed=False):
+        mask = self.frame_mask(df, pushed)
+        if mask is not None and not mask.all():
+            df = df[mask]
+        if self.projection is not None:
+            df = df[self.project(df.columns)]
+        return df
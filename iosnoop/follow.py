@@ -0,0 +1,41 @@
+import os
+import sys
+
+import matplotlib.pyplot as plt
+
+from .consts import PLOT_TYPE_HEATMAP
+from .heatmap import LiveHeatMap
+from .parser import Parser
+from .reader import STDIN, Tail
+from .utils import get_logger
+
+log = get_logger()
+
+
+def follow_data(args):
+    if args.plot_types != [PLOT_TYPE_HEATMAP]:
+        log.warning('follow mode draws %s only', PLOT_TYPE_HEATMAP)
+    parser = Parser(args)
+    heatmap = LiveHeatMap(args)
+    if args.backend != 'Agg':
+        plt.show(block=False)
+
+    if args.data == STDIN:
+        f = os.fdopen(sys.stdin.fileno(), 'rb', closefd=False)
+    else:
+        f = open(args.data, 'rb')
+    with f:
+        tail = Tail(f)
+        try:
+            while plt.fignum_exists(heatmap.fig.number):
+                rows = 0
+                for df in parser.parse_lines(tail.read_lines(args.refresh)):
+                    if len(df) > 0:
+                        heatmap.add(df)
+                        rows += len(df)
+                heatmap.update(changed=rows > 0)
+                if tail.eof and not tail.is_regular:
+                    log.info('end of %s, stop following', args.data)
+                    break
+        except KeyboardInterrupt:
+            pass
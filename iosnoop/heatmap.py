@@ -1,38 +1,112 @@
+import os
 from datetime import datetime, timedelta
 from functools import lru_cache
 
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
-import seaborn as sns
+from matplotlib.ticker import FuncFormatter, MaxNLocator
 
 from .consts import COMMAND, PROCESS_ID, IO_TYPE, DEVICE_ID
-from .consts import IO_LATENCY, START_TIME_STAMP_DIFF, START_LOCAL_TIME
-from .consts import LATENCY_BINS, TS_DIFF_BINS, LOCAL_TIME_BINS
+from .consts import DISK_BLOCK, IO_SIZE, IO_LATENCY, START_TIME_STAMP_DIFF
+from .consts import PLOT_TYPE_HEATMAP, PLOT_TYPE_OFFSET, PLOT_TYPE_SIZE
+from .consts import FOLLOW_X_MAX, RENDERER_SEABORN, Y_SCALE_LOG
+from .conditions import compile_condition
+from .histogram import Histogram2D, LinearAxis, LogAxis
+from .profiling import get_profiler
+from .pyramid import make_y_axis
 from .utils import get_logger, make_output_file
 
-sns.set()
 log = get_logger()
 
+_LOCAL_TIME_TICKS = 6
+_LOCAL_TIME_STEPS = [1, 2, 3, 6, 10]
+
+# y bins of block offsets unless --block-interval is set
+_OFFSET_BINS = 100
+# 1 GiB in sectors of 512 bytes when the maximum offset is not known
+_STREAM_BLOCK_INTERVAL = 2 ** 21
+# a bucket per power of 2 bytes from a sector, smaller sizes are in the first
+_SIZE_ERROR = 1.0
+_SIZE_LOWEST_EXPONENT = 9
+_BYTE_UNITS = ['', 'K', 'M', 'G']
+
+
+def mask_empty(values):
+    """bins without i/o are not colored"""
+    data = values.astype(np.float64)
+    data[values == 0] = np.nan
+    return data
+
+
+def format_bytes(value):
+    """
+    >>> format_bytes(512), format_bytes(4096), format_bytes(1572864)
+    ('512', '4K', '1.5M')
+    """
+    for unit in _BYTE_UNITS[:-1]:
+        if abs(value) < 1024:
+            return '%g%s' % (value, unit)
+        value /= 1024
+    return '%g%s' % (value, _BYTE_UNITS[-1])
+
+
+def bin_extent(axis, size, offset=0):
+    """values of edges, or indices of buckets for log scale"""
+    if isinstance(axis, LogAxis):
+        return offset, offset + size
+    edges = axis.edges(size, offset)
+    return edges[0], edges[-1]
+
+
+def bin_width(axis):
+    return 1 if isinstance(axis, LogAxis) else axis.interval
+
+
+def make_masks(conditions, df):
+    """view 0 counts all rows and others count rows of a condition"""
+    return [None] + [condition(df) for condition in conditions]
+
+
+@lru_cache(1)
+def import_seaborn():
+    # seaborn is slow to import and changes the style of all figures
+    import seaborn as sns
+    sns.set()
+    return sns
+
 
 class HeatMap:
+    """latency by time"""
 
-    def __init__(self, args, df):
+    plot_type = PLOT_TYPE_HEATMAP
+    x_column = START_TIME_STAMP_DIFF
+    y_column = IO_LATENCY
+    x_label = 'time (second)'
+    y_label = 'latency (millisecond)'
+    # x is time which is shown in local time with --basedate
+    time_x = True
+
+    def __init__(self, args, df, masks=None):
         self.args = args
         self.df = df
-        self.df[LATENCY_BINS] = pd.cut(
-            self.df[IO_LATENCY], bins=self.io_latency_bins, right=False)
-
-        if self.args.basedate is None:
-            self.df[TS_DIFF_BINS] = pd.cut(
-                self.df[START_TIME_STAMP_DIFF],
-                bins=self.time_stamp_bins, right=False)
+        self.conditions = [
+            compile_condition(cond) for cond in args.subplot_conditions
+        ]
+        self.histogram = self.make_histogram()
+        if masks is None:
+            self.add(df)
         else:
-            self.df[LOCAL_TIME_BINS] = pd.cut(
-                self.df[START_LOCAL_TIME],
-                bins=self.local_time_bins, right=False)
+            self.bin(df, masks)
+        self.fig = None
 
-        self.fig = plt.figure(figsize=self.figsize)
-        self.fig.suptitle(self.subtitle)
+    def make_figure(self, columns=1):
+        if self.args.renderer == RENDERER_SEABORN:
+            import_seaborn()
+        width, height = self.figsize
+        fig = plt.figure(figsize=(width * columns, height))
+        fig.suptitle(self.subtitle)
+        return fig
 
     @property
     @lru_cache(1)
@@ -40,6 +114,9 @@ class HeatMap:
         output = self.args.figoutput
         if output is None:
             output = make_output_file(self.args.data, 'png')
+        if self.args.separate_figures and len(self.args.plot_types) > 1:
+            root, ext = os.path.splitext(output)
+            output = '%s-%s%s' % (root, self.plot_type, ext)
         return output
 
     @property
@@ -79,68 +156,61 @@ class HeatMap:
 
     @property
     @lru_cache(1)
-    def io_latency_bins(self):
+    def y_axis(self):
         max_latency = self.max_io_latency
         log.info('maximum io latency: %f', max_latency)
+        if self.args.y_scale == Y_SCALE_LOG:
+            return LogAxis(self.args.y_error, max_latency)
         freq = self.args.y_interval
         if freq > max_latency:
             freq = max_latency / 10
-        return pd.interval_range(
-            start=0.0, end=max_latency + (2 * freq), freq=freq, closed='left')
+        return LinearAxis(freq, max_latency, extra=2)
 
     @property
     @lru_cache(1)
     def max_time_stamp_diff(self):
-        if self.args.x_max is not None:
+        if self.args.x_max is None:
+            return self.df[START_TIME_STAMP_DIFF].max()
+        if self.args.basedate is None:
             return self.args.x_max
-        return self.df[START_TIME_STAMP_DIFF].max()
+        # --x-max is the duration from the first row in local time
+        return self.df[START_TIME_STAMP_DIFF].iloc[0] + self.args.x_max
 
     @property
     @lru_cache(1)
-    def time_stamp_bins(self):
+    def x_axis(self):
         max_diff = self.max_time_stamp_diff
-        log.info('maximum time stamp diff: %f', max_diff)
         freq = self.args.x_interval
-        if freq > max_diff:
-            freq = max_diff / 100
-        return pd.interval_range(
-            start=0.0, end=max_diff + freq, freq=freq, closed='left')
-
-    @property
-    @lru_cache(1)
-    def max_local_time(self):
-        if self.args.x_max is not None:
-            x_max = timedelta(seconds=self.args.x_max)
-            return self.df[START_LOCAL_TIME][0] + x_max
-        return self.df[START_LOCAL_TIME].max()
-
-    @property
-    @lru_cache(1)
-    def local_time_bins(self):
-        max_time = self.max_local_time
-        log.info('maximum localtime: %s', max_time)
-        freq = timedelta(seconds=self.args.x_interval)
-        if self.args.basedate + freq > max_time:
-            interval = self.args.x_interval / 100
-            freq = timedelta(seconds=interval)
-        return pd.interval_range(
-            start=self.args.basedate, end=max_time + freq, freq=freq,
-            closed='left')
-
-    def reshape_data(self, df):
         if self.args.basedate is None:
-            columns_bins = TS_DIFF_BINS
-            columns = self.time_stamp_bins
+            log.info('maximum time stamp diff: %f', max_diff)
+            if freq > max_diff:
+                freq = max_diff / 100
         else:
-            columns_bins = LOCAL_TIME_BINS
-            columns = self.local_time_bins
-
-        pivot = df.pivot_table(
-            index=LATENCY_BINS, columns=columns_bins, values=IO_LATENCY,
-            aggfunc='count',
-        ).reindex(
-            index=self.io_latency_bins, columns=columns,
-        )
+            max_time = self.args.basedate + timedelta(seconds=max_diff)
+            log.info('maximum localtime: %s', max_time)
+            if freq > max_diff:
+                freq = self.args.x_interval / 100
+        return LinearAxis(freq, max_diff, extra=1)
+
+    def make_histogram(self):
+        return Histogram2D(self.x_axis, self.y_axis, len(self.conditions) + 1)
+
+    def bin(self, df, masks):
+        self.histogram.add(df[self.x_column], df[self.y_column], masks)
+
+    def add(self, df):
+        add_rows([self], df)
+
+    def reshape_histogram(self, view=0):
+        histogram = self.histogram
+        pivot = histogram.to_frame(view).replace(0, float('nan'))
+        if self.time_x and self.args.basedate is not None:
+            # labels of local time are made from the edges of x bins
+            edges = histogram.x_axis.edges(
+                histogram.shape[1], histogram.x_offset)
+            pivot.columns = pd.IntervalIndex.from_breaks(
+                [self.args.basedate + timedelta(seconds=i) for i in edges],
+                closed='left')
         if self.args.verbose:
             print(pivot)
         return pivot
@@ -150,6 +220,10 @@ class HeatMap:
         text = label.get_text()
         return text.split(',')[0].replace('[', '')
 
+    @staticmethod
+    def simplify_log_label(label):
+        return '%.3g' % float(HeatMap.simplify_label(label))
+
     @staticmethod
     def simplify_local_time(label):
         text = label.get_text()
@@ -159,25 +233,30 @@ class HeatMap:
         else:
             return time_str[1]
 
-    def set_axes(self, ax, title=None):
-        ax.invert_yaxis()
-        ax.set_title(title)
-
-        xlabel = 'time (second)'
+    def set_x_labels(self, ax):
         xticklabels = ax.get_xticklabels()
         if self.args.basedate is None:
-            ax.set_xlabel(xlabel)
+            ax.set_xlabel(self.x_label)
             ax.set_xticklabels(map(self.simplify_label, xticklabels))
         else:
             date_str = datetime.strftime(self.args.basedate, '%Y-%m-%d')
-            ax.set_xlabel(xlabel + '\n%s' % date_str)
+            ax.set_xlabel(self.x_label + '\n%s' % date_str)
             ax.set_xticklabels(map(self.simplify_local_time, xticklabels))
 
-        ax.set_ylabel('latency (millisecond)')
-        ax.set_yticklabels(map(self.simplify_label, ax.get_yticklabels()))
+    def set_axes(self, ax, title=None):
+        ax.invert_yaxis()
+        ax.set_title(title)
+        self.set_x_labels(ax)
+
+        ax.set_ylabel(self.y_label)
+        simplify_ylabel = self.simplify_label
+        if isinstance(self.histogram.y_axis, LogAxis):
+            simplify_ylabel = self.simplify_log_label
+        ax.set_yticklabels(map(simplify_ylabel, ax.get_yticklabels()))
         ax.xaxis.set_label_coords(1.10, -0.05)
 
     def make_heatmap(self, df, ax, vmax, title=None):
+        sns = import_seaborn()
         hm_ax = sns.heatmap(
             df,
             ax=ax,
@@ -189,26 +268,358 @@ class HeatMap:
         self.set_axes(hm_ax, title)
         return hm_ax
 
-    def generate_latency_heatmaps(self):
-        rows = len(self.args.subplot_conditions) + 1
-        normal = self.fig.add_subplot(rows, 1, 1)
-        normal_data = self.reshape_data(self.df)
-        vmax = normal_data.fillna(0).values.max()
-        self.make_heatmap(normal_data, normal, vmax, 'Normal')
-
-        for i, cond in enumerate(self.args.subplot_conditions, 2):
-            df = self.df[eval('self.df.' + cond)]
-            if len(df) == 0:
-                log.warn('no data with condition: %s', cond)
+    def format_local_time(self, x, pos=None):
+        local_time = self.args.basedate + timedelta(seconds=x)
+        return datetime.strftime(local_time, '%H:%M:%S')
+
+    def format_latency(self, y, pos=None):
+        # y is an index of buckets in log scale
+        lower = self.histogram.y_axis.edges(0, int(y))[0]
+        return '%.3g' % lower
+
+    def set_image_x_axis(self, ax):
+        if self.args.basedate is None:
+            ax.set_xlabel(self.x_label)
+        else:
+            date_str = datetime.strftime(self.args.basedate, '%Y-%m-%d')
+            ax.set_xlabel(self.x_label + '\n%s' % date_str)
+            ax.xaxis.set_major_formatter(FuncFormatter(self.format_local_time))
+            # labels of local time are wider than seconds
+            ax.xaxis.set_major_locator(MaxNLocator(
+                nbins=_LOCAL_TIME_TICKS, steps=_LOCAL_TIME_STEPS,
+                integer=True))
+
+    def set_image_axes(self, ax, title):
+        ax.set_title(title)
+        ax.grid(False)
+        self.set_image_x_axis(ax)
+        ax.set_ylabel(self.y_label)
+        if isinstance(self.histogram.y_axis, LogAxis):
+            ax.yaxis.set_major_formatter(FuncFormatter(self.format_latency))
+            ax.yaxis.set_major_locator(MaxNLocator(integer=True))
+        ax.xaxis.set_label_coords(1.10, -0.05)
+
+    @property
+    def image_extent(self):
+        """values of bins, or index of buckets in log scale"""
+        histogram = self.histogram
+        rows, cols = histogram.shape
+        x_begin, x_end = bin_extent(histogram.x_axis, cols, histogram.x_offset)
+        y_begin, y_end = bin_extent(histogram.y_axis, rows)
+        return x_begin, x_end, y_begin, y_end
+
+    @property
+    def image_aspect(self):
+        if not self.args.square:
+            return 'auto'
+        # width / height of a bin in data units draws square bins
+        histogram = self.histogram
+        return bin_width(histogram.x_axis) / bin_width(histogram.y_axis)
+
+    def make_image(self, ax):
+        image = ax.imshow(
+            np.full((1, 1), np.nan), aspect=self.image_aspect,
+            origin='lower', cmap=self.args.colormap,
+            interpolation='nearest',
+        )
+        self.fig.colorbar(image, ax=ax)
+        return image
+
+    def draw_image(self, view, ax, vmax, title=None):
+        """draws the counts as one image instead of a cell per bin"""
+        image = self.make_image(ax)
+        values = self.histogram.values[view]
+        image.set_data(mask_empty(values))
+        image.set_extent(self.image_extent)
+        # the lowest count is the bottom of the color map like seaborn
+        counts = values[values > 0]
+        vmin = counts.min() if len(counts) > 0 else 0
+        image.set_clim(vmin, vmax)
+        self.set_image_axes(ax, title)
+        if self.args.verbose:
+            print(self.reshape_histogram(view))
+        return image
+
+    def draw_view(self, view, ax, vmax, title=None):
+        if self.args.renderer == RENDERER_SEABORN:
+            data = self.reshape_histogram(view)
+            return self.make_heatmap(data, ax, vmax, title)
+        return self.draw_image(view, ax, vmax, title)
+
+    def generate_heatmaps(self, columns=1, column=0):
+        """draws views in the column of a grid of subplots"""
+        rows = self.histogram.views
+        vmax = float(self.histogram.values[0].max())
+        titles = ['Normal'] + self.args.subplot_conditions
+        for view, title in enumerate(titles):
+            if view > 0 and self.histogram.total(view) == 0:
+                log.warn('no data with condition: %s', title)
                 continue
-            ax = self.fig.add_subplot(rows, 1, i)
-            data = self.reshape_data(df)
-            self.make_heatmap(data, ax, vmax, cond)
+            if columns > 1:
+                title = '%s: %s' % (self.plot_type, title)
+            ax = self.fig.add_subplot(
+                rows, columns, view * columns + column + 1)
+            self.draw_view(view, ax, vmax, title)
+
+    def save(self):
+        if self.args.backend == 'Agg':
+            with get_profiler().stage('save') as stage:
+                self.fig.savefig(self.output)
+                stage.add(size=os.path.getsize(self.output))
+        else:
+            plt.show()
 
     def render(self):
-        self.generate_latency_heatmaps()
+        if self.fig is None:
+            self.fig = self.make_figure()
+        with get_profiler().stage('draw'):
+            self.generate_heatmaps()
+            plt.subplots_adjust(hspace=self.args.hspace)
+        self.save()
+
+
+class OffsetHeatMap(HeatMap):
+    """block offsets by time, sequential i/o draws lines"""
+
+    plot_type = PLOT_TYPE_OFFSET
+    y_column = DISK_BLOCK
+    y_label = 'block offset (sector)'
+
+    @property
+    @lru_cache(1)
+    def max_block(self):
+        return self.df[DISK_BLOCK].max()
+
+    @property
+    @lru_cache(1)
+    def y_axis(self):
+        max_block = self.max_block
+        interval = self.args.block_interval
+        if interval is None:
+            interval = _STREAM_BLOCK_INTERVAL
+            if max_block is not None:
+                interval = max(1, np.ceil(max_block / _OFFSET_BINS))
+        log.info('interval of block offset: %d', interval)
+        return LinearAxis(interval, max_block, extra=1)
+
+
+class SizeHeatMap(HeatMap):
+    """latency by i/o size in a bucket per power of 2 bytes"""
+
+    plot_type = PLOT_TYPE_SIZE
+    x_column = IO_SIZE
+    x_label = 'i/o size (byte)'
+    time_x = False
+
+    @property
+    @lru_cache(1)
+    def max_io_size(self):
+        return self.df[IO_SIZE].max()
+
+    @property
+    @lru_cache(1)
+    def x_axis(self):
+        return LogAxis(
+            _SIZE_ERROR, self.max_io_size, lowest=_SIZE_LOWEST_EXPONENT)
+
+    def simplify_size(self, label):
+        return format_bytes(float(self.simplify_label(label)))
+
+    def set_x_labels(self, ax):
+        ax.set_xlabel(self.x_label)
+        ax.set_xticklabels(map(self.simplify_size, ax.get_xticklabels()))
+
+    def format_size(self, x, pos=None):
+        # x is an index of buckets in log scale
+        return format_bytes(self.histogram.x_axis.edges(0, int(x))[0])
+
+    def set_image_x_axis(self, ax):
+        ax.set_xlabel(self.x_label)
+        ax.xaxis.set_major_formatter(FuncFormatter(self.format_size))
+        ax.xaxis.set_major_locator(MaxNLocator(integer=True))
+
+
+class StreamHeatMap(HeatMap):
+
+    def __init__(self, args):
+        self.args = args
+        self.conditions = [
+            compile_condition(cond) for cond in args.subplot_conditions
+        ]
+        self.histogram = self.make_histogram()
+        self.fig = None
+
+    @property
+    def x_axis(self):
+        return LinearAxis(self.args.x_interval, self.args.x_max, extra=1)
+
+    @property
+    def y_axis(self):
+        if self.args.y_scale == Y_SCALE_LOG:
+            return LogAxis(self.args.y_error, self.args.y_max)
+        return LinearAxis(self.args.y_interval, self.args.y_max, extra=2)
+
+
+class StreamOffsetHeatMap(OffsetHeatMap, StreamHeatMap):
+    max_block = None
+
+
+class StreamSizeHeatMap(SizeHeatMap, StreamHeatMap):
+    max_io_size = None
+
+
+class PyramidHeatMap(HeatMap):
+    """heatmap of summed tiles of a pyramid, rows are not read"""
+
+    def __init__(self, args, pyramid):
+        self.args = args
+        self.pyramid = pyramid
+        self.window = pyramid.window_stats(args.since, args.until)
+        self.histogram = self.make_histogram()
+        self.fig = None
+
+    def make_histogram(self):
+        return Histogram2D(self.x_axis, self.y_axis, self.pyramid.views)
+
+    @property
+    @lru_cache(1)
+    def max_io_latency(self):
+        if self.args.y_max is not None:
+            return self.args.y_max
+        return self.window[2]
+
+    @property
+    @lru_cache(1)
+    def y_axis(self):
+        # y bins are those of the pyramid even if the window is narrower
+        max_latency = self.max_io_latency
+        log.info('maximum io latency: %f', max_latency)
+        return make_y_axis(self.args, self.pyramid.y_interval, max_latency)
+
+    @property
+    @lru_cache(1)
+    def max_time_stamp_diff(self):
+        first_diff, max_diff, _ = self.window
+        if self.args.x_max is None:
+            return max_diff
+        if self.args.basedate is None:
+            return self.args.x_max
+        return first_diff + self.args.x_max
+
+    @property
+    def level(self):
+        return self.pyramid.select(
+            self.x_axis.interval, self.args.since, self.args.until)
+
+    def fill(self, level):
+        with get_profiler().stage('bin'):
+            self.pyramid.fill(
+                self.histogram, level, self.args.since, self.args.until)
+
+
+class LiveHeatMap(StreamHeatMap):
+
+    def __init__(self, args):
+        super().__init__(args)
+        self.fig = self.make_figure()
+        # the window bounds cost of a redraw, which sends all bins
+        x_max = FOLLOW_X_MAX if args.x_max is None else args.x_max
+        self.window = max(1, int(round(x_max / args.x_interval)))
+        self.images = []
+        for i, title in enumerate(['Normal'] + args.subplot_conditions, 1):
+            ax = self.fig.add_subplot(self.histogram.views, 1, i)
+            image = self.make_image(ax)
+            self.set_image_axes(ax, title)
+            self.images.append(image)
         plt.subplots_adjust(hspace=self.args.hspace)
+
+    @property
+    def x_axis(self):
+        # --x-max is the width of the sliding window in follow mode
+        return LinearAxis(self.args.x_interval, extra=1)
+
+    def slide(self):
+        cols = self.histogram.shape[1] - self.window
+        if cols > 0:
+            self.histogram.discard(cols)
+
+    def update(self, changed=True):
+        """redraws bins if rows were added, a window keeps handling events"""
+        histogram = self.histogram
+        if not changed or histogram.shape[0] == 0:
+            if self.args.backend != 'Agg':
+                self.fig.canvas.flush_events()
+            return
+
+        self.slide()
+        vmax = max(1, histogram.values[0].max())
+        extent = self.image_extent
+        for view, image in enumerate(self.images):
+            values = histogram.values[view]
+            image.set_data(mask_empty(values))
+            image.set_extent(extent)
+            image.set_clim(0, vmax)
+
         if self.args.backend == 'Agg':
             self.fig.savefig(self.output)
         else:
-            plt.show()
+            self.fig.canvas.draw_idle()
+            self.fig.canvas.flush_events()
+
+
+HEATMAPS = {
+    PLOT_TYPE_HEATMAP: HeatMap,
+    PLOT_TYPE_OFFSET: OffsetHeatMap,
+    PLOT_TYPE_SIZE: SizeHeatMap,
+}
+
+STREAM_HEATMAPS = {
+    PLOT_TYPE_HEATMAP: StreamHeatMap,
+    PLOT_TYPE_OFFSET: StreamOffsetHeatMap,
+    PLOT_TYPE_SIZE: StreamSizeHeatMap,
+}
+
+
+def make_heatmaps(args, df):
+    """bins rows into a heatmap per plot type in one pass over them"""
+    with get_profiler().stage('bin') as stage:
+        conditions = [
+            compile_condition(cond) for cond in args.subplot_conditions
+        ]
+        masks = make_masks(conditions, df)
+        heatmaps = [
+            HEATMAPS[plot_type](args, df, masks)
+            for plot_type in args.plot_types
+        ]
+        stage.add(rows=len(df))
+    return heatmaps
+
+
+def make_stream_heatmaps(args):
+    return [STREAM_HEATMAPS[plot_type](args) for plot_type in args.plot_types]
+
+
+def add_rows(heatmaps, df):
+    """bins a chunk of rows, masks of conditions are shared by heatmaps"""
+    with get_profiler().stage('bin') as stage:
+        masks = make_masks(heatmaps[0].conditions, df)
+        for heatmap in heatmaps:
+            heatmap.bin(df, masks)
+        stage.add(rows=len(df))
+
+
+def render_heatmaps(args, heatmaps):
+    """draws heatmaps as columns of a figure or a figure per plot type"""
+    if len(heatmaps) == 1 or args.separate_figures:
+        for heatmap in heatmaps:
+            heatmap.render()
+        return
+
+    first = heatmaps[0]
+    fig = first.make_figure(columns=len(heatmaps))
+    with get_profiler().stage('draw'):
+        for column, heatmap in enumerate(heatmaps):
+            heatmap.fig = fig
+            heatmap.generate_heatmaps(len(heatmaps), column)
+        plt.subplots_adjust(hspace=args.hspace)
+    first.save()
@@ -0,0 +1,353 @@
+import numpy as np
+import pandas as pd
+
+_INITIAL_BINS = 64
+
+# values under 2 ** _LOWEST_EXPONENT fall into the first bucket of log axis,
+# LATms of iosnoop has a resolution of 0.01 millisecond
+_LOWEST_EXPONENT = -7
+
+
+class LinearAxis:
+    """
+    >>> axis = LinearAxis(50.0, extra=2)
+    >>> axis.index(np.array([0.0, 49.9, 50.0, 120.0])).tolist()
+    [0, 0, 1, 2]
+    >>> axis.size(84.14)
+    3
+    >>> axis.edges(3).tolist()
+    [0.0, 50.0, 100.0, 150.0]
+    """
+
+    def __init__(self, interval, maximum=None, extra=1):
+        self.interval = interval
+        self.maximum = maximum
+        self.extra = extra
+
+    @property
+    def fixed_size(self):
+        if self.maximum is None:
+            return None
+        return self.size(self.maximum)
+
+    def size(self, maximum):
+        return int(maximum // self.interval) + self.extra
+
+    def index(self, values):
+        return np.floor(
+            np.asarray(values, dtype=np.float64) / self.interval
+        ).astype(np.int64)
+
+    def edges(self, size, offset=0):
+        return (np.arange(size + 1) + offset) * self.interval
+
+    def intervals(self, size, offset=0):
+        return pd.IntervalIndex.from_breaks(
+            self.edges(size, offset), closed='left')
+
+
+class LogAxis:
+    """
+    buckets with a fixed relative error like HDR histograms, each power of 2
+    is split into linear sub buckets, so that the number of buckets grows
+    only logarithmically with the maximum and the same axis always gives the
+    same buckets, histograms can be merged by adding counts
+
+    >>> axis = LogAxis(0.25)
+    >>> axis.sub_buckets
+    4
+    >>> axis.index(np.array([0.0, 0.005, 1.0, 1.3, 1.9, 2.0])).tolist()
+    [0, 0, 29, 30, 32, 33]
+    >>> axis.edges(33)[29:].tolist()
+    [1.0, 1.25, 1.5, 1.75, 2.0]
+    >>> axis.size(2000.0)
+    73
+    """
+
+    def __init__(self, error, maximum=None, lowest=_LOWEST_EXPONENT):
+        self.error = error
+        self.maximum = maximum
+        self.lowest = lowest
+        self.sub_buckets = 2 ** max(0, int(np.ceil(np.log2(1 / error))))
+
+    @property
+    def fixed_size(self):
+        if self.maximum is None:
+            return None
+        return self.size(self.maximum)
+
+    def size(self, maximum):
+        return int(self.index(np.array([maximum]))[0]) + 1
+
+    def index(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        mantissa, exponent = np.frexp(values)
+        # values = (2 * mantissa) * 2 ** (exponent - 1), 1 <= 2 * mantissa < 2
+        octave = exponent.astype(np.int64) - 1 - self.lowest
+        sub = np.floor((2 * mantissa - 1) * self.sub_buckets).astype(np.int64)
+        index = octave * self.sub_buckets + sub + 1
+        index[values < 2.0 ** self.lowest] = 0
+        index[values < 0] = -1
+        return index
+
+    def edges(self, size, offset=0):
+        index = np.arange(size + 1) + offset - 1
+        octave, sub = np.divmod(np.maximum(index, 0), self.sub_buckets)
+        edges = np.ldexp(
+            1 + sub / self.sub_buckets, (octave + self.lowest).astype(int))
+        edges[index < 0] = 0.0
+        return edges
+
+    def intervals(self, size, offset=0):
+        return pd.IntervalIndex.from_breaks(
+            self.edges(size, offset), closed='left')
+
+
+class QuantileSketch:
+    """
+    mergeable quantile sketch which counts values in log buckets, quantiles
+    are the upper edges of buckets within the relative error of the axis,
+    only buckets which values fall into are kept
+
+    >>> sketch = QuantileSketch(LogAxis(0.01))
+    >>> sketch.add(np.arange(1, 1001, dtype=np.float64))
+    >>> other = QuantileSketch(LogAxis(0.01))
+    >>> other.add(np.array([5000.0]))
+    >>> sketch.merge(other)
+    >>> sketch.count, sketch.maximum
+    (1001, 5000.0)
+    >>> [round(sketch.quantile(q), 1) for q in [0.5, 0.99, 1.0]]
+    [502.0, 992.0, 5000.0]
+    """
+
+    def __init__(self, axis):
+        self.axis = axis
+        # bucket index to count
+        self.counts = {}
+        self.maximum = None
+
+    @property
+    def count(self):
+        return sum(self.counts.values())
+
+    def _update_max(self, maximum):
+        if self.maximum is None or self.maximum < maximum:
+            self.maximum = maximum
+
+    def add_counts(self, buckets, counts, maximum):
+        """adds counts of unique bucket indices"""
+        if len(buckets) == 0:
+            return
+        sketch_counts = self.counts
+        for bucket, count in zip(buckets.tolist(), counts.tolist()):
+            sketch_counts[bucket] = sketch_counts.get(bucket, 0) + count
+        self._update_max(maximum)
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        index = self.axis.index(values)
+        index = index[index >= 0]
+        if len(index) == 0:
+            return
+        buckets, counts = np.unique(index, return_counts=True)
+        self.add_counts(buckets, counts, float(values.max()))
+
+    def merge(self, other):
+        if other.maximum is None:
+            return
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self._update_max(other.maximum)
+
+    def quantiles(self, qs):
+        if len(self.counts) == 0:
+            return [None] * len(qs)
+        buckets = np.array(sorted(self.counts), dtype=np.int64)
+        cumulative = np.cumsum([self.counts[i] for i in buckets.tolist()])
+        ranks = np.maximum(1, np.ceil(np.asarray(qs) * cumulative[-1]))
+        selected = buckets[np.searchsorted(cumulative, ranks)]
+        uppers = self.axis.edges(int(selected.max()) + 1)[selected + 1]
+        return [float(i) for i in np.minimum(uppers, self.maximum)]
+
+    def quantile(self, q):
+        return self.quantiles([q])[0]
+
+
+def count_bins(y_index, x_index, shape, masks=None):
+    """
+    counts (y, x) bin indices of rows for each view in one bincount,
+    a view is selected by a boolean mask and None means all rows
+
+    >>> count_bins(np.array([0, 1, 1]), np.array([0, 0, 1]), (2, 2),
+    ...            [None, np.array([False, True, True])]).tolist()
+    [[[1, 0], [1, 1]], [[0, 0], [1, 1]]]
+    """
+    if masks is None:
+        masks = [None]
+    rows, cols = shape
+    cells = rows * cols
+    flat = y_index * cols + x_index
+    indices = []
+    for view, mask in enumerate(masks):
+        selected = flat if mask is None else flat[mask]
+        indices.append(selected + view * cells)
+    counts = np.bincount(
+        np.concatenate(indices), minlength=len(masks) * cells)
+    return counts.reshape(len(masks), rows, cols)
+
+
+class Histogram2D:
+    """
+    count matrices indexed by (view, y, x) bins that grow while values are
+    added, all views share the axes and the view 0 counts all rows
+
+    >>> hist = Histogram2D(LinearAxis(1.0), LinearAxis(10.0, extra=2))
+    >>> hist.add([0.5, 0.7, 3.2], [5.0, 5.0, 25.0])
+    >>> hist.shape
+    (4, 4)
+    >>> hist.values[0].tolist()
+    [[2, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 1], [0, 0, 0, 0]]
+    """
+
+    def __init__(self, x_axis, y_axis, views=1):
+        self.x_axis = x_axis
+        self.y_axis = y_axis
+        self.x_max = None
+        self.y_max = None
+        self.x_offset = 0
+        self.counts = np.zeros(
+            (views, self._capacity(y_axis, 0), self._capacity(x_axis, 0)),
+            dtype=np.int64)
+
+    @staticmethod
+    def _capacity(axis, size):
+        fixed = axis.fixed_size
+        if fixed is not None:
+            return fixed
+        capacity = _INITIAL_BINS
+        while capacity < size:
+            capacity *= 2
+        return capacity
+
+    @staticmethod
+    def _size(axis, maximum):
+        fixed = axis.fixed_size
+        if fixed is not None:
+            return fixed
+        return axis.size(maximum)
+
+    @property
+    def views(self):
+        return self.counts.shape[0]
+
+    @property
+    def shape(self):
+        if self.x_max is None:
+            return 0, 0
+        cols = self._size(self.x_axis, self.x_max) - self.x_offset
+        return self._size(self.y_axis, self.y_max), max(0, cols)
+
+    @property
+    def values(self):
+        rows, cols = self.shape
+        return self.counts[:, :rows, :cols]
+
+    def total(self, view=0):
+        return self.values[view].sum()
+
+    def _grow(self, rows, cols):
+        views, y_cap, x_cap = self.counts.shape
+        if rows <= y_cap and cols <= x_cap:
+            return
+        counts = np.zeros(
+            (views,
+             max(y_cap, self._capacity(self.y_axis, rows)),
+             max(x_cap, self._capacity(self.x_axis, cols))),
+            dtype=np.int64)
+        counts[:, :y_cap, :x_cap] = self.counts
+        self.counts = counts
+
+    def _update_max(self, x, y):
+        x_max = x.max()
+        y_max = y.max()
+        if self.x_max is None or self.x_max < x_max:
+            self.x_max = x_max
+        if self.y_max is None or self.y_max < y_max:
+            self.y_max = y_max
+
+    def add(self, x, y, masks=None):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        x_index = self.x_axis.index(x)
+        y_index = self.y_axis.index(y)
+        if self.x_offset > 0:
+            x_index -= self.x_offset
+        valid = (x_index >= 0) & (y_index >= 0)
+        if self.x_axis.fixed_size is not None:
+            valid &= x_index < self.x_axis.fixed_size - self.x_offset
+        if self.y_axis.fixed_size is not None:
+            valid &= y_index < self.y_axis.fixed_size
+        if not valid.all():
+            x, y = x[valid], y[valid]
+            x_index, y_index = x_index[valid], y_index[valid]
+            if masks is not None:
+                masks = [m if m is None else m[valid] for m in masks]
+        if len(x) == 0:
+            return
+
+        self._update_max(x, y)
+        rows, cols = self.shape
+        self._grow(rows, cols)
+        self.counts[:, :rows, :cols] += count_bins(
+            y_index, x_index, (rows, cols), masks)
+
+    def discard(self, cols):
+        """drop the oldest columns to keep a sliding window of the x axis"""
+        if cols <= 0:
+            return
+        if cols < self.counts.shape[2]:
+            self.counts[:, :, :-cols] = self.counts[:, :, cols:]
+            self.counts[:, :, -cols:] = 0
+        else:
+            self.counts[:] = 0
+        self.x_offset += cols
+
+    def merge(self, other):
+        rows, cols = other.shape
+        if rows == 0:
+            return
+        self._update_max(np.array([other.x_max]), np.array([other.y_max]))
+        self._grow(*self.shape)
+        self.counts[:, :rows, :cols] += other.values
+
+    def add_counts(self, counts, x_max, y_max, col=0):
+        """adds counts of bins of the same axes from the column col"""
+        y_fixed = self.y_axis.fixed_size
+        x_fixed = self.x_axis.fixed_size
+        if y_fixed is not None:
+            counts = counts[:, :y_fixed]
+        if x_fixed is not None:
+            counts = counts[:, :, :max(0, x_fixed - self.x_offset - col)]
+        if not counts[0].any():
+            return
+        self._update_max(np.array([x_max]), np.array([y_max]))
+        rows, cols = self.shape
+        self._grow(rows, col + counts.shape[2])
+        _, y_size, x_size = counts.shape
+        self.counts[:, :y_size, col:col + x_size] += counts
+
+    def padded(self, shape, view=0):
+        values = np.zeros(shape, dtype=np.int64)
+        y_size, x_size = (min(i, j) for i, j in zip(shape, self.shape))
+        values[:y_size, :x_size] = self.values[view, :y_size, :x_size]
+        return values
+
+    def to_frame(self, view=0, shape=None):
+        if shape is None:
+            shape = self.shape
+        rows, cols = shape
+        return pd.DataFrame(
+            self.padded(shape, view),
+            index=self.y_axis.intervals(rows),
+            columns=self.x_axis.intervals(cols, self.x_offset),
+        )
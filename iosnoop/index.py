@@ -0,0 +1,199 @@
+import mmap
+import os
+import re
+from bisect import bisect_right
+from functools import lru_cache
+
+import numpy as np
+
+from .cache import evict_cache, get_cache_dir, make_key
+from .consts import LOG_DESCRIPTION, START_TIME_STAMP
+from .reader import can_split
+from .utils import get_logger
+
+log = get_logger()
+
+# bytes of a block which has range of STARTs in the index
+INDEX_BLOCK_SIZE = 1024 * 1024
+
+_INDEX_SUFFIX = '.index.npz'
+
+_NOT_DATA_LINE = re.compile(rb'^[^\d\s][^\n]*', re.MULTILINE)
+_LOG_DESCRIPTION = re.compile(LOG_DESCRIPTION, re.IGNORECASE)
+
+
+def scan_headers(mm):
+    """returns offsets and columns of headers in the file"""
+    offsets, headers = [], []
+    for match in _NOT_DATA_LINE.finditer(mm):
+        line = match.group().decode()
+        if re.search(_LOG_DESCRIPTION, line):
+            continue
+        offsets.append(match.start())
+        headers.append(line.split())
+    return offsets, headers
+
+
+@lru_cache(maxsize=None)
+def _field_pattern(position):
+    return re.compile(
+        rb'^(?:\S+[ \t]+){%d}(\d[^\s]*)' % position, re.MULTILINE)
+
+
+class TimeIndex:
+    """
+    sparse index from STARTs to byte offsets of the file, each block keeps
+    minimum and maximum STARTs since iosnoop prints rows in completion order
+    """
+
+    def __init__(self, offsets, minimums, maximums, header_offsets, headers,
+                 first_start):
+        self.offsets = offsets
+        self.minimums = minimums
+        self.maximums = maximums
+        self.header_offsets = header_offsets
+        self.headers = headers
+        self.first_start = first_start
+
+    @classmethod
+    def build(cls, mm, size, block_size=INDEX_BLOCK_SIZE):
+        header_offsets, headers = scan_headers(mm)
+        offsets, minimums, maximums = [], [], []
+        first_start = None
+        start = 0
+        while start < size:
+            end = mm.find(b'\n', min(start + block_size, size) - 1)
+            end = size if end < 0 else end + 1
+
+            i = bisect_right(header_offsets, start) - 1
+            # a header in the block changes the position of STARTs
+            j = bisect_right(header_offsets, end - 1) - 1
+            values = []
+            for k in range(max(i, 0), j + 1):
+                if START_TIME_STAMP not in headers[k]:
+                    continue
+                position = headers[k].index(START_TIME_STAMP)
+                begin = max(start, header_offsets[k])
+                stop = end
+                if k + 1 < len(header_offsets):
+                    stop = min(end, header_offsets[k + 1])
+                values.extend(
+                    _field_pattern(position).findall(mm, begin, stop))
+
+            if len(values) > 0:
+                starts = np.array(values).astype(np.float64)
+                if first_start is None:
+                    first_start = starts[0]
+                offsets.append(start)
+                minimums.append(starts.min())
+                maximums.append(starts.max())
+            start = end
+        offsets.append(size)
+        return cls(
+            np.array(offsets, dtype=np.int64),
+            np.array(minimums, dtype=np.float64),
+            np.array(maximums, dtype=np.float64),
+            header_offsets, headers, first_start,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as npz:
+            headers = [str(i).split() for i in npz['headers']]
+            return cls(
+                npz['offsets'], npz['minimums'], npz['maximums'],
+                npz['header_offsets'].tolist(), headers,
+                npz['first_start'].item(),
+            )
+
+    def save(self, path):
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            np.savez(
+                f, offsets=self.offsets, minimums=self.minimums,
+                maximums=self.maximums,
+                header_offsets=np.array(self.header_offsets, dtype=np.int64),
+                headers=np.array([' '.join(i) for i in self.headers]),
+                first_start=np.array(self.first_start),
+            )
+        os.rename(tmp, path)
+
+    def columns_at(self, offset):
+        i = bisect_right(self.header_offsets, offset) - 1
+        if i < 0:
+            return None
+        return self.headers[i]
+
+    def ranges(self, since=None, until=None):
+        """returns byte ranges which may contain rows in the window"""
+        selected = np.ones(len(self.minimums), dtype=bool)
+        if since is not None:
+            selected &= self.first_start + since <= self.maximums
+        if until is not None:
+            selected &= self.minimums <= self.first_start + until
+
+        ranges = []
+        for i in np.flatnonzero(selected):
+            start, end = self.offsets[i], self.offsets[i + 1]
+            if len(ranges) > 0 and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+        return ranges
+
+
+def has_window(args):
+    return args.since is not None or args.until is not None
+
+
+def is_indexable(args):
+    return args.cache and has_window(args) and can_split(args.data)
+
+
+def get_index(args):
+    cache_dir = args.cache_dir or get_cache_dir()
+    path = os.path.join(cache_dir, make_key(args.data) + _INDEX_SUFFIX)
+    if os.path.exists(path):
+        os.utime(path)  # for eviction by least recently used
+        return TimeIndex.load(path)
+
+    log.debug('build time index: %s', path)
+    with open(args.data, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            index = TimeIndex.build(mm, size)
+    if index.first_start is None:
+        return None
+    os.makedirs(cache_dir, exist_ok=True)
+    index.save(path)
+    evict_cache(args)
+    return index
+
+
+def read_window(parser, size):
+    """yields lines of blocks which may contain rows in --since/--until"""
+    args = parser.args
+    index = get_index(args)
+    if index is None:
+        return
+
+    ranges = index.ranges(args.since, args.until)
+    log.debug('read %d ranges in time index', len(ranges))
+    parser.first_row = {START_TIME_STAMP: index.first_start}
+    with open(args.data, 'rb') as f:
+        for start, end in ranges:
+            parser._columns = index.columns_at(start)
+            f.seek(start)
+            rest = b''
+            remaining = end - start
+            while remaining > 0:
+                data = f.read(min(size, remaining))
+                if len(data) == 0:
+                    break
+                remaining -= len(data)
+                data = rest + data
+                cut = data.rfind(b'\n') + 1 if remaining > 0 else len(data)
+                rest = data[cut:]
+                yield data[:cut].decode().splitlines(keepends=True)
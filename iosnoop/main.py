@@ -1,11 +1,27 @@
 import argparse
 import csv
 import logging
+import sys
 
-from .consts import PLOT_TYPES, PLOT_TYPE_HEATMAP
-from .consts import SUB_COMMAND_CSV, SUB_COMMAND_PLOT
+from .consts import PLOT_TYPES, PLOT_TYPE_HEATMAP, Y_SCALES, Y_SCALE_LINEAR
+from .consts import FOLLOW_X_MAX, PLOT_TYPE_OFFSET, PLOT_TYPE_SIZE
+from .consts import RENDERERS, RENDERER_IMAGE, RENDERER_SEABORN
+from .consts import SUB_COMMAND_CSV, SUB_COMMAND_EXPORT
+from .consts import SUB_COMMAND_PLOT, SUB_COMMAND_RECORD, SUB_COMMAND_STATS
+from .consts import SUB_COMMAND_SLOWEST
+from .consts import COMMAND, DEVICE_ID, IO_TYPE
+from .conditions import ConditionError, compile_condition
+from .consts import SOURCE
 from .csv import write_csv
-from .utils import get_logger, parse_datetime
+from .export import EXPORT_FORMATS, EXPORT_FORMAT_NPY, write_export
+from .profiling import PROFILE_FORMATS, PROFILE_FORMAT_TEXT, profile
+from .record import MAX_IN_FLIGHT, RECORD_FORMATS
+from .record import RECORD_FORMAT_NPY, RECORD_FORMAT_TEXT
+from .record import TRACE_PIPE, write_record
+from .slowest import write_slowest
+from .sources import expand_data
+from .stats import STATS_FORMATS, STATS_FORMAT_CSV, write_stats
+from .utils import CommandError, get_logger, parse_datetime
 
 __version__ = '0.1.0'
 _DATETIME_FORMAT_HELP = 'yyyymmddHHMISS'
@@ -41,6 +57,14 @@ def sep_type(s):
         raise argparse.ArgumentTypeError('separator is wrong')
 
 
+def condition_type(s):
+    try:
+        compile_condition(s)
+    except ConditionError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return s.strip()
+
+
 def parse_csv_argument(subparsers):
     csv_parser = subparsers.add_parser(SUB_COMMAND_CSV)
     csv_parser.set_defaults(
@@ -62,6 +86,24 @@ def parse_csv_argument(subparsers):
     )
 
 
+def parse_export_argument(subparsers):
+    export_parser = subparsers.add_parser(SUB_COMMAND_EXPORT)
+    export_parser.set_defaults(
+        format=EXPORT_FORMAT_NPY,
+        output=None,
+    )
+    export_parser.add_argument(
+        '--format', action='store', choices=EXPORT_FORMATS,
+        help='set binary format ("%s" by default), "%s" writes a directory '
+             'of .npy files per column, parquet/feather need pyarrow' % (
+                 EXPORT_FORMAT_NPY, EXPORT_FORMAT_NPY)
+    )
+    export_parser.add_argument(
+        '--output', action='store',
+        help='set path to export parsed columns of iosnoop',
+    )
+
+
 def parse_plot_argument(subparsers):
     plot_parser = subparsers.add_parser(SUB_COMMAND_PLOT)
     plot_parser.set_defaults(
@@ -69,20 +111,35 @@ def parse_plot_argument(subparsers):
         colormap='Reds',
         figoutput=None,
         figsize=None,
+        follow=False,
         hspace=0.6,
         square=False,
+        stream=False,
         subplot_conditions=[],
         x_interval=1.0,
         x_max=None,
+        y_error=0.1,
         y_interval=50.0,
         y_max=None,
-        plot_type=PLOT_TYPE_HEATMAP,
+        y_scale=Y_SCALE_LINEAR,
+        plot_types=[PLOT_TYPE_HEATMAP],
+        pyramid=False,
+        refresh=1.0,
+        renderer=RENDERER_IMAGE,
+        block_interval=None,
+        separate_figures=False,
     )
     plot_parser.add_argument(
         '--backend', action='store',
         help='set backend for matplotlib, '
              'use TkAgg to monitor in the foreground',
     )
+    plot_parser.add_argument(
+        '--block-interval', action='store', dest='block_interval',
+        type=positive_float_type,
+        help='set interval of block offset bins in sectors for "%s" plot, '
+             'it is fitted to the maximum offset by default' % PLOT_TYPE_OFFSET
+    )
     plot_parser.add_argument(
         '--colormap', action='store',
         help='set color map for seaborn heatmap'
@@ -95,22 +152,61 @@ def parse_plot_argument(subparsers):
         '--fig-size', action='store', dest='figsize', type=figsize_type,
         help='set figure size'
     )
+    plot_parser.add_argument(
+        '--follow', action='store_true',
+        help='keep reading appended data and redraw heatmap periodically, '
+             '--x-max is used as the width of sliding window (%d seconds by '
+             'default), it ends at the end of a pipe' % FOLLOW_X_MAX
+    )
     plot_parser.add_argument(
         '--hspace', action='store', type=float,
         help='set hspace for subplot'
     )
     plot_parser.add_argument(
-        '--plot-type', action='store', dest='plot_type', choices=PLOT_TYPES,
-        help='set plot type ("%s" by default) ' % PLOT_TYPE_HEATMAP
+        '--plot-type', action='store', dest='plot_types', choices=PLOT_TYPES,
+        nargs='+',
+        help='set plot types ("%s" by default), "%s" is latency by time, '
+             '"%s" is block offset by time and "%s" is latency by i/o size, '
+             'all of them are binned from rows parsed once and drawn as '
+             'columns of a figure' % (
+                 PLOT_TYPE_HEATMAP, PLOT_TYPE_HEATMAP, PLOT_TYPE_OFFSET,
+                 PLOT_TYPE_SIZE)
+    )
+    plot_parser.add_argument(
+        '--pyramid', action='store_true',
+        help='draw heatmap by summing time tiles of 1s, 10s, 1min, 10min '
+             'and 1h which are built in a pass over rows and stored in the '
+             'cache, so that another window or --x-interval does not read '
+             'rows again'
+    )
+    plot_parser.add_argument(
+        '--refresh', action='store', type=float,
+        help='set interval seconds to redraw heatmap in follow mode'
+    )
+    plot_parser.add_argument(
+        '--renderer', action='store', choices=RENDERERS,
+        help='set renderer of heatmap ("%s" by default), "%s" draws counts '
+             'as one image, "%s" draws a cell per bin with the former look '
+             'and is slow for many bins' % (
+                 RENDERER_IMAGE, RENDERER_IMAGE, RENDERER_SEABORN)
+    )
+    plot_parser.add_argument(
+        '--separate-figures', action='store_true', dest='separate_figures',
+        help='save a figure per plot type, the plot type is appended to '
+             'the file name'
     )
     plot_parser.add_argument(
         '--square', action='store_true',
         help='set square mode for heatmap'
     )
+    plot_parser.add_argument(
+        '--stream', action='store_true',
+        help='bin rows chunk by chunk to bound memory by the heatmap size'
+    )
     plot_parser.add_argument(
         '--subplot-conditions', dest='subplot_conditions', action='store',
-        nargs='+', type=lambda s: s.strip(),
-        help='set DataFrame conditions to filter',
+        nargs='+', type=condition_type,
+        help='set conditions on iosnoop columns to draw subplots',
     )
     plot_parser.add_argument(
         '--x-interval', action='store', dest='x_interval', type=float,
@@ -120,6 +216,11 @@ def parse_plot_argument(subparsers):
         '--x-max', action='store', dest='x_max', type=float,
         help='set maximum value for x-axis'
     )
+    plot_parser.add_argument(
+        '--y-error', action='store', dest='y_error', type=float,
+        help='set maximum relative error of y bins in log scale '
+             '(0.1 by default)'
+    )
     plot_parser.add_argument(
         '--y-interval', action='store', dest='y_interval', type=float,
         help='set value of interval for y bins'
@@ -128,13 +229,172 @@ def parse_plot_argument(subparsers):
         '--y-max', action='store', dest='y_max', type=float,
         help='set maximum value for y-axis'
     )
+    plot_parser.add_argument(
+        '--y-scale', action='store', dest='y_scale', choices=Y_SCALES,
+        help='set scale of y bins ("%s" by default), log scale keeps '
+             'a fixed relative error instead of --y-interval' % Y_SCALE_LINEAR
+    )
+
+
+def positive_float_type(s):
+    value = float(s)
+    if value <= 0:
+        raise argparse.ArgumentTypeError('set a positive number')
+    return value
+
+
+def parse_record_argument(subparsers):
+    record_parser = subparsers.add_parser(SUB_COMMAND_RECORD)
+    record_parser.set_defaults(
+        duration=None,
+        format=RECORD_FORMAT_TEXT,
+        max_in_flight=MAX_IN_FLIGHT,
+        output=None,
+    )
+    record_parser.add_argument(
+        '--duration', action='store', type=positive_float_type,
+        help='set seconds to record from %s, until Ctrl-C by default' %
+             TRACE_PIPE
+    )
+    record_parser.add_argument(
+        '--format', action='store', choices=RECORD_FORMATS,
+        help='set output format ("%s" by default), "%s" writes the same '
+             'output as iosnoop -ts, "%s" writes filtered columns as '
+             'export does' % (
+                 RECORD_FORMAT_TEXT, RECORD_FORMAT_TEXT, RECORD_FORMAT_NPY)
+    )
+    record_parser.add_argument(
+        '--max-in-flight', action='store', dest='max_in_flight',
+        type=positive_int_type,
+        help='set number of issued requests kept until completion, the '
+             'oldest one is dropped beyond it (%d by default)' % MAX_IN_FLIGHT
+    )
+    record_parser.add_argument(
+        '--output', action='store',
+        help='set path to save recorded i/o, "-" writes to stdout'
+    )
+
+
+def positive_int_type(s):
+    value = int(s)
+    if value <= 0:
+        raise argparse.ArgumentTypeError('set a positive integer')
+    return value
+
+
+def parse_slowest_argument(subparsers):
+    slowest_parser = subparsers.add_parser(SUB_COMMAND_SLOWEST)
+    slowest_parser.set_defaults(
+        format=STATS_FORMAT_CSV,
+        group_by=[],
+        interval=None,
+        neighbors=0,
+        output=None,
+        top=10,
+    )
+    slowest_parser.add_argument(
+        '--format', action='store', choices=STATS_FORMATS,
+        help='set output format ("%s" by default)' % STATS_FORMAT_CSV
+    )
+    slowest_parser.add_argument(
+        '--group-by', action='store', dest='group_by', nargs='*',
+        choices=[DEVICE_ID, IO_TYPE, COMMAND, SOURCE],
+        help='set columns to rank rows per group besides overall, '
+             '%s needs --source-column' % SOURCE
+    )
+    slowest_parser.add_argument(
+        '--interval', action='store', type=positive_float_type,
+        help='set seconds of interval to rank rows per time window'
+    )
+    slowest_parser.add_argument(
+        '--neighbors', action='store', type=int,
+        help='set number of i/o in flight on the same device to show with '
+             'each slow i/o, none by default'
+    )
+    slowest_parser.add_argument(
+        '--output', action='store',
+        help='set path to save slowest rows, "-" writes to stdout'
+    )
+    slowest_parser.add_argument(
+        '--top', action='store', type=positive_int_type,
+        help='set number of slowest rows to keep per group, default is 10'
+    )
+
+
+def parse_stats_argument(subparsers):
+    stats_parser = subparsers.add_parser(SUB_COMMAND_STATS)
+    stats_parser.set_defaults(
+        error=0.01,
+        format=STATS_FORMAT_CSV,
+        group_by=[DEVICE_ID, IO_TYPE, COMMAND],
+        interval=1.0,
+        output=None,
+    )
+    stats_parser.add_argument(
+        '--error', action='store', type=positive_float_type,
+        help='set maximum relative error of latency percentiles, '
+             'default is 0.01'
+    )
+    stats_parser.add_argument(
+        '--format', action='store', choices=STATS_FORMATS,
+        help='set output format ("%s" by default)' % STATS_FORMAT_CSV
+    )
+    stats_parser.add_argument(
+        '--group-by', action='store', dest='group_by', nargs='*',
+        choices=[DEVICE_ID, IO_TYPE, COMMAND, SOURCE],
+        help='set columns to break down stats, default is DEV TYPE COMM, '
+             '%s needs --source-column' % SOURCE
+    )
+    stats_parser.add_argument(
+        '--interval', action='store', type=positive_float_type,
+        help='set seconds of interval to aggregate, default is 1.0, an '
+             'interval is written once STARTs has moved past it by the '
+             'maximum latency or --reorder seconds, and rows which start in '
+             'it later are dropped and counted'
+    )
+    stats_parser.add_argument(
+        '--output', action='store',
+        help='set path to save stats, "-" writes to stdout'
+    )
+
+
+def set_data_files(args):
+    args.data_files = expand_data(args.data)
+    args.data = args.data_files[0]
+
+    basedates = args.basedate or [None]
+    if len(basedates) == 1:
+        basedates = basedates * len(args.data_files)
+    elif len(basedates) != len(args.data_files):
+        raise ValueError('set one --basedate or one per --data file')
+    args.basedates = basedates
+    args.basedate = basedates[0]
+    if args.basedate is not None:
+        args.basedate = min(basedates)
+
+    follow = args.subcommand == SUB_COMMAND_PLOT and args.follow
+    if follow and len(args.data_files) > 1:
+        raise ValueError('--follow reads only one --data file')
+    record = args.subcommand == SUB_COMMAND_RECORD
+    if record and len(args.data_files) > 1:
+        raise ValueError('record reads only one --data file')
 
 
 def parse_argument():
     parser = argparse.ArgumentParser()
     parser.set_defaults(
         basedate=None,
+        cache=True,
+        cache_dir=None,
+        cache_size=1024,
         data=None,
+        jobs=1,
+        profile=False,
+        profile_cprofile=None,
+        profile_format=PROFILE_FORMAT_TEXT,
+        profile_output=None,
+        profile_tracemalloc=False,
+        source_column=False,
         # filter options
         columns=[],
         io_commands=[],
@@ -146,13 +406,71 @@ def parse_argument():
         subcommand=None,
     )
     parser.add_argument(
-        '--basedate', action='store', type=dt_type,
+        '--basedate', action='append', type=dt_type,
         help='set base datetime to convert kernel timestamp to localtime,'
-             ' format: %s' % _DATETIME_FORMAT_HELP
+             ' format: %s, repeat it for each --data file to align clocks'
+             ' of hosts' % _DATETIME_FORMAT_HELP
+    )
+    parser.add_argument(
+        '--cache-dir', action='store', dest='cache_dir',
+        help='set directory to store parsed data, '
+             'default is ~/.cache/iosnoop-tool'
+    )
+    parser.add_argument(
+        '--cache-size', action='store', dest='cache_size', type=int,
+        help='set maximum size of cache directory in MiB, default is 1024'
+    )
+    parser.add_argument(
+        '--no-cache', action='store_false', dest='cache',
+        help='disable cache of parsed data'
     )
     parser.add_argument(
-        '--data', action='store', required=True,
-        help='set path to iosnoop output file',
+        '--data', action='append', required=True,
+        help='set path or glob pattern of iosnoop output files, repeat it '
+             'to merge rows of files in order of STARTs, '
+             '"-" reads from stdin, '
+             'gzip/xz/bzip2/zstd compressed file is decompressed',
+    )
+    parser.add_argument(
+        '--jobs', action='store', type=positive_int_type,
+        help='set number of processes to parse iosnoop output file'
+    )
+    parser.add_argument(
+        '--profile', action='store_true',
+        help='report wall time, rows/sec, bytes/sec and peak memory per '
+             'stage to stderr'
+    )
+    parser.add_argument(
+        '--profile-cprofile', action='store', dest='profile_cprofile',
+        help='set path to dump cProfile stats of the run'
+    )
+    parser.add_argument(
+        '--profile-format', action='store', dest='profile_format',
+        choices=PROFILE_FORMATS,
+        help='set format of --profile report ("%s" by default)'
+             % PROFILE_FORMAT_TEXT
+    )
+    parser.add_argument(
+        '--profile-output', action='store', dest='profile_output',
+        help='set path to save --profile report instead of stderr'
+    )
+    parser.add_argument(
+        '--profile-tracemalloc', action='store_true',
+        dest='profile_tracemalloc',
+        help='trace python allocations for peak memory per stage and top '
+             'allocations, it makes the run slower'
+    )
+    parser.add_argument(
+        '--reorder', action='store', type=positive_float_type,
+        metavar='SECONDS',
+        help='emit rows in order of STARTs instead of completion, a row is '
+             'held until a row starting SECONDS later is read, set it '
+             'longer than the maximum latency'
+    )
+    parser.add_argument(
+        '--source-column', action='store_true', dest='source_column',
+        help='add %s column with path of the file which a row comes from'
+             % SOURCE
     )
 
     # filter options
@@ -187,7 +505,11 @@ def parse_argument():
     subparsers = parser.add_subparsers(dest='subcommand')
     subparsers.required = True
     parse_csv_argument(subparsers)
+    parse_export_argument(subparsers)
     parse_plot_argument(subparsers)
+    parse_record_argument(subparsers)
+    parse_slowest_argument(subparsers)
+    parse_stats_argument(subparsers)
 
     # for debug
     parser.add_argument(
@@ -203,20 +525,47 @@ def parse_argument():
     if args.verbose:
         log.setLevel(logging.DEBUG)
 
-    return args
+    try:
+        set_data_files(args)
+    except ValueError as e:
+        parser.error(str(e))
 
+    # options of the report imply --profile
+    if args.profile_cprofile is not None or args.profile_output is not None:
+        args.profile = True
+    if args.profile_tracemalloc:
+        args.profile = True
 
-def main():
-    args = parse_argument()
-    log.debug(args)
+    return args
 
+
+def run(args):
     if args.subcommand == SUB_COMMAND_CSV:
         write_csv(args)
+    elif args.subcommand == SUB_COMMAND_EXPORT:
+        write_export(args)
     elif args.subcommand == SUB_COMMAND_PLOT:
         import matplotlib
         matplotlib.use(args.backend)
         from .plotter import plot_data
         plot_data(args)
+    elif args.subcommand == SUB_COMMAND_RECORD:
+        write_record(args)
+    elif args.subcommand == SUB_COMMAND_SLOWEST:
+        write_slowest(args)
+    elif args.subcommand == SUB_COMMAND_STATS:
+        write_stats(args)
+
+
+def main():
+    args = parse_argument()
+    log.debug(args)
+    try:
+        with profile(args):
+            run(args)
+    except CommandError as e:
+        log.error(e)
+        sys.exit(1)
 
 
 if __name__ == '__main__':
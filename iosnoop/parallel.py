@@ -0,0 +1,79 @@
+import mmap
+import os
+import re
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+
+from .index import scan_headers
+from .parser import Parser, concat_frames
+from .utils import get_logger
+
+log = get_logger()
+
+# bytes of a range parsed by a worker at once
+RANGE_SIZE = 64 * 1024 * 1024
+
+_DATA_LINE = re.compile(rb'^\d[^\n]*', re.MULTILINE)
+
+
+def split_ranges(mm, size, jobs):
+    """splits [0, size) into ranges that begin at the head of lines"""
+    chunks = max(jobs, -(-size // RANGE_SIZE))
+    step = max(1, size // chunks)
+    ranges = []
+    start = 0
+    while start < size:
+        end = mm.find(b'\n', min(start + step, size) - 1)
+        end = size if end < 0 else end + 1
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def parse_range(args, start, end, columns, first_row, pushdown, needed):
+    parser = Parser(args)
+    parser._columns = columns
+    parser.first_row = first_row
+    parser.pushdown = pushdown
+    parser.needed = needed
+    with open(args.data, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return concat_frames(parser.scan_buffer(data))
+
+
+def read_chunks(parser):
+    args = parser.args
+    with open(args.data, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offsets, headers = scan_headers(mm)
+            ranges = split_ranges(mm, size, args.jobs)
+
+            # the global first row is used to calculate STARTs_DIFF
+            first = _DATA_LINE.search(mm)
+            if first is None:
+                return
+            i = bisect_right(offsets, first.start()) - 1
+            if i < 0:
+                return
+            parser._columns = headers[i]
+            line = first.group().decode()
+            for _ in parser._parse_lines([line]):
+                pass
+
+    log.debug('parse %d ranges with %d jobs', len(ranges), args.jobs)
+    with ProcessPoolExecutor(args.jobs) as executor:
+        futures = []
+        for start, end in ranges:
+            i = bisect_right(offsets, start) - 1
+            columns = headers[i] if i >= 0 else None
+            futures.append(executor.submit(
+                parse_range, args, start, end, columns, parser.first_row,
+                parser.pushdown, parser.needed))
+        for future in futures:
+            df = future.result()
+            if df is not None:
+                yield df
@@ -1,13 +1,28 @@
+import mmap
+import os
 import re
 from collections import defaultdict
+from itertools import compress
 from datetime import timedelta
 
-from .consts import EXTRA_COLUMNS
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from .consts import EXTRA_COLUMNS, LOG_DESCRIPTION
+from .consts import COMMAND, IO_TYPE, DEVICE_ID
 from .consts import PROCESS_ID, DISK_BLOCK, IO_SIZE, IO_LATENCY
 from .consts import START_TIME_STAMP, END_TIME_STAMP
 from .consts import START_TIME_STAMP_DIFF, START_LOCAL_TIME
 
-from .filters import get_filters
+from .cache import cached_chunks, is_cacheable
+from .encoding import Dictionary
+from .filters import FilterPlan, get_filters
+from .index import is_indexable, read_window
+from .reader import can_split, open_data
+from .records import BATCH_ROWS, iter_batches
+from .scanner import find_fields, find_runs, find_tokens, split_blocks
+from .scanner import to_categorical, to_column
 from .utils import get_logger
 
 log = get_logger()
@@ -20,7 +35,62 @@ _IOSNOOP_DATA_TYPE[START_TIME_STAMP] = float
 _IOSNOOP_DATA_TYPE[END_TIME_STAMP] = float
 _IOSNOOP_DATA_TYPE[IO_LATENCY] = float
 
-_IOSNOOP_LOG_DESCRIPTION = re.compile(r'tracing', re.IGNORECASE)
+_IOSNOOP_COLUMN_DTYPE = defaultdict(lambda: object)
+_IOSNOOP_COLUMN_DTYPE[PROCESS_ID] = np.int64
+_IOSNOOP_COLUMN_DTYPE[DISK_BLOCK] = np.int64
+_IOSNOOP_COLUMN_DTYPE[IO_SIZE] = np.int64
+_IOSNOOP_COLUMN_DTYPE[START_TIME_STAMP] = np.float64
+_IOSNOOP_COLUMN_DTYPE[END_TIME_STAMP] = np.float64
+_IOSNOOP_COLUMN_DTYPE[IO_LATENCY] = np.float64
+
+_IOSNOOP_CATEGORY_COLUMNS = frozenset([COMMAND, IO_TYPE, DEVICE_ID])
+
+_IOSNOOP_LOG_DESCRIPTION = re.compile(LOG_DESCRIPTION, re.IGNORECASE)
+
+# size hint in bytes of lines read at once by the columnar parser
+READ_SIZE = 8 * 1024 * 1024
+
+
+def _is_data(field):
+    if field[0].isdigit():
+        return True
+    try:
+        float(field)
+    except ValueError:
+        return False
+    return True
+
+
+def _make_column(name, values):
+    if name in _IOSNOOP_CATEGORY_COLUMNS:
+        return pd.Categorical(values)
+    return np.array(values, dtype=_IOSNOOP_COLUMN_DTYPE[name])
+
+
+def concat_frames(frames):
+    frames = [df for df in frames if len(df) > 0]
+    if len(frames) == 0:
+        return None
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+
+    columns = {}
+    for name in frames[0].columns:
+        if isinstance(frames[0][name].dtype, pd.CategoricalDtype):
+            columns[name] = union_categoricals(
+                [df[name] for df in frames])
+        else:
+            columns[name] = np.concatenate(
+                [df[name].values for df in frames])
+    return pd.DataFrame(columns, columns=frames[0].columns)
+
+
+def log_late(late, window):
+    if late > 0:
+        log.warning(
+            '%d rows started over %s seconds before rows read earlier and '
+            'are out of order, --reorder should be longer than latency',
+            late, window)
 
 
 class Parser:
@@ -30,6 +100,17 @@ class Parser:
         self._columns = None
         self.first_row = None
         self.filters = get_filters(args)
+        self.plan = FilterPlan(args)
+        self._raw_filter = None
+        # string filters are evaluated on encoded columns while this is true
+        self.pushdown = False
+        # values of string columns are interned while reading
+        self.dictionaries = {
+            name: Dictionary() for name in _IOSNOOP_CATEGORY_COLUMNS}
+        # distinct values of parsed chunks are collected if it is set
+        self.unique_values = None
+        # columns converted by the columnar parser, None converts all
+        self.needed = None
 
     @property
     def columns(self):
@@ -38,9 +119,13 @@ class Parser:
             extra.remove(START_LOCAL_TIME)
         return self._columns + extra
 
+    @property
+    def output_columns(self):
+        return self.plan.project(self.columns)
+
     def _get_time_diff(self, row):
         if self.first_row is None:
-            return 0
+            return 0.0  # as the columnar parser computes it
         return row[START_TIME_STAMP] - self.first_row[START_TIME_STAMP]
 
     def _get_local_time(self, row):
@@ -61,10 +146,19 @@ class Parser:
 
             # expects header if line is not description
             self._columns = data
+            self._raw_filter = self.plan.raw_row_filter(data)
             return
         else:
+            if self._raw_filter is not None and self.first_row is not None:
+                if not self._raw_filter(data):
+                    return
+
             row = {}
             for i, col in enumerate(self._columns):
+                if col in _IOSNOOP_CATEGORY_COLUMNS:
+                    # rows share a string object per distinct value
+                    row[col] = self.dictionaries[col].intern(data[i])
+                    continue
                 type_factory = _IOSNOOP_DATA_TYPE[col]
                 row[col] = type_factory(data[i])
             row[START_TIME_STAMP_DIFF] = self._get_time_diff(row)
@@ -82,9 +176,303 @@ class Parser:
                 return False
         return True
 
+    def _read_lines(self):
+        if is_indexable(self.args):
+            for lines in read_window(self, READ_SIZE):
+                yield from lines
+            return
+
+        with open_data(self.args.data) as f:
+            yield from f
+
+    def _parse_rows(self):
+        for line in self._read_lines():
+            yield from self._parse(line)
+
+    def reorder_rows(self, rows):
+        """
+        yields rows in order of STARTs, a row is held until a row starting
+        --reorder seconds later is read, STARTs_DIFF is kept as it is
+        """
+        from .reorder import ReorderBuffer
+        buffer = ReorderBuffer(self.args.reorder)
+        for row in rows:
+            yield from buffer.push(row[START_TIME_STAMP], row)
+        yield from buffer.flush()
+        log_late(buffer.late, self.args.reorder)
+
     def parse(self):
-        with open(self.args.data) as f:
-            for line in f:
-                for row in self._parse(line):
-                    if self.filter(row):
-                        yield row
+        projection = self.plan.projection
+        rows = self._parse_rows()
+        if self.args.reorder is not None:
+            rows = self.reorder_rows(rows)
+        for row in rows:
+            if self.filter(row):
+                if projection is not None:
+                    row = {
+                        k: v for k, v in row.items() if k in projection
+                    }
+                yield row
+
+    def _tokenize(self, lines):
+        size = len(self._columns)
+        tokens = ''.join(lines).split()
+        if len(tokens) == len(lines) * size:
+            return tokens
+
+        tokens = []
+        for line in lines:
+            data = line.split()
+            if len(data) == 0:
+                continue
+            if len(data) != size:
+                log.debug('skip broken line: %s', line.strip())
+                continue
+            tokens.extend(data)
+        return tokens
+
+    def _set_first_row(self, tokens):
+        self.first_row = {
+            name: _make_column(name, [token])[0]
+            for name, token in zip(self._columns, tokens)
+        }
+
+    def _needed_fields(self):
+        return [
+            (i, name) for i, name in enumerate(self._columns)
+            if self.needed is None or name in self.needed
+        ]
+
+    def _make_frame(self, lines):
+        size = len(self._columns)
+        tokens = self._tokenize(lines)
+        if len(tokens) == 0:
+            return None
+
+        if self.first_row is None:
+            self._set_first_row(tokens[:size])
+        raw = {}
+        for i, name in self._needed_fields():
+            raw[name] = tokens[i::size]
+
+        # string columns are encoded first, so that filters on them compare
+        # integer codes before other columns are converted
+        columns = {}
+        for name in list(raw):
+            if name in _IOSNOOP_CATEGORY_COLUMNS:
+                columns[name] = self.dictionaries[name].encode(raw.pop(name))
+            elif name == PROCESS_ID:
+                columns[name] = _make_column(name, raw.pop(name))
+
+        if self.pushdown:
+            mask = self.plan.mask(columns)
+            if mask is not None:
+                columns = {
+                    name: values[mask] for name, values in columns.items()
+                }
+                raw = {
+                    name: list(compress(values, mask))
+                    for name, values in raw.items()
+                }
+
+        for name, values in raw.items():
+            columns[name] = _make_column(name, values)
+        return self._finish_frame(columns)
+
+    def make_rows_frame(self, columns, rows):
+        """
+        makes a frame of tuples of python values in order of columns, e.g.
+        i/o paired by the recorder, without formatting them as text
+        """
+        self._columns = list(columns)
+        if self.first_row is None:
+            self.first_row = dict(zip(columns, rows[0]))
+        values = dict(zip(columns, zip(*rows)))
+        frame_columns = {}
+        for name in columns:
+            if name in _IOSNOOP_CATEGORY_COLUMNS:
+                frame_columns[name] = self.dictionaries[name].encode(
+                    values[name])
+            else:
+                frame_columns[name] = _make_column(name, values[name])
+        return self.filter_frame(self._finish_frame(frame_columns))
+
+    def _scan_frame(self, buf, starts, ends):
+        """makes a frame of offsets of fields in a byte buffer"""
+        if self.first_row is None:
+            line = buf[starts[0, 0]:ends[0, -1]].tobytes()
+            self._set_first_row(line.decode().split())
+        fields = self._needed_fields()
+
+        columns = {}
+        for i, name in fields:
+            if name in _IOSNOOP_CATEGORY_COLUMNS:
+                columns[name] = to_categorical(
+                    buf, starts[:, i], ends[:, i], self.dictionaries[name])
+            elif name == PROCESS_ID:
+                columns[name] = to_column(
+                    buf, starts[:, i], ends[:, i], np.int64)
+
+        if self.pushdown:
+            mask = self.plan.mask(columns)
+            if mask is not None:
+                columns = {
+                    name: values[mask] for name, values in columns.items()
+                }
+                starts, ends = starts[mask], ends[mask]
+
+        for i, name in fields:
+            if name not in columns:
+                columns[name] = to_column(
+                    buf, starts[:, i], ends[:, i],
+                    _IOSNOOP_COLUMN_DTYPE[name])
+        return self._finish_frame(columns)
+
+    def _finish_frame(self, columns):
+        columns[START_TIME_STAMP_DIFF] = \
+            columns[START_TIME_STAMP] - self.first_row[START_TIME_STAMP]
+        return self.make_frame(columns)
+
+    def make_frame(self, columns):
+        if self.args.basedate is not None:
+            diff = columns[START_TIME_STAMP_DIFF]
+            delta = np.rint(diff * 1e6).astype('timedelta64[us]')
+            columns[START_LOCAL_TIME] = np.datetime64(
+                self.args.basedate, 'us') + delta
+        names = self.columns
+        if self.needed is not None:
+            names = [name for name in names if name in columns]
+        return pd.DataFrame(columns, columns=names, copy=False)
+
+    def _parse_lines(self, lines):
+        begin = 0
+        for i, line in enumerate(lines):
+            if line[:1].isdigit():
+                continue  # fast path for data row
+
+            data = line.split()
+            if len(data) == 0 or _is_data(data[0]):
+                continue
+
+            df = self._parse_data_lines(lines[begin:i])
+            if df is not None:
+                yield df
+            begin = i + 1
+
+            log.debug(line.strip())
+            if re.search(_IOSNOOP_LOG_DESCRIPTION, line):
+                continue  # description
+
+            # expects header if line is not description
+            self._columns = data
+
+        df = self._parse_data_lines(lines[begin:])
+        if df is not None:
+            yield df
+
+    def _parse_data_lines(self, lines):
+        if len(lines) == 0 or self._columns is None:
+            return None
+        return self._make_frame(lines)
+
+    def scan_buffer(self, data):
+        """
+        yields frames of bytes, runs of data lines are scanned at once and
+        other lines, e.g. headers, or broken lines are parsed as strings
+        """
+        buf = np.frombuffer(data, dtype=np.uint8)
+        tokens = None
+        for begin, end, lines in find_runs(buf):
+            if lines is not None and self._columns is not None:
+                if tokens is None:
+                    tokens = find_tokens(buf)
+                fields = find_fields(
+                    tokens, lines, begin, end, len(self._columns))
+                if fields is not None:
+                    yield self._scan_frame(buf, *fields)
+                    continue
+            text = data[begin:end].decode()
+            yield from self._parse_lines(text.splitlines(keepends=True))
+
+    def scan_chunks(self, size=READ_SIZE):
+        with open(self.args.data, 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            if file_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for start, end in split_blocks(mm, file_size, size):
+                    yield from self.scan_buffer(mm[start:end])
+
+    def reorder_chunks(self, chunks):
+        """the same as reorder_rows() for chunks"""
+        from .reorder import FrameReorderBuffer
+        buffer = FrameReorderBuffer(self.args.reorder)
+        for df in chunks:
+            df = buffer.push(df)
+            if df is not None and len(df) > 0:
+                yield df
+        df = buffer.flush()
+        if df is not None and len(df) > 0:
+            yield df
+        log_late(buffer.late, self.args.reorder)
+
+    def filter_frame(self, df):
+        return self.plan.apply(df, pushed=self.pushdown)
+
+    def parse_lines(self, lines):
+        for df in self._parse_lines(lines):
+            yield self.filter_frame(df)
+
+    def read_chunks(self, size=READ_SIZE):
+        if can_split(self.args.data):
+            if self.args.jobs > 1:
+                from . import parallel
+                yield from parallel.read_chunks(self)
+                return
+            # a plain file is mapped and scanned as bytes
+            yield from self.scan_chunks(size)
+            return
+
+        with open_data(self.args.data) as f:
+            while True:
+                lines = f.readlines(size)
+                if len(lines) == 0:
+                    break
+                yield from self._parse_lines(lines)
+
+    def read_window_chunks(self, size=READ_SIZE):
+        for lines in read_window(self, size):
+            yield from self._parse_lines(lines)
+
+    def parse_chunks(self, size=READ_SIZE):
+        store = is_cacheable(self.args)
+        read_chunks = self.read_chunks
+        if is_indexable(self.args):
+            # seeks --since/--until window without storing partial data
+            store = False
+            read_chunks = self.read_window_chunks
+
+        # rows are dropped before conversion unless all rows are cached,
+        # the cache resets this when parsed data is loaded from it
+        self.pushdown = self.plan.has_raw_filters and not store
+        # columns out of --columns are not converted unless cached
+        self.needed = None if store else self.plan.needed_columns
+        chunks = cached_chunks(self, lambda: read_chunks(size), store=store)
+        if self.args.reorder is not None:
+            chunks = self.reorder_chunks(chunks)
+        for df in chunks:
+            df = self.filter_frame(df)
+            if self.unique_values is not None:
+                self.unique_values.add(df)
+            yield df
+
+    def parse_frame(self, size=READ_SIZE):
+        return concat_frames(self.parse_chunks(size))
+
+    def parse_batches(self, size=BATCH_ROWS):
+        """
+        yields RecordBatch of at most size rows, a batch keeps a list per
+        column and makes a record with attribute and key access while
+        iterating, which is cheaper than dicts of parse() for python consumers
+        """
+        return iter_batches(self.parse_chunks(), size)
@@ -1,11 +1,12 @@
 import textwrap
 
-import pandas as pd
-
-from .consts import COMMAND, PROCESS_ID, IO_TYPE, DEVICE_ID, IO_SIZE
 from .consts import PLOT_TYPE_HEATMAP
-from .heatmap import HeatMap
-from .parser import Parser
+from .encoding import UniqueValues
+from .heatmap import PyramidHeatMap, add_rows, make_heatmaps
+from .heatmap import make_stream_heatmaps, render_heatmaps
+from .profiling import get_data_size, get_profiler
+from .pyramid import PYRAMID_RESOLUTIONS, get_pyramid, is_multiple
+from .sources import make_parser
 from .utils import get_logger
 
 log = get_logger()
@@ -14,32 +15,123 @@ log = get_logger()
 _SHOW_MAX_UNIQUE_VALUES = 50
 
 
-def show_unique_values(df):
-    columns = [COMMAND, PROCESS_ID, IO_TYPE, DEVICE_ID, IO_SIZE]
-    for column in columns:
-        unique_num = df[column].nunique()
-        message = '%s column has %d values' % (column, unique_num)
-        if unique_num <= _SHOW_MAX_UNIQUE_VALUES:
-            lines = '\n'.join(str(i) for i in df[column].unique())
-            values = textwrap.indent(lines, prefix='  - ')
-            message += ' and they are as below\n%s' % values
-        log.info(message)
+def show_values(column, values):
+    unique_num = len(values)
+    message = '%s column has %d values' % (column, unique_num)
+    if unique_num <= _SHOW_MAX_UNIQUE_VALUES:
+        lines = '\n'.join(str(i) for i in values)
+        values = textwrap.indent(lines, prefix='  - ')
+        message += ' and they are as below\n%s' % values
+    log.info(message)
 
 
-def show_data_info(df):
-    show_unique_values(df)
+def show_unique_values(unique_values):
+    for column, values in unique_values.items():
+        show_values(column, values)
 
 
-def plot_data(args):
-    parser = Parser(args)
-    rows = [row for row in parser.parse()]
-    if len(rows) == 0:
+def show_data_info(unique_values):
+    show_unique_values(unique_values)
+
+
+def plot_stream(args):
+    profiler = get_profiler()
+    parser = make_parser(args)
+    parser.unique_values = UniqueValues()
+    heatmaps = make_stream_heatmaps(args)
+    rows = 0
+    chunks = profiler.iterate('parse', parser.parse_chunks(), rows=len)
+    for df in chunks:
+        if len(df) == 0:
+            continue
+        rows += len(df)
+        add_rows(heatmaps, df)
+    profiler.add('parse', size=get_data_size(args.data_files))
+
+    if rows == 0:
+        log.info('no rows, so heatmap will not create')
+        return
+
+    with profiler.stage('unique'):
+        show_data_info(parser.unique_values)
+    render_heatmaps(args, heatmaps)
+
+
+def parse_data(args):
+    profiler = get_profiler()
+    parser = make_parser(args)
+    # distinct values are collected while parsing chunks
+    parser.unique_values = UniqueValues()
+    with profiler.stage('parse') as stage:
+        df = parser.parse_frame()
+        stage.add(size=get_data_size(args.data_files))
+    if df is not None:
+        stage.add(rows=len(df))
+    return df, parser.unique_values
+
+
+def plot_rows(args):
+    df, unique_values = parse_data(args)
+    if df is None:
         log.info('no rows, so heatmap will not create')
         return
 
-    df = pd.DataFrame(rows, columns=parser.columns)
-    show_data_info(df)
+    with get_profiler().stage('unique'):
+        show_data_info(unique_values)
+
+    # every plot type is binned from the rows parsed once
+    render_heatmaps(args, make_heatmaps(args, df))
+
+
+def _parse_pyramid_rows(args):
+    df, unique_values = parse_data(args)
+    info = {
+        column: [str(i) for i in values]
+        for column, values in unique_values.items()
+    }
+    return df, info
+
+
+def plot_pyramid(args):
+    if args.plot_types != [PLOT_TYPE_HEATMAP]:
+        log.info('pyramid has tiles of %s only, bin rows', PLOT_TYPE_HEATMAP)
+        return plot_rows(args)
+    resolution = PYRAMID_RESOLUTIONS[0]
+    if not (is_multiple(args.since, resolution) and
+            is_multiple(args.until, resolution)):
+        log.info('--since/--until is not a multiple of %ds tiles, bin rows',
+                 resolution)
+        return plot_rows(args)
+
+    with get_profiler().stage('pyramid'):
+        pyramid = get_pyramid(args, _parse_pyramid_rows)
+    if pyramid is None or \
+            pyramid.window_stats(args.since, args.until) is None:
+        log.info('no rows, so heatmap will not create')
+        return
+
+    heatmap = PyramidHeatMap(args, pyramid)
+    level = heatmap.level
+    if level is None:
+        log.info('x interval %g is not a multiple of tiles, bin rows',
+                 heatmap.x_axis.interval)
+        return plot_rows(args)
+
+    with get_profiler().stage('unique'):
+        show_data_info(pyramid.info)
+    heatmap.fill(level)
+    heatmap.render()
+
+
+def plot_data(args):
+    if args.follow:
+        from .follow import follow_data
+        return follow_data(args)
+
+    if args.pyramid:
+        return plot_pyramid(args)
+
+    if args.stream:
+        return plot_stream(args)
 
-    if args.plot_type == PLOT_TYPE_HEATMAP:
-        heatmap = HeatMap(args, df)
-        heatmap.render()
+    return plot_rows(args)
@@ -0,0 +1,328 @@
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+from .reader import STDIN
+from .utils import get_logger
+
+log = get_logger()
+
+PROFILE_FORMAT_TEXT = 'text'
+PROFILE_FORMAT_JSON = 'json'
+PROFILE_FORMATS = [
+    PROFILE_FORMAT_TEXT,
+    PROFILE_FORMAT_JSON,
+]
+
+_MIB = 1024 * 1024
+_TRACEMALLOC_FRAMES = 5
+_TRACEMALLOC_TOP = 10
+
+
+def get_max_rss():
+    """returns peak resident set size of the process in bytes"""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return max_rss
+    return max_rss * 1024
+
+
+def get_data_size(paths):
+    """returns bytes of input files, stdin is not counted"""
+    return sum(os.path.getsize(path) for path in paths if path != STDIN)
+
+
+def get_output_size(path):
+    """returns bytes of an output file or files in an output directory"""
+    if not os.path.exists(path):
+        return 0
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(path, name))
+            for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def _per_sec(value, elapsed):
+    if value == 0 or elapsed <= 0:
+        return None
+    return value / elapsed
+
+
+def _mib(value):
+    if value is None:
+        return None
+    return value / _MIB
+
+
+class Stage:
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.elapsed = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.max_rss = None
+        self.peak = None
+
+    def add(self, rows=0, size=0):
+        self.rows += rows
+        self.bytes += size
+
+    def as_dict(self):
+        return OrderedDict([
+            ('stage', self.name),
+            ('calls', self.calls),
+            ('elapsed', self.elapsed),
+            ('rows', self.rows),
+            ('rows_per_sec', _per_sec(self.rows, self.elapsed)),
+            ('bytes', self.bytes),
+            ('bytes_per_sec', _per_sec(self.bytes, self.elapsed)),
+            ('max_rss_mib', _mib(self.max_rss)),
+            ('peak_mib', _mib(self.peak)),
+        ])
+
+
+class NullStage:
+
+    def add(self, rows=0, size=0):
+        pass
+
+
+class NullProfiler:
+    """profiler used while profiling is disabled, hooks cost nothing"""
+
+    enabled = False
+    _stage = NullStage()
+
+    @contextmanager
+    def stage(self, name):
+        yield self._stage
+
+    def iterate(self, name, iterable, rows=None, size=None):
+        return iterable
+
+    def add(self, name, rows=0, size=0):
+        pass
+
+
+class Profiler:
+    """
+    collects wall time, rows, bytes and peak memory per pipeline stage,
+    a stage entered several times accumulates, e.g. per chunk
+
+    >>> profiler = Profiler()
+    >>> with profiler.stage('parse') as stage:
+    ...     stage.add(rows=10, size=100)
+    >>> chunks = profiler.iterate('read', [[1, 2], [3]], rows=len)
+    >>> [len(chunk) for chunk in chunks]
+    [2, 1]
+    >>> [(s.name, s.calls, s.rows, s.bytes) for s in profiler.stages]
+    [('parse', 1, 10, 100), ('read', 2, 3, 0)]
+    """
+
+    enabled = True
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self._stages = OrderedDict()
+        self._peaks = []
+        self.started = time.perf_counter()
+        self.elapsed = None
+        self.snapshot = None
+        self.snapshot_stage = None
+        self._snapshot_size = 0
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start(_TRACEMALLOC_FRAMES)
+
+    @property
+    def stages(self):
+        return list(self._stages.values())
+
+    def get_stage(self, name):
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = Stage(name)
+            self._stages[name] = stage
+        return stage
+
+    def _enter(self):
+        if self.trace_memory:
+            # peak of an outer stage is kept while an inner stage resets it
+            _, peak = tracemalloc.get_traced_memory()
+            if len(self._peaks) > 0:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            self._peaks.append(0)
+            tracemalloc.reset_peak()
+        return time.perf_counter()
+
+    def _exit(self, stage, start, calls=1, sample=True):
+        stage.elapsed += time.perf_counter() - start
+        stage.calls += calls
+        if sample:
+            stage.max_rss = get_max_rss()
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(self._peaks.pop(), peak)
+            if len(self._peaks) > 0:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            stage.peak = max(stage.peak or 0, peak)
+            if sample and current > self._snapshot_size:
+                # keeps allocations of the largest live memory
+                self._snapshot_size = current
+                self.snapshot = tracemalloc.take_snapshot()
+                self.snapshot_stage = stage.name
+
+    @contextmanager
+    def stage(self, name):
+        stage = self.get_stage(name)
+        start = self._enter()
+        try:
+            yield stage
+        finally:
+            self._exit(stage, start)
+
+    def iterate(self, name, iterable, rows=None, size=None):
+        """times each step of an iterator, e.g. chunks of a parser"""
+        stage = self.get_stage(name)
+        iterator = iter(iterable)
+        try:
+            while True:
+                start = self._enter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    self._exit(stage, start, calls=0, sample=False)
+                    return
+                # memory is sampled once at the end, items may be rows
+                self._exit(stage, start, sample=False)
+                stage.add(
+                    rows=0 if rows is None else rows(item),
+                    size=0 if size is None else size(item),
+                )
+                yield item
+        finally:
+            stage.max_rss = get_max_rss()
+
+    def add(self, name, rows=0, size=0):
+        self.get_stage(name).add(rows, size)
+
+    def stop(self):
+        self.elapsed = time.perf_counter() - self.started
+        if self.trace_memory:
+            tracemalloc.stop()
+
+    def as_dict(self):
+        return OrderedDict([
+            ('elapsed', self.elapsed),
+            ('max_rss_mib', _mib(get_max_rss())),
+            ('stages', [stage.as_dict() for stage in self.stages]),
+        ])
+
+    def format_text(self):
+        lines = ['%-10s %6s %10s %10s %12s %10s %10s %10s' % (
+            'stage', 'calls', 'elapsed', 'rows', 'rows/sec', 'MiB/sec',
+            'rss MiB', 'peak MiB')]
+        for stage in self.stages:
+            values = stage.as_dict()
+            lines.append('%-10s %6d %10.3f %10d %12s %10s %10s %10s' % (
+                stage.name, stage.calls, stage.elapsed, stage.rows,
+                _format(values['rows_per_sec'], '%.0f'),
+                _format(_mib(values['bytes_per_sec']), '%.1f'),
+                _format(values['max_rss_mib'], '%.1f'),
+                _format(values['peak_mib'], '%.1f'),
+            ))
+        if self.elapsed is not None:
+            lines.append('%-10s %6s %10.3f' % ('total', '', self.elapsed))
+        return '\n'.join(lines)
+
+    def format_allocations(self, limit=_TRACEMALLOC_TOP):
+        if self.snapshot is None:
+            return ''
+        lines = ['top %d allocations alive after %s stage' % (
+            limit, self.snapshot_stage)]
+        stats = self.snapshot.statistics('traceback')
+        for stat in stats[:limit]:
+            lines.append('%.1f MiB in %d blocks' % (
+                _mib(stat.size), stat.count))
+            lines.extend('  %s' % line for line in stat.traceback.format())
+        return '\n'.join(lines)
+
+    def write(self, f, profile_format=PROFILE_FORMAT_TEXT):
+        if profile_format == PROFILE_FORMAT_JSON:
+            json.dump(self.as_dict(), f, indent=2)
+            f.write('\n')
+        else:
+            f.write(self.format_text() + '\n')
+            if self.snapshot is not None:
+                f.write(self.format_allocations() + '\n')
+
+
+def _format(value, fmt):
+    if value is None:
+        return '-'
+    return fmt % value
+
+
+_NULL_PROFILER = NullProfiler()
+_profiler = _NULL_PROFILER
+
+
+def get_profiler():
+    """returns the active profiler, hooks in the pipeline call this"""
+    return _profiler
+
+
+def enable(trace_memory=False):
+    global _profiler
+    _profiler = Profiler(trace_memory)
+    return _profiler
+
+
+def disable():
+    global _profiler
+    profiler = _profiler
+    _profiler = _NULL_PROFILER
+    if profiler.enabled:
+        profiler.stop()
+    return profiler
+
+
+@contextmanager
+def profile(args):
+    """profiles a run of the cli with --profile options"""
+    if not args.profile:
+        yield None
+        return
+
+    profiler = enable(trace_memory=args.profile_tracemalloc)
+    code_profiler = None
+    if args.profile_cprofile is not None:
+        code_profiler = cProfile.Profile()
+        code_profiler.enable()
+    try:
+        yield profiler
+    finally:
+        if code_profiler is not None:
+            code_profiler.disable()
+            code_profiler.dump_stats(args.profile_cprofile)
+            log.info('saved cProfile stats to %s', args.profile_cprofile)
+        disable()
+        if args.profile_output is None:
+            profiler.write(sys.stderr, args.profile_format)
+        else:
+            with open(args.profile_output, 'w') as f:
+                profiler.write(f, args.profile_format)
@@ -0,0 +1,288 @@
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from .cache import evict_cache, get_cache_dir, make_key
+from .conditions import compile_condition
+from .consts import IO_LATENCY, START_TIME_STAMP_DIFF, Y_SCALE_LOG
+from .histogram import Histogram2D, LinearAxis, LogAxis
+from .reader import STDIN
+from .utils import get_logger
+
+log = get_logger()
+
+# seconds of a tile at each level, a level sums tiles of the finer one
+PYRAMID_RESOLUTIONS = [1, 10, 60, 600, 3600]
+
+_PYRAMID_SUFFIX = '.pyramid.npz'
+_PYRAMID_VERSION = 1
+# first row of a tile without rows
+_NO_ROW = np.iinfo(np.int64).max
+
+
+def is_multiple(value, unit):
+    """
+    >>> is_multiple(60.0, 10), is_multiple(0.5, 1), is_multiple(None, 10)
+    (True, False, True)
+    """
+    if value is None:
+        return True
+    ratio = value / unit
+    return abs(ratio - round(ratio)) < 1e-9
+
+
+def get_y_interval(args, max_latency):
+    """returns interval of linear y bins as HeatMap decides it"""
+    interval = args.y_interval
+    if interval > max_latency:
+        interval = max_latency / 10
+    return interval
+
+
+def make_y_axis(args, interval, maximum=None):
+    if args.y_scale == Y_SCALE_LOG:
+        return LogAxis(args.y_error, maximum)
+    return LinearAxis(interval, maximum, extra=2)
+
+
+def _sum_tiles(counts, size):
+    """sums every size tiles of the x axis into one"""
+    views, rows, cols = counts.shape
+    pad = -cols % size
+    if pad > 0:
+        counts = np.concatenate(
+            [counts, np.zeros((views, rows, pad), dtype=counts.dtype)],
+            axis=2)
+    return counts.reshape(views, rows, -1, size).sum(axis=3)
+
+
+class Pyramid:
+    """
+    counts of latency by time tiles at several time resolutions, a plot of
+    any window and x interval sums tiles of a level instead of binning rows
+
+    the finest level keeps the range of rows per tile, so that axes of a
+    plot have the same size as binning rows gives
+
+    >>> import pandas as pd
+    >>> df = pd.DataFrame({
+    ...     'STARTs_DIFF': [0.0, 0.5, 12.0, 65.0],
+    ...     'LATms': [1.0, 12.0, 3.0, 30.0],
+    ... })
+    >>> pyramid = Pyramid.build(df, LinearAxis(10.0, extra=2), [],
+    ...                         resolutions=[1, 10, 60])
+    >>> [level.shape for level in pyramid.levels]
+    [(1, 5, 66), (1, 5, 7), (1, 5, 2)]
+    >>> pyramid.levels[2][0].sum(axis=0).tolist()
+    [3, 1]
+    >>> pyramid.select(20.0, since=10), pyramid.select(0.5)
+    (1, None)
+    >>> pyramid.window_stats(10, None)
+    (12.0, 65.0, 30.0)
+    """
+
+    def __init__(self, resolutions, levels, y_interval, first_rows,
+                 first_diffs, max_diffs, max_latencies, info=None):
+        self.resolutions = resolutions
+        self.levels = levels
+        self.y_interval = y_interval
+        # rows per tile of the finest level
+        self.first_rows = first_rows
+        self.first_diffs = first_diffs
+        self.max_diffs = max_diffs
+        self.max_latencies = max_latencies
+        self.info = info or []
+
+    @property
+    def views(self):
+        return self.levels[0].shape[0]
+
+    @classmethod
+    def build(cls, df, y_axis, conditions, resolutions=PYRAMID_RESOLUTIONS,
+              info=None):
+        diff = df[START_TIME_STAMP_DIFF].values.astype(np.float64)
+        latency = df[IO_LATENCY].values.astype(np.float64)
+        x_axis = LinearAxis(resolutions[0])
+        histogram = Histogram2D(x_axis, y_axis, len(conditions) + 1)
+        masks = [None] + [condition(df) for condition in conditions]
+        histogram.add(diff, latency, masks)
+
+        levels = [histogram.values.copy()]
+        for resolution in resolutions[1:]:
+            # a coarser level is made of the finest one it divides
+            finer_levels = zip(resolutions[:len(levels)], levels)
+            for finer, counts in reversed(list(finer_levels)):
+                if resolution % finer == 0:
+                    levels.append(_sum_tiles(counts, resolution // finer))
+                    break
+
+        cols = levels[0].shape[2]
+        tiles = x_axis.index(diff)
+        valid = (tiles >= 0) & (tiles < cols) & (y_axis.index(latency) >= 0)
+        tiles, diff, latency = tiles[valid], diff[valid], latency[valid]
+        max_diffs = np.full(cols, -np.inf)
+        max_latencies = np.full(cols, -np.inf)
+        np.maximum.at(max_diffs, tiles, diff)
+        np.maximum.at(max_latencies, tiles, latency)
+        # rows are in order of completion, the first row of a window is
+        # the first one in the file which falls into the window
+        _, firsts = np.unique(tiles, return_index=True)
+        first_rows = np.full(cols, _NO_ROW, dtype=np.int64)
+        first_rows[tiles[firsts]] = firsts
+        first_diffs = np.full(cols, np.nan)
+        first_diffs[tiles[firsts]] = diff[firsts]
+
+        y_interval = getattr(y_axis, 'interval', None)
+        return cls(resolutions, levels, y_interval, first_rows, first_diffs,
+                   max_diffs, max_latencies, info)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as npz:
+            meta = json.loads(str(npz['meta']))
+            levels = [
+                npz['level_%d' % i] for i in range(len(meta['resolutions']))
+            ]
+            return cls(
+                meta['resolutions'], levels, meta['y_interval'],
+                npz['first_rows'], npz['first_diffs'], npz['max_diffs'],
+                npz['max_latencies'], meta['info'])
+
+    def save(self, path):
+        meta = {
+            'version': _PYRAMID_VERSION,
+            'resolutions': self.resolutions,
+            'y_interval': self.y_interval,
+            'info': self.info,
+        }
+        levels = {
+            'level_%d' % i: counts for i, counts in enumerate(self.levels)
+        }
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(
+                f, meta=np.array(json.dumps(meta)),
+                first_rows=self.first_rows, first_diffs=self.first_diffs,
+                max_diffs=self.max_diffs, max_latencies=self.max_latencies,
+                **levels)
+        os.rename(tmp, path)
+
+    def select(self, interval, since=None, until=None):
+        """
+        returns the coarsest level whose tiles make bins of the interval,
+        a level aligned to --since/--until is preferred, or None
+        """
+        levels = [
+            i for i, resolution in enumerate(self.resolutions)
+            if is_multiple(interval, resolution)
+        ]
+        if len(levels) == 0:
+            return None
+        for i in reversed(levels):
+            resolution = self.resolutions[i]
+            if is_multiple(since, resolution) and \
+                    is_multiple(until, resolution):
+                return i
+        return levels[0]
+
+    def _tile_range(self, resolution, since, until):
+        """tiles which begin in [since, until) are in the window"""
+        cols = len(self.first_rows) * self.resolutions[0] / resolution
+        first = 0 if since is None else int(np.ceil(since / resolution))
+        last = int(np.ceil(cols))
+        if until is not None:
+            last = min(last, int(np.ceil(until / resolution)))
+        return max(0, first), last
+
+    def window_stats(self, since, until):
+        """returns the first diff, max diff and max latency in the window"""
+        first, last = self._tile_range(self.resolutions[0], since, until)
+        if first >= last:
+            return None
+        rows = self.first_rows[first:last]
+        if rows.min() == _NO_ROW:
+            return None
+        return (
+            float(self.first_diffs[first:last][np.argmin(rows)]),
+            float(self.max_diffs[first:last].max()),
+            float(self.max_latencies[first:last].max()),
+        )
+
+    def fill(self, histogram, level, since=None, until=None):
+        """adds summed tiles of the window to bins of the histogram"""
+        resolution = self.resolutions[level]
+        size = int(round(histogram.x_axis.interval / resolution))
+        first, last = self._tile_range(resolution, since, until)
+        begin = first - first % size
+        counts = self.levels[level][:, :, begin:last].copy()
+        counts[:, :, :first - begin] = 0
+        x_max, y_max = self.window_stats(since, until)[1:]
+        histogram.add_counts(
+            _sum_tiles(counts, size), x_max, y_max, col=begin // size)
+
+
+def _build_args(args):
+    """rows of the whole data are needed to build a pyramid"""
+    build_args = argparse.Namespace(**vars(args))
+    build_args.since = None
+    build_args.until = None
+    build_args.columns = None
+    return build_args
+
+
+def make_pyramid_key(args):
+    identity = {
+        'version': _PYRAMID_VERSION,
+        'data': [make_key(path) for path in args.data_files],
+        'basedates': [str(i) for i in args.basedates],
+        'io_commands': args.io_commands,
+        'io_device': args.io_device,
+        'io_pids': args.io_pids,
+        'io_types': args.io_types,
+        'reorder': args.reorder,
+        'y_scale': args.y_scale,
+        'y_bins': args.y_error
+        if args.y_scale == Y_SCALE_LOG else args.y_interval,
+        'subplot_conditions': args.subplot_conditions,
+        'resolutions': PYRAMID_RESOLUTIONS,
+    }
+    text = json.dumps(identity, sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def is_storable(args):
+    return args.cache and all(
+        path != STDIN and os.path.isfile(path) for path in args.data_files)
+
+
+def get_pyramid(args, build):
+    """
+    loads the pyramid of the data from the cache, or builds it of rows by
+    build(args) which returns a frame and data info
+    """
+    path = None
+    if is_storable(args):
+        cache_dir = args.cache_dir or get_cache_dir()
+        path = os.path.join(
+            cache_dir, make_pyramid_key(args) + _PYRAMID_SUFFIX)
+        if os.path.exists(path):
+            log.debug('load pyramid: %s', path)
+            os.utime(path)  # for eviction by least recently used
+            return Pyramid.load(path)
+
+    df, info = build(_build_args(args))
+    if df is None:
+        return None
+    conditions = [compile_condition(i) for i in args.subplot_conditions]
+    interval = get_y_interval(args, df[IO_LATENCY].max())
+    pyramid = Pyramid.build(
+        df, make_y_axis(args, interval), conditions, info=info)
+    if path is not None:
+        log.debug('store pyramid: %s', path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pyramid.save(path)
+        evict_cache(args)
+    return pyramid
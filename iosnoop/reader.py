@@ -0,0 +1,175 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+import select
+import stat
+import sys
+import threading
+import time
+from queue import Queue
+
+from .utils import CommandError, get_logger
+
+log = get_logger()
+
+STDIN = '-'
+
+# large buffers let decompression and parsing run on bigger blocks
+READ_BUFFER_SIZE = 4 * 1024 * 1024
+_READ_AHEAD_BLOCKS = 4
+# bytes read at once from a growing file or a pipe
+_TAIL_READ_SIZE = 1024 * 1024
+
+_GZIP_MAGIC = b'\x1f\x8b'
+_XZ_MAGIC = b'\xfd7zXZ\x00'
+_BZIP2_MAGIC = b'BZh'
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+def _open_zstd(f):
+    try:
+        import zstandard
+    except ImportError:
+        try:
+            from compression import zstd
+        except ImportError:
+            msg = 'install zstandard package to read zstd compressed data'
+            raise CommandError(msg)
+        return zstd.ZstdFile(f)
+    return zstandard.ZstdDecompressor().stream_reader(
+        f, read_size=READ_BUFFER_SIZE)
+
+
+_DECOMPRESSORS = [
+    (_GZIP_MAGIC, lambda f: gzip.GzipFile(fileobj=f)),
+    (_XZ_MAGIC, lambda f: lzma.LZMAFile(f)),
+    (_BZIP2_MAGIC, lambda f: bz2.BZ2File(f)),
+    (_ZSTD_MAGIC, _open_zstd),
+]
+
+
+def get_decompressor(head):
+    """
+    >>> get_decompressor(b'\\x1f\\x8b\\x08\\x00') is not None
+    True
+    >>> get_decompressor(b'Tracing block I/O') is None
+    True
+    """
+    for magic, decompressor in _DECOMPRESSORS:
+        if head.startswith(magic):
+            return decompressor
+    return None
+
+
+def can_split(path):
+    if path == STDIN:
+        return False
+    with open(path, 'rb') as f:
+        return get_decompressor(f.read(8)) is None
+
+
+class ReadAheadReader(io.RawIOBase):
+    """read blocks in a background thread to overlap i/o with parsing"""
+
+    def __init__(self, f, size=READ_BUFFER_SIZE):
+        self.f = f
+        self.size = size
+        self.block = b''
+        self.queue = Queue(_READ_AHEAD_BLOCKS)
+        self.thread = threading.Thread(target=self._read_ahead, daemon=True)
+        self.thread.start()
+
+    def _read_ahead(self):
+        try:
+            while True:
+                block = self.f.read(self.size)
+                self.queue.put(block)
+                if len(block) == 0:
+                    break
+        except Exception as e:
+            self.queue.put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if len(self.block) == 0:
+            if self.thread is None:
+                return 0
+            block = self.queue.get()
+            if isinstance(block, Exception):
+                raise block
+            if len(block) == 0:
+                self.thread = None
+                return 0
+            self.block = memoryview(block)
+        n = min(len(b), len(self.block))
+        b[:n] = self.block[:n]
+        self.block = self.block[n:]
+        return n
+
+    def close(self):
+        self.f.close()
+        super().close()
+
+
+def open_binary(path):
+    if path == STDIN:
+        f = io.BufferedReader(
+            io.FileIO(sys.stdin.fileno(), closefd=False),
+            buffer_size=READ_BUFFER_SIZE)
+    else:
+        f = open(path, 'rb', buffering=READ_BUFFER_SIZE)
+
+    decompressor = get_decompressor(f.peek(len(_XZ_MAGIC)))
+    if decompressor is None:
+        if path != STDIN:
+            return f
+    else:
+        log.debug('read compressed data: %s', path)
+        f = decompressor(f)
+    return io.BufferedReader(ReadAheadReader(f), READ_BUFFER_SIZE)
+
+
+def open_data(path):
+    return io.TextIOWrapper(open_binary(path))
+
+
+class Tail:
+
+    def __init__(self, f, size=_TAIL_READ_SIZE):
+        self.fd = f.fileno()
+        self.size = size
+        self.rest = b''
+        # a pipe ends when the writer closes it, a file may grow later
+        self.is_regular = stat.S_ISREG(os.fstat(self.fd).st_mode)
+        self.eof = False
+
+    def _split(self, data):
+        data = self.rest + data
+        end = data.rfind(b'\n') + 1
+        self.rest = data[end:]
+        return data[:end].decode().splitlines(keepends=True)
+
+    def read_lines(self, timeout):
+        """read lines which are appended until timeout seconds elapse"""
+        lines = []
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            readable, _, _ = select.select([self.fd], [], [], remaining)
+            if not readable:
+                break
+            data = os.read(self.fd, self.size)
+            if len(data) == 0:
+                # end of regular file or no writer on pipe for now
+                self.eof = True
+                time.sleep(max(0, deadline - time.monotonic()))
+                break
+            self.eof = False
+            lines.extend(self._split(data))
+        return lines
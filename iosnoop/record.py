@@ -0,0 +1,296 @@
+"""
+records block i/o from block_rq_issue and block_rq_complete events of
+ftrace instead of the iosnoop script, an issue is kept until its completion
+with the same device and sector arrives
+"""
+import errno
+import os
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .consts import START_TIME_STAMP, END_TIME_STAMP, COMMAND, PROCESS_ID
+from .consts import IO_TYPE, DEVICE_ID, DISK_BLOCK, IO_SIZE, IO_LATENCY
+from .export import NpyWriter
+from .parser import READ_SIZE, Parser
+from .profiling import get_output_size, get_profiler
+from .reader import STDIN, Tail, open_data
+from .utils import CommandError, get_logger, make_output_file
+
+log = get_logger()
+
+RECORD_FORMAT_TEXT = 'text'
+RECORD_FORMAT_NPY = 'npy'
+RECORD_FORMATS = [
+    RECORD_FORMAT_TEXT,
+    RECORD_FORMAT_NPY,
+]
+
+# issued requests kept until completion at most
+MAX_IN_FLIGHT = 64 * 1024
+
+TRACE_PIPE = 'trace_pipe'
+_BLOCK_EVENTS = ['block_rq_issue', 'block_rq_complete']
+# seconds to wait for events of trace_pipe at once
+_PIPE_TIMEOUT = 1.0
+_SECTOR_SIZE = 512
+
+_COLUMNS = [
+    START_TIME_STAMP, END_TIME_STAMP, COMMAND, PROCESS_ID, IO_TYPE,
+    DEVICE_ID, DISK_BLOCK, IO_SIZE, IO_LATENCY,
+]
+
+# the same layout as iosnoop -ts prints
+_DESCRIPTION = 'Tracing block I/O. Ctrl-C to end.\n'
+_HEADER_FORMAT = '%-15s %-15s %-12s %-6s %-4s %-8s %-12s %-6s %8s\n'
+_ROW_FORMAT = '%-15.6f %-15.6f %-12.12s %-6d %-4s %-8s %-12d %-6d %8.2f\n'
+
+_EVENT_MARK = ': block_rq_'
+_ISSUE = 'issue'
+
+
+def parse_event(line):
+    """
+    returns task, pid, time, event, device, type, sector and number of
+    sectors of a block request event, or None for other lines, a line is
+    "task-pid [cpu] flags time: block_rq_event: dev rwbs ... sector + nr"
+
+    >>> parse_event('  kworker/u8:2-97  [001] d..2. 120.500100: '
+    ...             'block_rq_issue: 8,0 WS 4096 () 2048 + 8 [kworker]')
+    ('kworker/u8:2', '97', '120.500100', 'issue', '8,0', 'WS', '2048', '8')
+    >>> parse_event('  <idle>-0  (    0) [000] ..s1. 120.5012: '
+    ...             'block_rq_complete: 8,0 WS () 2048 + 8 none,0,0 [0]')
+    ('<idle>', '0', '120.5012', 'complete', '8,0', 'WS', '2048', '8')
+    >>> parse_event('# tracer: nop') is None
+    True
+    """
+    mark = line.find(_EVENT_MARK)
+    if mark < 0:
+        return None
+    head = line[:mark]
+    name, _, body = line[mark + len(_EVENT_MARK):].partition(': ')
+    fields = body.split()
+    try:
+        plus = fields.index('+', 2)
+    except ValueError:
+        return None
+    time_ = head[head.rfind(' ') + 1:]
+    # tgid of the task is printed in parentheses by the record-tgid option
+    task = head[:head.rfind('[')].rstrip()
+    if task.endswith(')'):
+        task = task[:task.rfind('(')].rstrip()
+    task, _, pid = task.strip().rpartition('-')
+    return (task, pid, time_, name, fields[0], fields[1],
+            fields[plus - 1], fields[plus + 1])
+
+
+class Recorder:
+    """
+    pairs issues and completions of requests into rows of iosnoop -ts,
+    the oldest issue is dropped when MAX_IN_FLIGHT are kept, e.g. its
+    completion was lost, so that memory is bounded on a busy host
+
+    >>> recorder = Recorder(max_in_flight=1)
+    >>> recorder.pair([
+    ...     'dd-10 [000] 1.000000: block_rq_issue: 8,0 R 4096 () 8 + 8 [dd]',
+    ...     'dd-10 [000] 1.000500: block_rq_issue: 8,0 R 4096 () 0 + 8 [dd]',
+    ...     '<idle>-0 [000] 1.002000: block_rq_complete: 8,0 R () 0 + 8 [0]',
+    ...     '<idle>-0 [000] 1.003000: block_rq_complete: 8,0 R () 8 + 8 [0]',
+    ... ])
+    [(1.0005, 1.002, 'dd', 10, 'R', '8,0', 0, 4096, 1.5)]
+    >>> recorder.dropped, recorder.unmatched
+    (1, 1)
+    """
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT):
+        self.max_in_flight = max_in_flight
+        self.in_flight = OrderedDict()
+        self.rows = 0
+        self.dropped = 0
+        self.unmatched = 0
+
+    def pair(self, lines):
+        """returns rows of requests which complete in the lines"""
+        in_flight = self.in_flight
+        rows = []
+        for line in lines:
+            event = parse_event(line)
+            if event is None:
+                continue
+            task, pid, time_, name, dev, type_, block, sectors = event
+            if sectors == '0':
+                continue  # flush without data has no sector to pair
+            key = (dev, block)
+            if name == _ISSUE:
+                if key in in_flight:
+                    del in_flight[key]  # issued again, e.g. requeued
+                elif len(in_flight) >= self.max_in_flight:
+                    in_flight.popitem(last=False)
+                    self.dropped += 1
+                in_flight[key] = (time_, task, pid)
+                continue
+
+            issued = in_flight.pop(key, None)
+            if issued is None:
+                self.unmatched += 1
+                continue
+            start_, comm, issue_pid = issued
+            start, end = float(start_), float(time_)
+            rows.append((
+                start, end, comm, int(issue_pid), type_, dev, int(block),
+                int(sectors) * _SECTOR_SIZE, round((end - start) * 1000, 2),
+            ))
+        self.rows += len(rows)
+        return rows
+
+
+class TextWriter:
+    """writes rows as iosnoop -ts does, other commands read them as is"""
+
+    def __init__(self, output):
+        self.output = output
+        if output == STDIN:
+            self.f = sys.stdout
+        else:
+            self.f = open(output, 'w')
+        self.f.write(_DESCRIPTION)
+        self.f.write(_HEADER_FORMAT % tuple(_COLUMNS))
+
+    def write(self, rows):
+        self.f.writelines(_ROW_FORMAT % row for row in rows)
+        self.f.flush()
+
+    def close(self):
+        if self.f is not sys.stdout:
+            self.f.close()
+
+
+class FrameWriter:
+    """
+    passes rows to the parser as columns without text, they are filtered
+    and written as .npy files per column like export
+    """
+
+    def __init__(self, args, output):
+        self.parser = Parser(args)
+        self.writer = NpyWriter(output)
+        self.output = output
+
+    def write(self, rows):
+        df = self.parser.make_rows_frame(_COLUMNS, rows)
+        if len(df) > 0:
+            self.writer.write(df)
+
+    def close(self):
+        self.writer.close()
+
+
+def make_writer(args):
+    output = args.output
+    if args.format == RECORD_FORMAT_NPY:
+        if output is None:
+            output = make_output_file(args.data, 'columns')
+        return FrameWriter(args, output)
+
+    if output is None:
+        output = make_output_file(args.data, 'log')
+    return TextWriter(output)
+
+
+def is_trace_pipe(path):
+    return os.path.basename(path) == TRACE_PIPE
+
+
+def _get_hint(e):
+    """returns what to do about an error of tracefs"""
+    if e.errno in (errno.EACCES, errno.EPERM):
+        return 'run as root'
+    if e.errno == errno.ENOENT:
+        return 'check that tracefs is mounted and has block events'
+    return 'check the path of %s' % TRACE_PIPE
+
+
+def _set_events(tracefs, value):
+    for event in _BLOCK_EVENTS:
+        path = os.path.join(tracefs, 'events', 'block', event, 'enable')
+        with open(path, 'w') as f:
+            f.write(value)
+
+
+@contextmanager
+def enable_events(tracefs):
+    try:
+        _set_events(tracefs, '1')
+    except OSError as e:
+        raise CommandError('cannot enable block events of tracefs, %s: %s' % (
+            _get_hint(e), e))
+    try:
+        yield
+    finally:
+        _set_events(tracefs, '0')
+
+
+def _open_pipe(path):
+    try:
+        return open(path, 'rb')
+    except OSError as e:
+        raise CommandError('cannot read %s, %s: %s' % (path, _get_hint(e), e))
+
+
+def read_trace_pipe(path, duration=None):
+    """yields lines of events until duration seconds elapse"""
+    deadline = None
+    if duration is not None:
+        deadline = time.monotonic() + duration
+    with enable_events(os.path.dirname(path)), _open_pipe(path) as f:
+        tail = Tail(f)
+        while deadline is None or time.monotonic() < deadline:
+            timeout = _PIPE_TIMEOUT
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+            yield tail.read_lines(max(0, timeout))
+
+
+def read_capture(path, size=READ_SIZE):
+    """yields lines of events captured from trace_pipe in a file"""
+    with open_data(path) as f:
+        while True:
+            lines = f.readlines(size)
+            if len(lines) == 0:
+                break
+            yield lines
+
+
+def read_events(args):
+    if is_trace_pipe(args.data):
+        log.info('record block i/o from %s, Ctrl-C to end', args.data)
+        return read_trace_pipe(args.data, args.duration)
+    return read_capture(args.data)
+
+
+def write_record(args):
+    profiler = get_profiler()
+    recorder = Recorder(args.max_in_flight)
+    writer = make_writer(args)
+    try:
+        chunks = profiler.iterate('read', read_events(args), rows=len)
+        for lines in chunks:
+            with profiler.stage('pair') as stage:
+                rows = recorder.pair(lines)
+                stage.add(rows=len(rows))
+            if len(rows) == 0:
+                continue
+            with profiler.stage('write') as stage:
+                writer.write(rows)
+                stage.add(rows=len(rows))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+        if writer.output != STDIN:
+            profiler.add('write', size=get_output_size(writer.output))
+    log.info(
+        'recorded %d i/o to %s, %d in flight, %d issues dropped, '
+        '%d completions without issue', recorder.rows, writer.output,
+        len(recorder.in_flight), recorder.dropped, recorder.unmatched)
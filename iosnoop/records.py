@@ -0,0 +1,138 @@
+from collections import namedtuple
+from functools import lru_cache
+from itertools import repeat
+
+import pandas as pd
+
+# rows of a batch returned by parse_batches at most
+BATCH_ROWS = 4096
+
+# makes a record from a tuple without a python level call
+_new_record = tuple.__new__
+
+
+class RecordMixin:
+    """
+    key access and dict like methods for a record, a record is a tuple and
+    iterates its values
+
+    >>> Record = make_record_type(('COMM', 'LATms'))
+    >>> row = Record('main', 12.25)
+    >>> row.LATms, row['COMM'], row[1]
+    (12.25, 'main', 12.25)
+    >>> row.get('PID', -1), 'COMM' in row.keys()
+    (-1, True)
+    >>> row.as_dict()
+    {'COMM': 'main', 'LATms': 12.25}
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple(self)
+
+    def items(self):
+        return zip(self._fields, self)
+
+    def as_dict(self):
+        return dict(zip(self._fields, self))
+
+
+@lru_cache(maxsize=16)
+def make_record_type(columns):
+    """returns a compact record type without __dict__ for the columns"""
+    base = namedtuple('RecordBase', columns)
+    return type('Record', (RecordMixin, base), {'__slots__': ()})
+
+
+def to_list(values):
+    """converts a column into a list of python values"""
+    if isinstance(values, pd.Categorical):
+        # values of a category are shared by rows
+        categories = values.categories.values.tolist()
+        return [categories[i] for i in values.codes.tolist()]
+    if values.dtype.kind == 'M':
+        # tolist() gives datetime only in microsecond resolution
+        values = values.astype('datetime64[us]')
+    return values.tolist()
+
+
+class RecordBatch:
+    """
+    rows kept as a list per column, a record is made while iterating, so
+    that a loop which holds one record at a time leaves no objects for the
+    garbage collector to scan
+
+    >>> df = pd.DataFrame({
+    ...     'COMM': pd.Categorical(['main', '<idle>']),
+    ...     'LATms': [12.25, 2.34],
+    ... })
+    >>> batch = RecordBatch.from_frame(df)
+    >>> len(batch), batch.fields
+    (2, ('COMM', 'LATms'))
+    >>> [row.COMM for row in batch]
+    ['main', '<idle>']
+    >>> batch[1]
+    Record(COMM='<idle>', LATms=2.34)
+    >>> batch.column('LATms')
+    [12.25, 2.34]
+    """
+
+    __slots__ = ('record_type', 'columns')
+
+    def __init__(self, record_type, columns):
+        self.record_type = record_type
+        self.columns = columns
+
+    @classmethod
+    def from_frame(cls, df):
+        record_type = make_record_type(tuple(df.columns))
+        return cls(record_type, [to_list(df[name].values) for name in df])
+
+    @property
+    def fields(self):
+        return self.record_type._fields
+
+    def __len__(self):
+        return len(self.columns[0]) if len(self.columns) > 0 else 0
+
+    def __iter__(self):
+        return map(_new_record, repeat(self.record_type), zip(*self.columns))
+
+    def __getitem__(self, i):
+        return _new_record(
+            self.record_type, [column[i] for column in self.columns])
+
+    def column(self, name):
+        return self.columns[self.fields.index(name)]
+
+    def slice(self, start, end):
+        columns = [column[start:end] for column in self.columns]
+        return RecordBatch(self.record_type, columns)
+
+
+def iter_batches(chunks, size=BATCH_ROWS):
+    """slices parsed chunks into batches of at most size records"""
+    for df in chunks:
+        if len(df) == 0:
+            continue
+        batch = RecordBatch.from_frame(df)
+        if len(batch) <= size:
+            yield batch
+            continue
+        for start in range(0, len(batch), size):
+            yield batch.slice(start, start + size)
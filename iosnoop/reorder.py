@@ -0,0 +1,126 @@
+"""
+iosnoop prints an i/o when it completes, rows are put back in order of
+STARTs by holding them until the latest STARTs seen is the lateness window
+ahead, a row is late if an earlier row arrives after it was emitted, which
+can not happen while the window is longer than the latency of i/o
+"""
+import heapq
+from itertools import count
+
+import numpy as np
+
+from .consts import START_TIME_STAMP
+from .parser import concat_frames
+
+
+class ReorderBuffer:
+    """
+    min-heap of rows keyed on STARTs, memory is bounded by rows in the
+    window, i.e. i/o in flight, instead of all rows
+
+    >>> buffer = ReorderBuffer(window=1.0)
+    >>> [buffer.push(start, name) for start, name in [
+    ...     (10.0, 'a'), (9.5, 'b'), (11.2, 'c'), (12.0, 'd'), (9.0, 'e')]]
+    [[], [], ['b', 'a'], [], ['e']]
+    >>> buffer.flush(), buffer.late
+    (['c', 'd'], 1)
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.heap = []
+        # keeps the order of arrival for rows of the same STARTs
+        self.sequence = count()
+        self.latest = None
+        self.emitted = None
+        self.late = 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    def _pop(self, bound):
+        items = []
+        while len(self.heap) > 0 and self.heap[0][0] <= bound:
+            start, _, item = heapq.heappop(self.heap)
+            self.emitted = start
+            items.append(item)
+        return items
+
+    def push(self, start, item):
+        """returns items which no later row can come before"""
+        if self.emitted is not None and start < self.emitted:
+            # the order is already broken, the row is emitted as is
+            self.late += 1
+            return [item]
+        heapq.heappush(self.heap, (start, next(self.sequence), item))
+        if self.latest is None or self.latest < start:
+            self.latest = start
+        return self._pop(self.latest - self.window)
+
+    def flush(self):
+        return self._pop(float('inf'))
+
+
+class FrameReorderBuffer:
+    """
+    the same as ReorderBuffer for chunks of rows, pending rows are kept
+    sorted and a chunk is merged into them at once
+
+    >>> import pandas as pd
+    >>> buffer = FrameReorderBuffer(window=1.0)
+    >>> df = buffer.push(pd.DataFrame({
+    ...     'STARTs': [10.0, 9.5, 11.2], 'LATms': [1, 2, 3]}))
+    >>> df['LATms'].tolist(), len(buffer)
+    ([2, 1], 1)
+    >>> df = buffer.push(pd.DataFrame({
+    ...     'STARTs': [12.0, 9.0], 'LATms': [4, 5]}))
+    >>> df['LATms'].tolist(), buffer.flush()['LATms'].tolist(), buffer.late
+    ([5], [3, 4], 1)
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.pending = None
+        self.latest = None
+        self.emitted = None
+        self.late = 0
+
+    def __len__(self):
+        return 0 if self.pending is None else len(self.pending)
+
+    def push(self, df):
+        """returns rows of the chunk and pending ones no row comes before"""
+        starts = df[START_TIME_STAMP].values
+        late = None
+        if self.emitted is not None:
+            is_late = starts < self.emitted
+            if is_late.any():
+                self.late += int(is_late.sum())
+                late, df = df[is_late], df[~is_late]
+                starts = starts[~is_late]
+        if len(starts) > 0 and (self.latest is None or
+                                self.latest < starts.max()):
+            self.latest = starts.max()
+
+        df = concat_frames([self.pending, df] if self.pending is not None
+                           else [df])
+        if df is None:
+            self.pending = None
+            return late if late is not None else df
+        starts = df[START_TIME_STAMP].values
+        order = np.argsort(starts, kind='stable')
+        end = np.searchsorted(
+            starts[order], self.latest - self.window, side='right')
+        self.pending = df.take(order[end:]).reset_index(drop=True)
+        ready = df.take(order[:end]).reset_index(drop=True)
+        if end > 0:
+            self.emitted = starts[order[end - 1]]
+        if late is not None:
+            return concat_frames([late, ready])
+        return ready
+
+    def flush(self):
+        df, self.pending = self.pending, None
+        if df is not None and len(df) > 0:
+            self.emitted = df[START_TIME_STAMP].values[-1]
+        return df
@@ -0,0 +1,194 @@
+"""
+scans iosnoop output in a byte buffer with numpy, offsets of lines and
+fields are found at once and numbers are converted from the bytes without
+a string object per line or field
+"""
+import numpy as np
+
+# bytes up to space are whitespace
+_SPACE = ord(' ')
+_NEWLINE = ord('\n')
+_ZERO = ord('0')
+# a dot is this after zero is subtracted from bytes
+_DOT = (ord('.') - _ZERO) % 256
+# float64 holds integers of up to 15 digits exactly
+_MAX_DIGITS = 15
+
+
+def split_blocks(mm, size, block_size):
+    """yields ranges of about block_size bytes which end at a newline"""
+    start = 0
+    while start < size:
+        end = mm.find(b'\n', min(start + block_size, size) - 1)
+        end = size if end < 0 else end + 1
+        yield start, end
+        start = end
+
+
+def find_tokens(buf):
+    """
+    returns offsets where fields begin and end
+
+    >>> buf = np.frombuffer(b'1.5  main\\n22 x', dtype=np.uint8)
+    >>> [values.tolist() for values in find_tokens(buf)]
+    [[0, 5, 10, 13], [3, 9, 12, 14]]
+    """
+    space = buf <= _SPACE
+    edges = space[:-1] != space[1:]
+    starts = np.flatnonzero(edges & space[:-1]) + 1
+    ends = np.flatnonzero(edges & space[1:]) + 1
+    if len(buf) > 0 and not space[0]:
+        starts = np.concatenate(([0], starts))
+    if len(buf) > 0 and not space[-1]:
+        ends = np.concatenate((ends, [len(buf)]))
+    return starts, ends
+
+
+def find_runs(buf):
+    """
+    returns ranges of consecutive lines, offsets of lines are given for a
+    range of data lines and None for other lines, e.g. headers
+
+    >>> buf = np.frombuffer(b'START\\n1 2\\n3 4\\n\\n5 6', dtype=np.uint8)
+    >>> [(begin, end, None if lines is None else lines.tolist())
+    ...  for begin, end, lines in find_runs(buf)]
+    [(0, 6, None), (6, 14, [6, 10]), (14, 15, None), (15, 18, [15])]
+    """
+    if len(buf) == 0:
+        return []
+    lines = np.flatnonzero(buf == _NEWLINE) + 1
+    lines = np.concatenate(([0], lines[lines < len(buf)]))
+    is_data = (buf[lines] - np.uint8(_ZERO)) <= 9
+    heads = np.flatnonzero(is_data[1:] != is_data[:-1]) + 1
+    heads = np.concatenate(([0], heads, [len(lines)]))
+    runs = []
+    for i, j in zip(heads[:-1], heads[1:]):
+        end = lines[j] if j < len(lines) else len(buf)
+        runs.append((
+            int(lines[i]), int(end), lines[i:j] if is_data[i] else None))
+    return runs
+
+
+def find_fields(tokens, lines, begin, end, size):
+    """returns offsets of fields per line or None if a line is broken"""
+    starts, ends = tokens
+    i, j = np.searchsorted(starts, [begin, end])
+    if j - i != len(lines) * size:
+        return None
+    starts = starts[i:j].reshape(-1, size)
+    ends = ends[i:j].reshape(-1, size)
+    # a line of more fields shifts heads of following lines
+    if not np.array_equal(starts[:, 0], lines):
+        return None
+    return starts, ends
+
+
+def to_bytes(buf, starts, ends):
+    """
+    >>> buf = np.frombuffer(b'WS R 8,160', dtype=np.uint8)
+    >>> to_bytes(buf, np.array([0, 3, 5]), np.array([2, 4, 10])).tolist()
+    [b'WS', b'R', b'8,160']
+    """
+    if len(starts) == 0:
+        return np.array([], dtype='S1')
+    lengths = ends - starts
+    width = int(lengths.max())
+    chars = buf.take(starts[:, None] + np.arange(width), mode='clip')
+    # trailing null bytes are padding of numpy bytes
+    chars[np.arange(width) >= lengths[:, None]] = 0
+    return chars.view('S%d' % width).ravel()
+
+
+def _to_digits(buf, starts, ends):
+    """returns bytes of fields aligned right minus zero, padded by zeros"""
+    lengths = ends - starts
+    width = int(lengths.max())
+    digits = buf.take(
+        (ends - width)[:, None] + np.arange(width), mode='clip')
+    digits -= np.uint8(_ZERO)
+    digits *= np.arange(width) >= (width - lengths)[:, None]
+    return digits
+
+
+def _to_integers(digits):
+    """returns digits of rows as float64, or None unless they are exact"""
+    if digits.shape[1] > _MAX_DIGITS or (digits > 9).any():
+        return None
+    weights = 10.0 ** np.arange(digits.shape[1] - 1, -1, -1)
+    return digits.astype(np.float64) @ weights
+
+
+def to_int(buf, starts, ends):
+    """
+    >>> buf = np.frombuffer(b'2811 0 -1', dtype=np.uint8)
+    >>> to_int(buf, np.array([0, 5]), np.array([4, 6])).tolist()
+    [2811, 0]
+    >>> to_int(buf, np.array([7]), np.array([9])).tolist()
+    [-1]
+    """
+    if len(starts) == 0:
+        return np.array([], dtype=np.int64)
+    values = _to_integers(_to_digits(buf, starts, ends))
+    if values is None:
+        return to_bytes(buf, starts, ends).astype(np.int64)
+    return values.astype(np.int64)
+
+
+def to_float(buf, starts, ends):
+    """
+    digits of fields are summed as an integer and divided by a power of ten
+    once, so that a value is rounded exactly as float() does, fields need
+    the same number of decimals which iosnoop prints, others are parsed
+
+    >>> buf = np.frombuffer(b'14284781.198346 0.62 13.61 1e3', np.uint8)
+    >>> to_float(buf, np.array([0, 21]), np.array([15, 26])).tolist()
+    [14284781.198346, 13.61]
+    >>> to_float(buf, np.array([16, 27]), np.array([20, 30])).tolist()
+    [0.62, 1000.0]
+    """
+    if len(starts) == 0:
+        return np.array([], dtype=np.float64)
+    digits = _to_digits(buf, starts, ends)
+    dots = np.flatnonzero((digits == _DOT).any(axis=0))
+    if len(dots) == 1 and (digits[:, dots[0]] == _DOT).all():
+        dot = dots[0]
+        decimals = digits.shape[1] - 1 - dot
+        values = _to_integers(np.delete(digits, dot, axis=1))
+        if values is not None:
+            return values / 10.0 ** decimals
+    return to_bytes(buf, starts, ends).astype(np.float64)
+
+
+def to_categorical(buf, starts, ends, dictionary):
+    """
+    encodes fields by the dictionary, distinct values are decoded once
+
+    >>> from iosnoop.encoding import Dictionary
+    >>> buf = np.frombuffer(b'W R W', dtype=np.uint8)
+    >>> values = to_categorical(
+    ...     buf, np.array([0, 2, 4]), np.array([1, 3, 5]), Dictionary())
+    >>> values.codes.tolist(), list(values.categories)
+    ([0, 1, 0], ['W', 'R'])
+    """
+    values = to_bytes(buf, starts, ends)
+    uniques, index, inverse = np.unique(
+        values, return_index=True, return_inverse=True)
+    # keeps the order of appearance as the dictionary does for strings
+    order = np.argsort(index)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    tokens = [value.decode() for value in uniques[order].tolist()]
+    return dictionary.encode_distinct(tokens, rank[inverse])
+
+
+def to_object(buf, starts, ends):
+    values = to_bytes(buf, starts, ends).tolist()
+    return np.array([value.decode() for value in values], dtype=object)
+
+
+def to_column(buf, starts, ends, dtype):
+    if dtype == np.int64:
+        return to_int(buf, starts, ends)
+    if dtype == np.float64:
+        return to_float(buf, starts, ends)
+    return to_object(buf, starts, ends)
@@ -0,0 +1,217 @@
+"""
+finds the slowest i/o of a trace in one pass over rows, fixed-size heaps
+keep the rows of the highest latency overall and per group, so that memory
+does not grow with the length of the trace
+"""
+import argparse
+import csv
+import heapq
+import json
+from collections import deque
+from datetime import datetime
+from itertools import count
+
+from .consts import DEVICE_ID, IO_LATENCY, START_TIME_STAMP
+from .consts import START_TIME_STAMP_DIFF
+from .filters import FilterPlan
+from .profiling import get_data_size, get_profiler
+from .sources import make_parser
+from .stats import STATS_FORMAT_JSON, open_output
+
+GROUP = 'GROUP'
+RANK = 'RANK'
+NEIGHBOR = 'NEIGHBOR'
+WINDOW = 'WINDOW'
+
+GROUP_ALL = 'all'
+
+# rows kept per device to find i/o in flight before a slow one completed
+MAX_HISTORY = 4096
+
+
+def _get_end(row):
+    return row[START_TIME_STAMP] + row[IO_LATENCY] / 1000
+
+
+def _overlaps(row, start, end):
+    return row[START_TIME_STAMP] <= end and start <= _get_end(row)
+
+
+class _Entry:
+
+    __slots__ = ('row', 'refs', 'neighbors')
+
+    def __init__(self, row):
+        self.row = row
+        # number of heaps which keep the row
+        self.refs = 0
+        self.neighbors = []
+
+
+class Slowest:
+    """
+    keeps top rows of LATms overall and per interval of STARTs_DIFF and
+    group, neighbors are rows of the same device which were in flight while
+    a kept row was, they are searched in rows read before it and watched
+    in rows read after it until one latency of it has passed
+
+    >>> slowest = Slowest(top=2, group_by=['DEV'], neighbors=2)
+    >>> rows = [
+    ...     (0.000, 1.0, '8,0'), (0.001, 30.0, '8,0'), (0.010, 2.0, '8,0'),
+    ...     (0.020, 9.0, '8,16'), (0.050, 20.0, '8,0'), (0.500, 3.0, '8,0'),
+    ... ]
+    >>> for start, latency, device in rows:
+    ...     slowest.add({'STARTs': start, 'STARTs_DIFF': start,
+    ...                  'LATms': latency, 'DEV': device})
+    >>> [(row['GROUP'], row['RANK'], row['NEIGHBOR'], row['LATms'])
+    ...  for row in slowest.rows(['LATms'])]
+    ... # doctest: +NORMALIZE_WHITESPACE
+    [('all', 1, 0, 30.0), ('all', 1, 1, 1.0), ('all', 1, 2, 2.0),
+     ('all', 2, 0, 20.0),
+     ('DEV=8,0', 1, 0, 30.0), ('DEV=8,0', 1, 1, 1.0), ('DEV=8,0', 1, 2, 2.0),
+     ('DEV=8,0', 2, 0, 20.0),
+     ('DEV=8,16', 1, 0, 9.0)]
+    """
+
+    def __init__(self, top, group_by=None, interval=None, neighbors=0):
+        self.top = top
+        self.group_by = group_by or []
+        self.interval = interval
+        self.neighbors = neighbors
+        self.heap = []
+        self.heaps = {}
+        # keeps the order of arrival for rows of the same latency
+        self.sequence = count()
+        self.history = {}
+        self.watches = {}
+
+    @property
+    def columns(self):
+        columns = [GROUP, RANK]
+        if self.neighbors > 0:
+            columns.append(NEIGHBOR)
+        return columns
+
+    @property
+    def is_grouped(self):
+        return len(self.group_by) > 0 or self.interval is not None
+
+    def _get_key(self, row):
+        key = tuple(row[name] for name in self.group_by)
+        if self.interval is not None:
+            window = int(row[START_TIME_STAMP_DIFF] // self.interval)
+            key = (window,) + key
+        return key
+
+    def _push(self, heap, item):
+        """returns whether the item is kept in the heap"""
+        if len(heap) < self.top:
+            heapq.heappush(heap, item)
+        elif item[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, item)[2].refs -= 1
+        else:
+            return False
+        item[2].refs += 1
+        return True
+
+    def _watch(self, device, row):
+        """adds the row to neighbors of kept rows watching the device"""
+        watches = self.watches.get(device)
+        if not watches:
+            return
+        now = _get_end(row)
+        kept = []
+        for entry in watches:
+            start = entry.row[START_TIME_STAMP]
+            end = _get_end(entry.row)
+            if entry.refs == 0 or now > end + (end - start):
+                continue  # dropped from heaps, or no more i/o in flight
+            if len(entry.neighbors) < self.neighbors and \
+                    _overlaps(row, start, end):
+                entry.neighbors.append(row)
+            kept.append(entry)
+        self.watches[device] = kept
+
+    def _find_neighbors(self, device, entry):
+        start = entry.row[START_TIME_STAMP]
+        end = _get_end(entry.row)
+        # rows are read in order of completion, older rows end earlier
+        for row in reversed(self.history.get(device, ())):
+            if len(entry.neighbors) >= self.neighbors or \
+                    _get_end(row) < start:
+                break
+            if _overlaps(row, start, end):
+                entry.neighbors.append(row)
+        self.watches.setdefault(device, []).append(entry)
+
+    def add(self, row):
+        device = row.get(DEVICE_ID)
+        if self.neighbors > 0:
+            self._watch(device, row)
+
+        entry = _Entry(row)
+        item = (row[IO_LATENCY], -next(self.sequence), entry)
+        kept = self._push(self.heap, item)
+        if self.is_grouped:
+            heap = self.heaps.setdefault(self._get_key(row), [])
+            kept = self._push(heap, item) or kept
+
+        if self.neighbors > 0:
+            if kept:
+                self._find_neighbors(device, entry)
+            history = self.history.get(device)
+            if history is None:
+                history = self.history[device] = deque(maxlen=MAX_HISTORY)
+            history.append(row)
+
+    def _get_group(self, key):
+        names = self.group_by
+        if self.interval is not None:
+            names = [WINDOW] + names
+            key = (key[0] * self.interval,) + key[1:]
+        return ' '.join('%s=%s' % i for i in zip(names, key))
+
+    def _rows(self, group, heap, columns):
+        for rank, (_, _, entry) in enumerate(sorted(heap, reverse=True), 1):
+            rows = [entry.row] + sorted(
+                entry.neighbors, key=lambda row: row[START_TIME_STAMP])
+            for neighbor, row in enumerate(rows):
+                output = {GROUP: group, RANK: rank}
+                if self.neighbors > 0:
+                    output[NEIGHBOR] = neighbor
+                for name in columns:
+                    value = row[name]
+                    if isinstance(value, datetime):
+                        value = value.isoformat()
+                    output[name] = value
+                yield output
+
+    def rows(self, columns):
+        """yields kept rows of columns with group and rank, overall first"""
+        yield from self._rows(GROUP_ALL, self.heap, columns)
+        for key in sorted(self.heaps):
+            yield from self._rows(self._get_group(key), self.heaps[key],
+                                  columns)
+
+
+def write_slowest(args):
+    # all columns are needed to rank rows, --columns is applied on output
+    parse_args = argparse.Namespace(**vars(args))
+    parse_args.columns = None
+    parser = make_parser(parse_args)
+    slowest = Slowest(args.top, args.group_by, args.interval, args.neighbors)
+    profiler = get_profiler()
+    rows = profiler.iterate('parse', parser.parse(), rows=lambda row: 1)
+    for row in rows:
+        slowest.add(row)
+    profiler.add('parse', size=get_data_size(args.data_files))
+
+    columns = FilterPlan(args).project(parser.columns)
+    with open_output(args) as f, profiler.stage('write'):
+        if args.format == STATS_FORMAT_JSON:
+            json.dump(list(slowest.rows(columns)), f, indent=2)
+            f.write('\n')
+        else:
+            writer = csv.DictWriter(f, fieldnames=slowest.columns + columns)
+            writer.writeheader()
+            writer.writerows(slowest.rows(columns))
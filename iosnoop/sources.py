@@ -0,0 +1,254 @@
+import copy
+import glob
+import heapq
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from .consts import SOURCE, START_TIME_STAMP, START_TIME_STAMP_DIFF
+from .consts import START_LOCAL_TIME
+from .parser import Parser, concat_frames
+from .reader import STDIN
+from .records import BATCH_ROWS, iter_batches
+from .utils import get_logger
+
+log = get_logger()
+
+# seconds of --reorder for each file of merged files by default, rows of a
+# file are put in order of STARTs before they are merged
+MERGE_REORDER = 1.0
+
+
+def expand_data(patterns):
+    """
+    expands glob patterns of --data into paths of iosnoop output files
+
+    >>> expand_data(['-'])
+    ['-']
+    >>> expand_data(['no/such/*.log'])
+    Traceback (most recent call last):
+    ...
+    ValueError: no such file: no/such/*.log
+    """
+    paths = []
+    for pattern in patterns:
+        if pattern == STDIN or os.path.exists(pattern):
+            paths.append(pattern)
+            continue
+        matched = sorted(glob.glob(pattern))
+        if len(matched) == 0:
+            raise ValueError('no such file: %s' % pattern)
+        paths.extend(matched)
+    return paths
+
+
+def make_source_args(args, path, basedate, jobs):
+    source_args = copy.copy(args)
+    source_args.data = path
+    source_args.basedate = basedate
+    source_args.jobs = jobs
+    if args.reorder is None:
+        source_args.reorder = MERGE_REORDER
+    # --since/--until are applied on the merged timeline
+    source_args.since = None
+    source_args.until = None
+    return source_args
+
+
+def make_parser(args):
+    if len(args.data_files) > 1:
+        return MultiParser(args)
+    return Parser(args)
+
+
+def parse_source(args):
+    parser = Parser(args)
+    return parser.parse_frame(), parser.first_row
+
+
+class MultiParser:
+    """
+    merges rows of multiple iosnoop output files in order of STARTs
+
+    STARTs of files are compared as is, they share the monotonic clock of
+    a host, unless --basedate is given per file to align clocks of hosts,
+    then STARTs_DIFF and local time are calculated on the merged timeline
+    """
+
+    def __init__(self, args):
+        self.args = args
+        jobs = 1 if args.jobs > 1 else args.jobs
+        self.parsers = [
+            Parser(make_source_args(args, path, basedate, jobs))
+            for path, basedate in zip(args.data_files, args.basedates)
+        ]
+        self.offsets = None
+        self.first_start = None
+        self.unique_values = None
+
+    @property
+    def columns(self):
+        return self._add_source(self.parsers[0].columns)
+
+    @property
+    def output_columns(self):
+        return self._add_source(self.parsers[0].output_columns)
+
+    def _add_source(self, columns):
+        if self.args.source_column:
+            return columns + [SOURCE]
+        return columns
+
+    def set_offsets(self, first_rows):
+        """calculates offsets to convert STARTs of each file to merged one"""
+        self.offsets = []
+        for parser, first_row in zip(self.parsers, first_rows):
+            offset = 0.0
+            basedate = parser.args.basedate
+            if basedate is not None and first_row is not None:
+                seconds = (basedate - self.args.basedate).total_seconds()
+                offset = seconds - first_row[START_TIME_STAMP]
+            self.offsets.append(offset)
+        starts = [
+            first_row[START_TIME_STAMP] + offset
+            for first_row, offset in zip(first_rows, self.offsets)
+            if first_row is not None
+        ]
+        self.first_start = min(starts) if len(starts) > 0 else 0.0
+
+    def get_diff(self, i, starts):
+        return starts + self.offsets[i] - self.first_start
+
+    def in_window(self, diff):
+        selected = True
+        if self.args.since is not None:
+            selected = selected & (self.args.since <= diff)
+        if self.args.until is not None:
+            selected = selected & (diff <= self.args.until)
+        return selected
+
+    def align_frame(self, i, df):
+        diff = self.get_diff(i, df[START_TIME_STAMP].values)
+        columns = {name: df[name].values for name in df.columns}
+        if START_TIME_STAMP_DIFF in columns:
+            columns[START_TIME_STAMP_DIFF] = diff
+        if START_LOCAL_TIME in columns:
+            delta = np.rint(diff * 1e6).astype('timedelta64[us]')
+            columns[START_LOCAL_TIME] = np.datetime64(
+                self.args.basedate, 'us') + delta
+        if self.args.source_column:
+            columns[SOURCE] = pd.Categorical.from_codes(
+                np.zeros(len(df), dtype=np.int8),
+                categories=[self.parsers[i].args.data])
+        df = pd.DataFrame(
+            columns, columns=self._add_source(list(df.columns)), copy=False)
+
+        selected = self.in_window(diff)
+        if selected is not True:
+            return df[selected], diff[selected]
+        return df, diff
+
+    def align_row(self, i, row):
+        diff = self.get_diff(i, row[START_TIME_STAMP])
+        if START_TIME_STAMP_DIFF in row:
+            row[START_TIME_STAMP_DIFF] = diff
+        if START_LOCAL_TIME in row:
+            row[START_LOCAL_TIME] = \
+                self.args.basedate + timedelta(seconds=diff)
+        if self.args.source_column:
+            row[SOURCE] = self.parsers[i].args.data
+        return diff, row
+
+    def _read_sources(self):
+        if self.args.jobs > 1:
+            workers = min(self.args.jobs, len(self.parsers))
+            log.debug(
+                'parse %d files with %d jobs', len(self.parsers), workers)
+            with ProcessPoolExecutor(workers) as executor:
+                results = list(executor.map(
+                    parse_source, [parser.args for parser in self.parsers]))
+            for parser, (_, first_row) in zip(self.parsers, results):
+                parser.first_row = first_row
+            return [iter([df]) for df, _ in results]
+        return [parser.parse_chunks() for parser in self.parsers]
+
+    def parse_chunks(self):
+        """
+        k-way merge of chunks, rows up to the smallest maximum of pending
+        chunks are emitted, since no file has rows before it afterwards
+        """
+        sources = self._read_sources()
+        frames = [_next_frame(chunks) for chunks in sources]
+        self.set_offsets([parser.first_row for parser in self.parsers])
+
+        def pull(i, df=None):
+            while True:
+                if df is None:
+                    df = _next_frame(sources[i])
+                    if df is None:
+                        return None
+                df, diff = self.align_frame(i, df)
+                if len(df) > 0:
+                    return df, diff
+                df = None
+
+        pending = [pull(i, df) for i, df in enumerate(frames)]
+        while True:
+            live = [i for i, item in enumerate(pending) if item is not None]
+            if len(live) == 0:
+                break
+            bound = min(pending[i][1].max() for i in live)
+            frames, keys = [], []
+            for i in live:
+                df, diff = pending[i]
+                emitted = diff <= bound
+                frames.append(df[emitted])
+                keys.append(diff[emitted])
+                if emitted.all():
+                    pending[i] = pull(i)
+                else:
+                    pending[i] = (df[~emitted], diff[~emitted])
+
+            df = concat_frames(frames)
+            order = np.argsort(np.concatenate(keys), kind='stable')
+            df = df.take(order).reset_index(drop=True)
+            if self.unique_values is not None:
+                self.unique_values.add(df)
+            yield df
+
+    def parse_frame(self):
+        return concat_frames(self.parse_chunks())
+
+    def parse_batches(self, size=BATCH_ROWS):
+        return iter_batches(self.parse_chunks(), size)
+
+    def _aligned_rows(self, i, rows):
+        for n, row in enumerate(rows):
+            diff, row = self.align_row(i, row)
+            if self.in_window(diff):
+                yield diff, i, n, row
+
+    def parse(self):
+        sources = []
+        for parser in self.parsers:
+            rows = parser.parse()
+            first = next(rows, None)
+            sources.append([] if first is None else chain([first], rows))
+        self.set_offsets([parser.first_row for parser in self.parsers])
+
+        aligned = [
+            self._aligned_rows(i, rows) for i, rows in enumerate(sources)
+        ]
+        for _, _, _, row in heapq.merge(*aligned):
+            yield row
+
+
+def _next_frame(chunks):
+    for df in chunks:
+        if len(df) > 0:
+            return df
+    return None
@@ -0,0 +1,255 @@
+import csv
+import json
+import sys
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from .consts import IO_LATENCY, IO_SIZE, START_LOCAL_TIME
+from .consts import START_TIME_STAMP_DIFF
+from .histogram import LogAxis, QuantileSketch
+from .profiling import get_data_size, get_profiler
+from .sources import make_parser
+from .reader import STDIN
+from .utils import get_logger, make_output_file
+
+log = get_logger()
+
+STATS_FORMAT_CSV = 'csv'
+STATS_FORMAT_JSON = 'json'
+STATS_FORMATS = [
+    STATS_FORMAT_CSV,
+    STATS_FORMAT_JSON,
+]
+
+QUANTILES = [
+    ('p50', 0.5),
+    ('p99', 0.99),
+    ('p99.9', 0.999),
+]
+
+IOS = 'IOS'
+IOPS = 'IOPS'
+THROUGHPUT = 'BYTESps'
+MAX_LATENCY = 'max'
+
+_BUCKET = 'bucket'
+
+
+class _Entry:
+
+    def __init__(self, axis):
+        self.bytes = 0
+        self.sketch = QuantileSketch(axis)
+
+    def merge(self, other):
+        self.bytes += other.bytes
+        self.sketch.merge(other.sketch)
+
+
+class Stats:
+    """
+    aggregates IOPS, throughput and latency quantiles per interval and group
+    in one pass, stats of chunks or traces can be merged
+
+    rows are read in order of completion, an interval is closed once
+    STARTs_DIFF has moved past it by more than the maximum latency seen or
+    window seconds, closed_rows() yields and drops them so that memory does
+    not grow with the length of the trace, a row which starts in a closed
+    interval later is dropped and counted in late
+
+    >>> df = pd.DataFrame({
+    ...     'STARTs_DIFF': [0.1, 0.5, 1.2, 1.4],
+    ...     'DEV': pd.Categorical(['8,0', '8,0', '8,0', '8,16']),
+    ...     'BYTES': [4096, 4096, 8192, 4096],
+    ...     'LATms': [1.0, 3.0, 2.0, 10.0],
+    ... })
+    >>> stats = Stats(interval=1.0, group_by=['DEV'], error=0.01)
+    >>> stats.add(df.iloc[:2])
+    >>> stats.add(df.iloc[2:])
+    >>> [row['STARTs_DIFF'] for row in stats.closed_rows()], len(stats.entries)
+    ([0.0], 2)
+    >>> stats.add(df.iloc[:1])
+    >>> stats.late
+    1
+    >>> for row in stats.rows():
+    ...     print(row['STARTs_DIFF'], row['DEV'], row['IOPS'],
+    ...           round(row['p50'], 2), row['max'])
+    1.0 8,0 1.0 2.0 2.0
+    1.0 8,16 1.0 10.0 10.0
+    """
+
+    def __init__(self, interval, group_by, error, basedate=None, window=None):
+        self.interval = interval
+        self.window = window or 0.0
+        self.group_by = list(group_by)
+        self.axis = LogAxis(error)
+        self.basedate = basedate
+        self.entries = {}
+        self.latest = None
+        self.max_latency = 0.0
+        # intervals before it have been emitted by closed_rows()
+        self.closed = None
+        self.late = 0
+
+    @property
+    def columns(self):
+        columns = [START_TIME_STAMP_DIFF]
+        if self.basedate is not None:
+            columns.append(START_LOCAL_TIME)
+        columns.extend(self.group_by)
+        columns.extend([IOS, IOPS, IO_SIZE, THROUGHPUT])
+        columns.extend(name for name, _ in QUANTILES)
+        columns.append(MAX_LATENCY)
+        return columns
+
+    def _get_entry(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = _Entry(self.axis)
+            self.entries[key] = entry
+        return entry
+
+    def add(self, df):
+        if len(df) == 0:
+            return
+        with get_profiler().stage('aggregate') as stage:
+            self._add(df)
+            stage.add(rows=len(df))
+
+    def _add(self, df):
+        latency = np.asarray(df[IO_LATENCY].values, dtype=np.float64)
+        data = {
+            START_TIME_STAMP_DIFF: np.floor(
+                df[START_TIME_STAMP_DIFF].values / self.interval
+            ).astype(np.int64),
+            IO_SIZE: df[IO_SIZE].values,
+            IO_LATENCY: latency,
+            _BUCKET: self.axis.index(latency),
+        }
+        for name in self.group_by:
+            data[name] = df[name].values
+        frame = pd.DataFrame(data, copy=False)
+        frame = frame[frame[_BUCKET] >= 0]
+        if len(frame) == 0:
+            return
+
+        diff = df[START_TIME_STAMP_DIFF].values
+        if self.latest is None or self.latest < diff.max():
+            self.latest = float(diff.max())
+        self.max_latency = max(self.max_latency, float(latency.max()))
+        if self.closed is not None:
+            # the interval of a late row has been written
+            late = frame[START_TIME_STAMP_DIFF].values < self.closed
+            if late.any():
+                self.late += int(late.sum())
+                frame = frame[~late]
+                if len(frame) == 0:
+                    return
+
+        keys = [START_TIME_STAMP_DIFF] + self.group_by
+        grouped = frame.groupby(keys, observed=True, sort=True)
+        aggregated = grouped.agg({IO_SIZE: 'sum', IO_LATENCY: 'max'})
+
+        # counts of (group, bucket) pairs by a single unique
+        buckets = frame[_BUCKET].values
+        size = int(buckets.max()) + 1
+        flat = grouped.ngroup().values.astype(np.int64) * size + buckets
+        pairs, counts = np.unique(flat, return_counts=True)
+        groups, buckets = np.divmod(pairs, size)
+        bounds = np.searchsorted(groups, np.arange(len(aggregated) + 1))
+
+        sizes = aggregated[IO_SIZE].values
+        maximums = aggregated[IO_LATENCY].values
+        for i, key in enumerate(aggregated.index):
+            if not isinstance(key, tuple):
+                key = (key,)
+            entry = self._get_entry(key)
+            entry.bytes += int(sizes[i])
+            start, end = bounds[i], bounds[i + 1]
+            entry.sketch.add_counts(
+                buckets[start:end], counts[start:end], float(maximums[i]))
+
+    def merge(self, other):
+        for key, entry in other.entries.items():
+            self._get_entry(key).merge(entry)
+
+    def _row(self, key, entry):
+        sketch = entry.sketch
+        start = key[0] * self.interval
+        row = {START_TIME_STAMP_DIFF: start}
+        if self.basedate is not None:
+            local_time = self.basedate + timedelta(seconds=start)
+            row[START_LOCAL_TIME] = local_time.isoformat()
+        row.update(zip(self.group_by, key[1:]))
+        row[IOS] = sketch.count
+        row[IOPS] = sketch.count / self.interval
+        row[IO_SIZE] = entry.bytes
+        row[THROUGHPUT] = entry.bytes / self.interval
+        names = [name for name, _ in QUANTILES]
+        values = sketch.quantiles([q for _, q in QUANTILES])
+        row.update(zip(names, values))
+        row[MAX_LATENCY] = sketch.maximum
+        return row
+
+    def _pop_rows(self, keys):
+        for key in sorted(keys):
+            yield self._row(key, self.entries.pop(key))
+
+    def closed_rows(self):
+        """yields and drops intervals which no later row can fall into"""
+        if self.latest is None:
+            return
+        # LATms is in milliseconds and STARTs_DIFF in seconds
+        bound = self.latest - max(self.max_latency / 1000, self.window)
+        closed = int(np.floor(bound / self.interval))
+        if self.closed is None or self.closed < closed:
+            self.closed = closed
+        yield from self._pop_rows(
+            [key for key in self.entries if key[0] < self.closed])
+
+    def rows(self):
+        yield from self._pop_rows(list(self.entries))
+
+
+def open_output(args):
+    output = args.output
+    if output is None:
+        output = make_output_file(args.data, args.format)
+    if output == STDIN:
+        return open(sys.stdout.fileno(), 'w', closefd=False)
+    return open(output, 'w')
+
+
+def write_stats(args):
+    stats = Stats(args.interval, args.group_by, args.error, args.basedate,
+                  args.reorder)
+    profiler = get_profiler()
+    parser = make_parser(args)
+    with open_output(args) as f:
+        if args.format == STATS_FORMAT_JSON:
+            rows = []
+            write = rows.extend
+        else:
+            writer = csv.DictWriter(f, fieldnames=stats.columns)
+            writer.writeheader()
+            write = writer.writerows
+
+        chunks = profiler.iterate('parse', parser.parse_chunks(), rows=len)
+        for df in chunks:
+            stats.add(df)
+            with profiler.stage('write'):
+                write(stats.closed_rows())
+        profiler.add('parse', size=get_data_size(args.data_files))
+
+        with profiler.stage('write'):
+            write(stats.rows())
+            if args.format == STATS_FORMAT_JSON:
+                json.dump(rows, f, indent=2)
+                f.write('\n')
+    if stats.late > 0:
+        log.warning(
+            '%d rows started in intervals which had been written, they are '
+            'dropped, a larger --reorder keeps intervals open longer',
+            stats.late)
@@ -4,6 +4,12 @@ from os.path import basename
 
 from .consts import PACKAGE_NAME
 
+_STDIN_OUTPUT_NAME = 'iosnoop'
+
+
+class CommandError(RuntimeError):
+    """error which the command line reports without traceback"""
+
 
 def get_logger():
     return logging.getLogger(PACKAGE_NAME)
@@ -28,7 +34,13 @@ def make_output_file(path, ext):
     'sample.png'
     >>> make_output_file('sample.data', 'png')
     'sample.png'
+    >>> make_output_file('path/to/sample.log.gz', 'csv')
+    'sample.csv'
+    >>> make_output_file('-', 'png')
+    'iosnoop.png'
     """
+    if path == '-':
+        return '%s.%s' % (_STDIN_OUTPUT_NAME, ext)
     filename = basename(path)
     names = filename.split('.')
     if len(names) > 0:
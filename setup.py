@@ -42,6 +42,10 @@ setup(
     packages=['iosnoop'],
     include_package_data=True,
     install_requires=['numpy', 'matplotlib', 'seaborn', 'pandas'],
+    extras_require={
+        'arrow': ['pyarrow'],
+        'zstd': ['zstandard'],
+    },
     tests_require=['tox', 'pytest', 'pytest-pep8', 'pytest-flakes'],
     entry_points = {
         'console_scripts': [